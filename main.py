@@ -5,24 +5,774 @@ import paramiko
 import argparse
 import sys
 import tempfile
+import hashlib
+import json
+import stat
+import socket
+import io
+import threading
+import queue
+import zlib
+import multiprocessing
+import asyncio
+import math
+import random
+import statistics
+import shutil
+import tarfile
+import csv
+import platform
+import uuid
+import bisect
+import heapq
+import contextlib
+import itertools
+import re
+import struct
+import mmap
+from datetime import datetime, timezone
+from collections import deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 
-def zip_file(input_file, output_zip):
-    with zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(input_file, arcname=os.path.basename(input_file))
-
-def zip_folder(input_folder, output_zip):
-    """Zip a folder recursively."""
-    with zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(input_folder):
-            for file in files:
-                abs_path = os.path.join(root, file)
-                rel_path = os.path.relpath(abs_path, input_folder)
-                zipf.write(abs_path, arcname=rel_path)
-
-def sftp_upload(sftp, local_path, remote_path):
-    """Upload a file with progress reporting and timeout handling."""
+try:
+    import asyncssh
+except ImportError:  # optional: the async backend falls back to paramiko
+    asyncssh = None
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for the tar+zstd codec
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # optional: only needed for the tar+lz4 codec
+    lz4 = None
+
+# Already-compressed formats are stored as-is; deflating them only burns CPU
+STORED_EXTENSIONS = {
+    '.7z', '.avi', '.bz2', '.cab', '.docx', '.flac', '.gif', '.gz', '.jar',
+    '.jpeg', '.jpg', '.lz4', '.mkv', '.mov', '.mp3', '.mp4', '.msi', '.nupkg',
+    '.ogg', '.png', '.pptx', '.rar', '.tgz', '.webm', '.webp', '.whl', '.xlsx',
+    '.xz', '.zip', '.zst'
+}
+
+# Local cache directory for state that must survive between runs
+STATE_DIR = os.path.join(os.path.expanduser('~'), '.upload_speed_test')
+
+# Resumable uploads confirm and checkpoint progress every this many bytes
+RESUME_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Delta transfers keep each remote file's block signature next to it ...
+DELTA_SIGNATURE_SUFFIX = '.delta-sig'
+# ... in blocks of about sqrt(file size), within these bounds
+DELTA_MIN_BLOCK = 4 * 1024
+DELTA_MAX_BLOCK = 1024 * 1024
+# Files whose delta would be more than this share literal data go whole
+DELTA_MAX_LITERAL_RATIO = 0.5
+# Past a block length of unmatched offsets, only one block length in this
+# many is scanned with the rolling checksum
+DELTA_SCAN_STRIDE = 16
+# Literal data is written to the delta in pieces of at most this size
+DELTA_LITERAL_CHUNK = 1024 * 1024
+# Delta file header, followed by the block size, the new file size and its
+# SHA-256
+DELTA_MAGIC = b'UPDELTA2'
+
+# Byte-range size handed to each stream of a multi-stream upload
+MULTISTREAM_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Write request size used by the asyncio upload backend
+ASYNC_BLOCK_SIZE = 64 * 1024
+
+# Hybrid uploads batch files below this size into micro-archives ...
+HYBRID_SMALL_FILE_THRESHOLD = 256 * 1024
+# ... of at most this many bytes of input each
+HYBRID_BATCH_SIZE = 8 * 1024 * 1024
+
+# Large files are split into chunks of this size for parallel deflate
+COMPRESS_CHUNK_SIZE = 4 * 1024 * 1024
+
+# One archive codec: archive suffix, zipfile compression (None for a
+# compressed tar), (lowest, highest) level or None, and the EXTRACTORS
+# backends able to unpack it
+CodecInfo = namedtuple('CodecInfo', ['suffix', 'compression', 'levels',
+                                     'extractors'])
+
+CODECS = {
+    'stored': CodecInfo('.zip', zipfile.ZIP_STORED, None,
+                        ('expand-archive', 'dotnet', 'tar', '7z', 'unzip')),
+    'deflate': CodecInfo('.zip', zipfile.ZIP_DEFLATED, (1, 9),
+                         ('expand-archive', 'dotnet', 'tar', '7z', 'unzip')),
+    'bzip2': CodecInfo('.zip', zipfile.ZIP_BZIP2, (1, 9), ('7z', 'unzip')),
+    'lzma': CodecInfo('.zip', zipfile.ZIP_LZMA, None, ('7z',)),
+    'zstd': CodecInfo('.tar.zst', None, (1, 22), ('tar',)),
+    'lz4': CodecInfo('.tar.lz4', None, (0, 16), ('tar',))
+}
+
+# Codecs and levels the auto mode predicts the total time of
+CODEC_CANDIDATES = ('stored', 'deflate:1', 'deflate:6', 'deflate:9',
+                    'bzip2:9', 'lzma', 'zstd:3', 'zstd:19', 'lz4')
+
+# Codec auto-selection compresses a sample of about this many bytes ...
+CODEC_SAMPLE_SIZE = 8 * 1024 * 1024
+# ... read from the start of randomly chosen files, at most this much each
+CODEC_SAMPLE_FILE_LIMIT = 1024 * 1024
+# Bytes of random data uploaded to estimate the link bandwidth
+BANDWIDTH_PROBE_SIZE = 4 * 1024 * 1024
+
+# A BandwidthLimiter lets this many bytes through before pacing starts
+BANDWIDTH_BURST = 1024 * 1024
+
+# Hosts a fan-out uploads to at the same time
+FANOUT_CONCURRENCY = 8
+
+# Upper bounds of the operation latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Instrumentation emits at most one throughput sample per this many seconds
+THROUGHPUT_SAMPLE_INTERVAL = 0.5
+
+# Synthetic dataset spec used for any key a --dataset spec leaves out
+DATASET_DEFAULTS = {
+    'files': 1000,
+    'size': 16 * 1024,
+    'dist': 'fixed',
+    'sigma': 1.0,
+    'large_size': 4 * 1024 * 1024,
+    'large_fraction': 0.05,
+    'depth': 2,
+    'fanout': 4,
+    'content': 'text',
+    'seed': 0
+}
+
+# One scanned local file; rel_path is '/'-separated and relative to the scan root
+FileEntry = namedtuple('FileEntry', ['path', 'rel_path', 'size', 'mtime'])
+
+def scan_tree(local_path):
+    """Scan a file or directory once and return a reusable inventory.
+
+    The inventory dict holds the root, files (FileEntry list), dirs
+    (relative '/' paths, parents before children), total_size and
+    scan_time. Every phase of a run consumes it instead of walking again;
+    os.scandir supplies type and size without a separate getsize per file.
+    """
+    start = time.time()
+    files = []
+    dirs = []
+    if os.path.isfile(local_path):
+        st = os.stat(local_path)
+        files.append(FileEntry(local_path, os.path.basename(local_path),
+                               st.st_size, st.st_mtime))
+    else:
+        pending = [(local_path, '')]
+        while pending:
+            abs_dir, rel_dir = pending.pop()
+            dirs.append(rel_dir)
+            subdirs = []
+            with os.scandir(abs_dir) as entries:
+                for entry in entries:
+                    rel_path = rel_dir + '/' + entry.name if rel_dir else entry.name
+                    # Like os.walk: descend into real dirs only, but count
+                    # symlinks to files as files
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append((entry.path, rel_path))
+                    elif entry.is_file():
+                        st = entry.stat()
+                        files.append(FileEntry(entry.path, rel_path,
+                                               st.st_size, st.st_mtime))
+            pending.extend(reversed(subdirs))
+    return {
+        'root': local_path,
+        'files': files,
+        'dirs': dirs,
+        'total_size': sum(entry.size for entry in files),
+        'scan_time': time.time() - start
+    }
+
+def member_compress_type(path, compression=zipfile.ZIP_DEFLATED):
+    """Return the zip compression method for a file based on its extension."""
+    if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return compression
+
+def parse_codec(text):
+    """Parse a codec spec such as 'deflate', 'deflate:1' or 'zstd:19'.
+
+    Returns (name, level), level being None for the codec's default.
+    Raises ValueError for unknown codecs and out-of-range levels.
+    """
+    name, _, level = text.partition(':')
+    if name not in CODECS:
+        raise ValueError(f"unknown codec '{name}' "
+                         f"(choose from {', '.join(CODECS)})")
+    if not level:
+        return name, None
+    levels = CODECS[name].levels
+    if levels is None:
+        raise ValueError(f"codec '{name}' has no levels")
+    level = int(level)
+    if not levels[0] <= level <= levels[1]:
+        raise ValueError(f"{name} level must be between {levels[0]} "
+                         f"and {levels[1]}")
+    return name, level
+
+def codec_available(codec):
+    """Return True if the codec's archives can be written locally."""
+    name, _ = parse_codec(codec)
+    if name == 'zstd':
+        return zstandard is not None
+    if name == 'lz4':
+        return lz4 is not None
+    return True
+
+def zip_file(input_file, output_zip, codec='deflate'):
+    name, level = parse_codec(codec)
+    compression = CODECS[name].compression
+    with zipfile.ZipFile(output_zip, 'w', compression,
+                         compresslevel=level) as zipf:
+        zipf.write(input_file, arcname=os.path.basename(input_file),
+                   compress_type=member_compress_type(input_file, compression))
+
+def zip_members(input_folder, files=None, inventory=None):
+    """Return the FileEntry list to archive for a folder or a subset of it.
+
+    files is an optional list of '/'-separated paths relative to the folder;
+    inventory is a scan_tree result to reuse instead of scanning again.
+    """
+    if inventory is None:
+        inventory = scan_tree(input_folder)
+    if files is None:
+        return inventory['files']
+    by_rel_path = {entry.rel_path: entry for entry in inventory['files']}
+    return [by_rel_path[rel_path] for rel_path in files]
+
+def zip_folder(input_folder, output_zip, workers=1, files=None, inventory=None,
+               codec='deflate'):
+    """Zip a folder recursively, or only the given relative files.
+
+    codec is one of the zip CODECS, optionally with a level. With
+    workers > 1 deflate members are compressed in a process pool; this
+    needs a seekable output, so streams are always zipped on a single core.
+    """
+    name, level = parse_codec(codec)
+    compression = CODECS[name].compression
+    members = zip_members(input_folder, files, inventory)
+    if (workers > 1 and name == 'deflate' and
+            isinstance(output_zip, (str, os.PathLike))):
+        zip_folder_parallel(members, output_zip, workers,
+                            zlib.Z_DEFAULT_COMPRESSION if level is None
+                            else level)
+        return
+    with zipfile.ZipFile(output_zip, 'w', compression,
+                         compresslevel=level) as zipf:
+        for entry in members:
+            zipf.write(entry.path, arcname=entry.rel_path,
+                       compress_type=member_compress_type(entry.path,
+                                                          compression))
+
+def tar_folder(local_path, output, codec, workers=1, files=None, inventory=None):
+    """Write a folder, a subset of it or one file as a zstd or lz4 compressed tar.
+
+    output is a path or a writable stream, which is left open. zstd
+    compresses with workers threads.
+    """
+    name, level = parse_codec(codec)
+    if os.path.isdir(local_path):
+        members = [(entry.path, entry.rel_path)
+                   for entry in zip_members(local_path, files, inventory)]
+    else:
+        members = [(local_path, os.path.basename(local_path))]
+    
+    owns_output = isinstance(output, (str, os.PathLike))
+    fileobj = open(output, 'wb') if owns_output else output
+    try:
+        if name == 'zstd':
+            compressor = zstandard.ZstdCompressor(
+                level=3 if level is None else level,
+                threads=workers if workers > 1 else 0)
+            stream = compressor.stream_writer(fileobj, closefd=False)
+        else:
+            stream = lz4.frame.LZ4FrameFile(
+                fileobj, 'wb', compression_level=level or 0)
+        # Stream mode never seeks, so any writable output will do
+        with stream, tarfile.open(fileobj=stream, mode='w|') as tar:
+            for path, arcname in members:
+                tar.add(path, arcname=arcname, recursive=False)
+    finally:
+        if owns_output:
+            fileobj.close()
+
+def write_archive(local_path, output, codec='deflate', workers=1, files=None,
+                  inventory=None):
+    """Archive a folder (or the given relative files) or one file with codec."""
+    name, _ = parse_codec(codec)
+    if not codec_available(codec):
+        raise ValueError(f"codec '{name}' needs the "
+                         f"{'zstandard' if name == 'zstd' else 'lz4'} package")
+    if CODECS[name].compression is None:
+        tar_folder(local_path, output, codec, workers, files, inventory)
+    elif os.path.isdir(local_path):
+        zip_folder(local_path, output, workers=workers, files=files,
+                   inventory=inventory, codec=codec)
+    else:
+        zip_file(local_path, output, codec)
+
+def _gf2_matrix_times(mat, vec):
+    total = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            total ^= mat[i]
+        vec >>= 1
+        i += 1
+    return total
+
+def _gf2_matrix_square(mat):
+    return [_gf2_matrix_times(mat, mat[n]) for n in range(32)]
+
+def crc32_combine(crc1, crc2, len2):
+    """Return the CRC-32 of two concatenated blocks (port of zlib's crc32_combine)."""
+    if len2 <= 0:
+        return crc1
+    # Operator for one zero bit, then squared up to one zero byte
+    odd = [0xedb88320] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+    while True:
+        even = _gf2_matrix_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_matrix_square(even)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+def _deflate_chunk(path, offset, length, last, level):
+    """Raw-deflate one chunk of a file; runs in a worker process.
+
+    The 32 KB preceding the chunk primes the compressor dictionary, and
+    non-final chunks end on a sync flush, so the chunks concatenate into a
+    single valid deflate stream (the pigz technique).
+    """
+    with open(path, 'rb') as f:
+        dict_start = max(0, offset - 32 * 1024)
+        f.seek(dict_start)
+        zdict = f.read(offset - dict_start)
+        data = f.read(length)
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    flush_mode = zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    compressed = compressor.compress(data) + compressor.flush(flush_mode)
+    return compressed, zlib.crc32(data), len(data)
+
+def _write_deflated_member(zipf, zinfo, chunks):
+    """Append a member from already raw-deflated (data, crc, length) chunks."""
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.flag_bits = 0
+    zinfo.CRC = 0
+    zinfo.compress_size = 0
+    zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    
+    fp = zipf.fp
+    fp.seek(zipf.start_dir)
+    zinfo.header_offset = fp.tell()
+    fp.write(zinfo.FileHeader(zip64))
+    
+    crc = 0
+    file_size = 0
+    compress_size = 0
+    for data, chunk_crc, length in chunks:
+        fp.write(data)
+        crc = crc32_combine(crc, chunk_crc, length)
+        file_size += length
+        compress_size += len(data)
+    zinfo.CRC = crc
+    zinfo.file_size = file_size
+    zinfo.compress_size = compress_size
+    if not zip64 and max(file_size, compress_size) > zipfile.ZIP64_LIMIT:
+        raise RuntimeError(f"{zinfo.filename} grew past the zip64 limit "
+                           "while it was being compressed")
+    
+    # Rewrite the local header now that sizes and CRC are known
+    end = fp.tell()
+    fp.seek(zinfo.header_offset)
+    fp.write(zinfo.FileHeader(zip64))
+    fp.seek(end)
+    
+    zipf.filelist.append(zinfo)
+    zipf.NameToInfo[zinfo.filename] = zinfo
+    zipf.start_dir = end
+    zipf._didModify = True
+
+def zip_folder_parallel(members, output_zip, workers,
+                        level=zlib.Z_DEFAULT_COMPRESSION,
+                        chunk_size=COMPRESS_CHUNK_SIZE):
+    """Zip FileEntry members, deflating chunks in a process pool and writing them in order."""
+    chunk_tasks = []
+    for abs_path, _, size, _ in members:
+        if member_compress_type(abs_path) == zipfile.ZIP_STORED:
+            continue
+        chunk_count = max(1, -(-size // chunk_size))
+        for i in range(chunk_count):
+            chunk_tasks.append((abs_path, i * chunk_size, chunk_size,
+                                i == chunk_count - 1))
+    
+    # Spawn rather than fork: forking a process with live paramiko threads
+    # can leave the children holding half-initialised transport state
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool, \
+            zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        # Only a bounded window of chunks is in flight, which caps memory use
+        futures = deque()
+        next_task = 0
+        
+        def fill_window():
+            nonlocal next_task
+            while next_task < len(chunk_tasks) and len(futures) < workers * 2:
+                futures.append(pool.submit(_deflate_chunk,
+                                           *chunk_tasks[next_task], level))
+                next_task += 1
+        
+        def member_chunks(size):
+            for _ in range(max(1, -(-size // chunk_size))):
+                chunk = futures.popleft().result()
+                fill_window()
+                yield chunk
+        
+        fill_window()
+        for abs_path, rel_path, size, _ in members:
+            if member_compress_type(abs_path) == zipfile.ZIP_STORED:
+                zipf.write(abs_path, arcname=rel_path,
+                           compress_type=zipfile.ZIP_STORED)
+                continue
+            zinfo = zipfile.ZipInfo.from_file(abs_path, arcname=rel_path)
+            _write_deflated_member(zipf, zinfo, member_chunks(size))
+
+# Instrumentation currently installed by enable_instrumentation, or None
+INSTRUMENTATION = None
+
+# Returned by instrument() while instrumentation is disabled
+_NO_OP = contextlib.nullcontext()
+
+def _op_summary(latencies):
+    """Summarise one operation's latencies (seconds) with a bucketed histogram."""
+    ordered = sorted(latencies)
+    histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    for seconds in ordered:
+        histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+    labels = [f"<={bound:g}ms" for bound in LATENCY_BUCKETS_MS]
+    labels.append(f">{LATENCY_BUCKETS_MS[-1]:g}ms")
+    
+    def quantile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    
+    return {
+        'count': len(ordered),
+        'total': sum(ordered),
+        'p50': quantile(0.50),
+        'p95': quantile(0.95),
+        'p99': quantile(0.99),
+        'max': ordered[-1],
+        'histogram': {label: count
+                      for label, count in zip(labels, histogram) if count}
+    }
+
+class MemorySink:
+    """Aggregate instrumentation events in memory, per test.
+
+    pop_summary(test) returns and forgets one test's per-phase breakdown,
+    per-operation latency summaries and throughput time series.
+    """
+
+    def __init__(self):
+        self.tests = {}
+
+    def emit(self, event):
+        test = self.tests.setdefault(event['test'], {
+            'phases': {}, 'latencies': {}, 'throughput': []})
+        op = event['op']
+        if op == 'throughput':
+            test['throughput'].append([event['t'], event['bytes_per_sec']])
+            return
+        phase = test['phases'].setdefault(event['phase'], {
+            'wall_time': 0.0, 'ops': {}, 'bytes': 0})
+        if op == 'phase':
+            phase['wall_time'] += event['seconds']
+            return
+        phase_op = phase['ops'].setdefault(op, {'count': 0, 'total': 0.0})
+        phase_op['count'] += 1
+        phase_op['total'] += event['seconds']
+        phase['bytes'] += event.get('bytes', 0)
+        test['latencies'].setdefault(op, []).append(event['seconds'])
+
+    def pop_summary(self, test):
+        data = self.tests.pop(test, None)
+        if data is None:
+            return None
+        return {
+            'phases': data['phases'],
+            'ops': {op: _op_summary(latencies)
+                    for op, latencies in data['latencies'].items()},
+            'throughput': data['throughput']
+        }
+
+    def close(self):
+        pass
+
+class JsonlTraceSink:
+    """Write every instrumentation event to a JSON Lines trace file."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._file = open(path, 'a')
+
+    def emit(self, event):
+        self._file.write(json.dumps(event) + '\n')
+
+    def close(self):
+        self._file.close()
+
+class Instrumentation:
+    """Record remote operation latencies, throughput and phase times.
+
+    Every event is a dict with 't' (seconds since start), 'test', 'phase'
+    and 'op', passed to each sink under one lock so sinks need not be
+    thread-safe. Operations carry 'seconds' (and 'bytes' for writes);
+    throughput samples are taken from transferred() at most every
+    sample_interval seconds.
+    """
+
+    def __init__(self, sinks, sample_interval=THROUGHPUT_SAMPLE_INTERVAL):
+        self.sinks = list(sinks)
+        self.sample_interval = sample_interval
+        self.test = None
+        self.phase = None
+        self._origin = time.perf_counter()
+        self._phase_start = None
+        self._sample_start = None
+        self._sample_bytes = 0
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        event['t'] = round(time.perf_counter() - self._origin, 6)
+        event.setdefault('test', self.test)
+        event.setdefault('phase', self.phase)
+        with self._lock:
+            for sink in self.sinks:
+                sink.emit(event)
+
+    @contextlib.contextmanager
+    def op(self, name, **fields):
+        """Time the body of the with block as one name operation."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            fields['error'] = True
+            raise
+        finally:
+            self.emit(dict(op=name, seconds=time.perf_counter() - start,
+                           **fields))
+
+    def transferred(self, nbytes):
+        """Count nbytes sent, emitting a throughput sample when one is due."""
+        now = time.perf_counter()
+        with self._lock:
+            if self._sample_start is None:
+                self._sample_start = now
+            self._sample_bytes += nbytes
+            elapsed = now - self._sample_start
+            if elapsed < self.sample_interval or elapsed <= 0:
+                return
+            sample_bytes = self._sample_bytes
+            self._sample_start = now
+            self._sample_bytes = 0
+        self.emit({'op': 'throughput', 'bytes': sample_bytes,
+                   'seconds': elapsed, 'bytes_per_sec': sample_bytes / elapsed})
+
+    def put_callback(self):
+        """Return a paramiko put/putfo callback feeding transferred()."""
+        sent = [0]
+        
+        def callback(transferred, total):
+            self.transferred(transferred - sent[0])
+            sent[0] = transferred
+        
+        return callback
+
+    def _flush(self):
+        now = time.perf_counter()
+        with self._lock:
+            sample_bytes = self._sample_bytes
+            elapsed = now - (self._sample_start or now)
+            self._sample_start = None
+            self._sample_bytes = 0
+        if sample_bytes and elapsed > 0:
+            self.emit({'op': 'throughput', 'bytes': sample_bytes,
+                       'seconds': elapsed,
+                       'bytes_per_sec': sample_bytes / elapsed})
+        if self._phase_start is not None:
+            self.emit({'op': 'phase', 'seconds': now - self._phase_start})
+        self._phase_start = now
+
+    def set_phase(self, phase):
+        """End the current phase (recording its wall time) and start phase."""
+        self._flush()
+        self.phase = phase
+
+    def begin_test(self, test):
+        self.test = test
+        self.phase = None
+        self._phase_start = None
+        self._sample_start = None
+        self._sample_bytes = 0
+
+    def end_test(self):
+        """Close the current test; return its summary from a MemorySink, if any."""
+        self._flush()
+        self._phase_start = None
+        summary = None
+        for sink in self.sinks:
+            if hasattr(sink, 'pop_summary'):
+                summary = sink.pop_summary(self.test)
+        self.test = self.phase = None
+        return summary
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+def enable_instrumentation(sinks, sample_interval=THROUGHPUT_SAMPLE_INTERVAL):
+    """Install an Instrumentation writing to sinks and return it."""
+    global INSTRUMENTATION
+    disable_instrumentation()
+    INSTRUMENTATION = Instrumentation(sinks, sample_interval)
+    return INSTRUMENTATION
+
+def disable_instrumentation():
+    """Remove the installed Instrumentation, closing its sinks."""
+    global INSTRUMENTATION
+    if INSTRUMENTATION is not None:
+        INSTRUMENTATION.close()
+        INSTRUMENTATION = None
+
+def instrument(op, **fields):
+    """Context manager timing one remote operation; a shared no-op when disabled."""
+    if INSTRUMENTATION is None:
+        return _NO_OP
+    return INSTRUMENTATION.op(op, **fields)
+
+def instrument_phase(phase):
+    """Start a named phase of the running test, if instrumentation is enabled."""
+    if INSTRUMENTATION is not None:
+        INSTRUMENTATION.set_phase(phase)
+
+def record_transfer(nbytes):
+    """Count nbytes sent for throughput sampling, if instrumentation is enabled."""
+    if INSTRUMENTATION is not None:
+        INSTRUMENTATION.transferred(nbytes)
+
+def put_callback():
+    """Return a paramiko put callback for throughput sampling, or None."""
+    if INSTRUMENTATION is None:
+        return None
+    return INSTRUMENTATION.put_callback()
+
+class BandwidthLimiter:
+    """Token bucket capping the combined send rate of many upload threads.
+
+    consume() charges bytes already handed to the transport; a sender that
+    overdraws the bucket sleeps off its share of the debt, so concurrent
+    uploads together stay at about rate bytes per second.
+    """
+    
+    def __init__(self, rate, burst=BANDWIDTH_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def consume(self, nbytes):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+    
+    def put_callback(self):
+        """Return a paramiko put callback charging each write to the bucket."""
+        sent = [0]
+        def callback(transferred, total):
+            self.consume(transferred - sent[0])
+            sent[0] = transferred
+        return callback
+
+def sftp_put(sftp, local_path, remote_path, limiter=None):
+    """sftp.put, split into timed open/write/close/stat steps when instrumented.
+
+    The instrumented path mirrors paramiko's put: pipelined 32 KB writes and
+    a confirming stat. Because writes are pipelined, close waits for the
+    outstanding acknowledgements, so write time is mostly local queueing.
+    With a BandwidthLimiter the writes are paced to its rate.
+    """
+    inst = INSTRUMENTATION
+    if inst is None:
+        if limiter is not None:
+            return sftp.put(local_path, remote_path,
+                            callback=limiter.put_callback())
+        return sftp.put(local_path, remote_path)
+    file_size = os.path.getsize(local_path)
+    with open(local_path, 'rb') as local_file:
+        with inst.op('open', path=remote_path):
+            remote_file = sftp.open(remote_path, 'wb')
+        try:
+            remote_file.set_pipelined(True)
+            with inst.op('write', path=remote_path, bytes=file_size):
+                while True:
+                    data = local_file.read(32768)
+                    if not data:
+                        break
+                    remote_file.write(data)
+                    inst.transferred(len(data))
+                    if limiter is not None:
+                        limiter.consume(len(data))
+        finally:
+            with inst.op('close', path=remote_path):
+                remote_file.close()
+    with inst.op('stat', path=remote_path):
+        attrs = sftp.stat(remote_path)
+    if attrs.st_size != file_size:
+        raise IOError(f"size mismatch in put!  {attrs.st_size} != {file_size}")
+    return attrs
+
+def sftp_upload(sftp, local_path, remote_path, dir_cache=None):
+    """Upload a file with progress reporting and timeout handling.
+
+    With a RemoteDirCache the remote parent directory is created if needed.
+    """
     start = time.time()
     
+    if dir_cache is not None:
+        dir_cache.ensure(sftp, remote_path.rsplit('/', 1)[0])
+    
     # Get file size for progress reporting
     file_size = os.path.getsize(local_path)
     print(f"Uploading {os.path.basename(local_path)} ({file_size / (1024*1024):.1f} MB)...")
@@ -31,7 +781,7 @@ def sftp_upload(sftp, local_path, remote_path):
     sftp.get_channel().settimeout(300)  # 5 minutes timeout
     
     try:
-        sftp.put(local_path, remote_path)
+        sftp_put(sftp, local_path, remote_path)
         end = time.time()
         print(f"Upload completed in {end - start:.2f} seconds")
         return end - start
@@ -39,35 +789,464 @@ def sftp_upload(sftp, local_path, remote_path):
         print(f"Upload failed: {e}")
         raise
 
-def exists_remote(sftp, path):
-    """Return True if a file or directory exists on the server."""
+def checkpoint_path_for(local_path, remote_path, checkpoint_dir=None):
+    """Return the local checkpoint file that tracks one resumable transfer."""
+    key = hashlib.sha1(
+        f"{os.path.abspath(local_path)}->{remote_path}".encode()).hexdigest()
+    return os.path.join(checkpoint_dir or os.path.join(STATE_DIR, 'checkpoints'),
+                        f"{key[:16]}.json")
+
+def sftp_upload_resumable(sftp, local_path, remote_path, reconnect=None,
+                          chunk_size=RESUME_CHUNK_SIZE, checkpoint_dir=None,
+                          max_retries=5, backoff=2.0, verify=None):
+    """Upload a file in confirmed chunks, resuming after connection drops.
+
+    After each chunk an fstat round-trip confirms the remote size and the
+    offset is checkpointed locally, so a later run also resumes where this
+    one stopped. A resumed file is truncated to the local size at the end.
+    On failure reconnect() is called with exponential backoff and must
+    return a fresh SFTPClient. verify, if given, is called with remote_path
+    and must return the remote SHA-256 for an end-to-end check.
+
+    Returns a stats dict; its 'sftp' entry is the client to keep using.
+    """
+    start = time.time()
+    file_size = os.path.getsize(local_path)
+    file_mtime = os.path.getmtime(local_path)
+    checkpoint_path = checkpoint_path_for(local_path, remote_path, checkpoint_dir)
+    print(f"Uploading {os.path.basename(local_path)} "
+          f"({file_size / (1024*1024):.1f} MB) in "
+          f"{chunk_size / (1024*1024):.0f} MB chunks...")
+    
+    offset = 0
+    try:
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if (checkpoint['size'], checkpoint['mtime'], checkpoint['remote_path']) \
+                == (file_size, file_mtime, remote_path):
+            offset = checkpoint['offset']
+    except (OSError, ValueError, KeyError):
+        pass
+    
+    def save_checkpoint():
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+        with open(checkpoint_path, 'w') as f:
+            json.dump({'local_path': os.path.abspath(local_path),
+                       'remote_path': remote_path, 'size': file_size,
+                       'mtime': file_mtime, 'offset': offset}, f)
+    
+    resumed_from = None
+    reconnects = 0
+    attempt = 0
+    with open(local_path, 'rb') as local_file:
+        while True:
+            try:
+                if sftp is None:
+                    sftp = reconnect()
+                    reconnects += 1
+                sftp.get_channel().settimeout(300)
+                if offset:
+                    # Only trust the checkpoint as far as the server got
+                    try:
+                        offset = min(offset, sftp.stat(remote_path).st_size)
+                    except IOError:
+                        offset = 0
+                if resumed_from is None:
+                    resumed_from = offset
+                if offset:
+                    print(f"  Resuming at {offset / (1024*1024):.1f} MB")
+                with sftp.open(remote_path, 'r+b' if offset else 'wb') as remote:
+                    remote.set_pipelined(True)
+                    while offset < file_size:
+                        local_file.seek(offset)
+                        data = local_file.read(chunk_size)
+                        remote.seek(offset)
+                        remote.write(data)
+                        # The fstat reply comes after every pipelined write
+                        # before it, so the size it reports is confirmed
+                        if remote.stat().st_size < offset + len(data):
+                            raise IOError("remote file shorter than written data")
+                        offset += len(data)
+                        record_transfer(len(data))
+                        save_checkpoint()
+                        attempt = 0
+                    if resumed_from:
+                        # A longer earlier upload would leave its tail behind
+                        remote.truncate(file_size)
+                break
+            except (IOError, EOFError, socket.error,
+                    paramiko.SSHException) as e:
+                attempt += 1
+                if reconnect is None or attempt > max_retries:
+                    print(f"Upload failed at {offset / (1024*1024):.1f} MB: {e}")
+                    raise
+                delay = backoff * 2 ** (attempt - 1)
+                print(f"  Transfer interrupted at {offset / (1024*1024):.1f} MB "
+                      f"({e}); reconnecting in {delay:.1f}s "
+                      f"(attempt {attempt}/{max_retries})")
+                try:
+                    sftp.close()
+                except Exception:
+                    pass
+                sftp = None
+                time.sleep(delay)
+    
+    verified = None
+    if verify is not None:
+        remote_hash = verify(remote_path)
+        verified = remote_hash is not None and \
+            remote_hash.lower() == file_sha256(local_path)
+        print(f"  Checksum {'verified' if verified else 'MISMATCH'}")
+        if not verified:
+            raise IOError(f"Checksum mismatch after upload: {remote_path}")
+    
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    elapsed = time.time() - start
+    print(f"Upload completed in {elapsed:.2f} seconds")
+    return {
+        'time': elapsed,
+        'size': file_size,
+        'resumed_from': resumed_from or 0,
+        'reconnects': reconnects,
+        'verified': verified,
+        'sftp': sftp
+    }
+
+def delta_block_size(size):
+    """Block size for delta signatures: about sqrt(size), a power of two.
+
+    Kept between DELTA_MIN_BLOCK and DELTA_MAX_BLOCK.
+    """
+    block_size = 1 << max(0, round(math.log2(max(size, 1)) / 2))
+    return min(max(block_size, DELTA_MIN_BLOCK), DELTA_MAX_BLOCK)
+
+def file_signature(local_path, block_size):
+    """Return the [(adler32, md5 digest)] block signature of a local file."""
+    blocks = []
+    with open(local_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            blocks.append((zlib.adler32(block), hashlib.md5(block).digest()))
+    return blocks
+
+def write_delta(local_path, block_size, blocks, basis_size, delta_file,
+                max_literal=None):
+    """Write the delta that turns a remote file into local_path.
+
+    blocks is the remote file's signature (see file_signature) and
+    basis_size its size. Full blocks found in the local file with a rolling
+    Adler-32 confirmed by MD5 become references; the rest is literal data.
+    Unchanged regions cost one hash per block. After a mismatch every
+    offset of the next block length is tried, which finds in-place edits
+    and short insertions exactly; further on only one block length in
+    DELTA_SCAN_STRIDE is rolled over, and a match found that way is
+    extended backwards block by block. The header carries the SHA-256 of
+    local_path, so a basis that no longer matches blocks is caught when the
+    file is rebuilt. Returns (matched bytes, literal bytes), or None as soon
+    as the literal data exceeds max_literal bytes.
+    """
+    table = {}
+    for index, (weak, strong) in enumerate(blocks):
+        table.setdefault(weak, {}).setdefault(strong, index)
+    size = os.path.getsize(local_path)
+    budget = size if max_literal is None else max_literal
+    header = DELTA_MAGIC + struct.pack('<IQ', block_size, size)
+    run = []
+    matched = literal = 0
+    
+    def copy(index):
+        # Consecutive blocks are sent as one reference
+        if run and run[0] + run[1] == index:
+            run[1] += 1
+            return
+        flush_copy()
+        run.extend((index, 1))
+    
+    def flush_copy():
+        if run:
+            delta_file.write(b'C' + struct.pack('<II', *run))
+            run.clear()
+    
+    def emit_literal(data, start, end):
+        if start < end:
+            flush_copy()
+        for offset in range(start, end, DELTA_LITERAL_CHUNK):
+            chunk = data[offset:min(end, offset + DELTA_LITERAL_CHUNK)]
+            delta_file.write(b'L' + struct.pack('<I', len(chunk)) + chunk)
+        return end - start
+    
+    def block_matches(data, offset, index):
+        piece = data[offset:offset + block_size]
+        weak, strong = blocks[index]
+        return (zlib.adler32(piece) == weak and
+                hashlib.md5(piece).digest() == strong)
+    
+    if size == 0:
+        # mmap cannot map an empty file, and there is nothing to match
+        delta_file.write(header + hashlib.sha256().digest())
+        return 0, 0
+    with open(local_path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        delta_file.write(header + hashlib.sha256(data).digest())
+        pos = literal_start = 0
+        rolled = 0
+        weak = None
+        end = size - block_size
+        while pos <= end:
+            if weak is None:
+                weak = zlib.adler32(data[pos:pos + block_size])
+                a, b = weak & 0xffff, weak >> 16
+            strongs = table.get(weak)
+            if strongs:
+                index = strongs.get(
+                    hashlib.md5(data[pos:pos + block_size]).digest())
+                if index is not None:
+                    first, start = index, pos
+                    while (first > 0 and start - block_size >= literal_start
+                           and block_matches(data, start - block_size,
+                                             first - 1)):
+                        first -= 1
+                        start -= block_size
+                    literal += emit_literal(data, literal_start, start)
+                    for block in range(first, index + 1):
+                        copy(block)
+                    matched += pos + block_size - start
+                    pos += block_size
+                    literal_start = pos
+                    rolled = 0
+                    weak = None
+                    continue
+            if literal + pos - literal_start > budget:
+                return None
+            rolled += 1
+            if rolled == block_size:
+                # Every shift has been tried; sample a window further on
+                pos += (DELTA_SCAN_STRIDE - 1) * block_size + 1
+                rolled = 0
+                weak = None
+                continue
+            if pos < end:
+                # Roll the window one byte forward
+                out, new = data[pos], data[pos + block_size]
+                a = (a - out + new) % 65521
+                b = (b - block_size * out + a - 1) % 65521
+                weak = (b << 16) | a
+            pos += 1
+        
+        # A short last remote block can only match the end of the file
+        tail = basis_size % block_size
+        tail_start = size - tail
+        if tail and blocks and tail_start >= literal_start:
+            weak, strong = blocks[-1]
+            piece = data[tail_start:size]
+            if (zlib.adler32(piece) == weak and
+                    hashlib.md5(piece).digest() == strong):
+                literal += emit_literal(data, literal_start, tail_start)
+                copy(len(blocks) - 1)
+                matched += tail
+                literal_start = size
+        if literal + size - literal_start > budget:
+            return None
+        literal += emit_literal(data, literal_start, size)
+    flush_copy()
+    return matched, literal
+
+def read_signature_cache(sftp, remote_path, remote_attrs):
+    """Load the cached signature next to remote_path if it is still current.
+
+    The cache records the size and mtime the file had when it was written;
+    returns (block_size, blocks), or None if it is missing or stale. A file
+    rewritten without changing either still passes, and is then caught by
+    the hash check when the delta is applied.
+    """
     try:
-        sftp.stat(path)
+        with sftp.open(remote_path + DELTA_SIGNATURE_SUFFIX, 'rb') as f:
+            f.prefetch()
+            content = f.read()
     except IOError:
-        return False
-    return True
+        return None
+    header, _, records = content.partition(b'\n')
+    try:
+        header = json.loads(header)
+    except ValueError:
+        return None
+    if (header.get('size') != remote_attrs.st_size or
+            header.get('mtime') != remote_attrs.st_mtime):
+        return None
+    blocks = [struct.unpack_from('<I16s', records, offset)
+              for offset in range(0, len(records), 20)]
+    return header['block_size'], blocks
 
-def sftp_mkdirs(sftp, remote_directory):
-    """Change to this dir, recursively making parent dirs if needed."""
-    dirs = []
-    head, tail = os.path.split(remote_directory.rstrip('/'))
-    while head and tail and not exists_remote(sftp, head):
-        dirs.insert(0, head)
-        head, tail = os.path.split(head)
-    for directory in dirs + [remote_directory]:
+def write_signature_cache(sftp, local_path, remote_path):
+    """Store local_path's signature next to its freshly written remote copy.
+
+    Returns the number of bytes written.
+    """
+    block_size = delta_block_size(os.path.getsize(local_path))
+    blocks = file_signature(local_path, block_size)
+    attrs = sftp.stat(remote_path)
+    header = json.dumps({'size': attrs.st_size, 'mtime': attrs.st_mtime,
+                         'block_size': block_size})
+    content = header.encode() + b'\n' + b''.join(
+        struct.pack('<I16s', weak, strong) for weak, strong in blocks)
+    with sftp.open(remote_path + DELTA_SIGNATURE_SUFFIX, 'wb') as f:
+        f.set_pipelined(True)
+        f.write(content)
+    return len(content)
+
+def remote_signature(ssh, helper, remote_path, block_size):
+    """Compute a remote file's block signature with the remote helper.
+
+    Returns (block_size, blocks), or None if the command failed.
+    """
+    exit_status, stdout, stderr = run_remote(
+        ssh, DELTA_SIGNATURE_COMMAND.format(helper=helper, path=remote_path,
+                                            block_size=block_size),
+        command='delta-signature')
+    if exit_status != 0:
+        print(f"  Remote signature failed: {stderr or stdout}")
+        return None
+    blocks = []
+    for line in stdout.split():
+        weak, _, strong = line.partition(':')
+        blocks.append((int(weak, 16), bytes.fromhex(strong)))
+    return block_size, blocks
+
+def sftp_upload_delta(sftp, local_path, remote_path, commands, helper,
+                      stats=None):
+    """Upload a file as an rsync-style delta against its existing remote copy.
+
+    commands returns what remote commands run over (SSHSessionPool.commands)
+    and helper is the remote path of DELTA_HELPER_SOURCE. The remote
+    file's signature comes from its cache file when that still matches,
+    otherwise the helper computes it remotely. Local blocks matching it
+    are sent as references and the rest as literal data, and the helper
+    rebuilds the file in place. Files with no remote copy, or whose delta
+    would be mostly literal data, are sent whole, and so are files the
+    helper fails to rebuild (a stale cache is removed). Either way a fresh
+    signature cache is left next to the remote file.
+
+    Returns (and appends to stats) a dict with 'mode' ('delta' or 'full'),
+    'file_size', 'bytes_sent', 'signature' (where it came from) and 'time'.
+    """
+    start = time.time()
+    size = os.path.getsize(local_path)
+    try:
+        remote_attrs = sftp.stat(remote_path)
+    except IOError:
+        remote_attrs = None
+    
+    signature = source = None
+    if remote_attrs is not None:
+        signature = read_signature_cache(sftp, remote_path, remote_attrs)
+        source = 'cache'
+        if signature is None:
+            signature = remote_signature(commands(), helper, remote_path,
+                                         delta_block_size(remote_attrs.st_size))
+            source = 'remote'
+    
+    mode = 'full'
+    sent = size
+    if signature is not None:
+        block_size, blocks = signature
+        fd, delta_path = tempfile.mkstemp(suffix='.delta')
+        remote_delta = remote_path + '.delta'
         try:
-            sftp.mkdir(directory)
-        except IOError:
-            pass  # already exists
+            with os.fdopen(fd, 'wb') as delta_file:
+                counts = write_delta(local_path, block_size, blocks,
+                                     remote_attrs.st_size, delta_file,
+                                     size * DELTA_MAX_LITERAL_RATIO)
+            if counts is not None:
+                sftp_put(sftp, delta_path, remote_delta)
+                exit_status, stdout, stderr = run_remote(
+                    commands(), DELTA_APPLY_COMMAND.format(
+                        helper=helper, path=remote_path, delta=remote_delta),
+                    command='delta-apply')
+                if exit_status == 0:
+                    mode = 'delta'
+                    sent = os.path.getsize(delta_path)
+                else:
+                    print(f"  Delta apply failed, sending whole file: "
+                          f"{stderr or stdout}")
+                    for stale in (remote_delta,
+                                  remote_path + DELTA_SIGNATURE_SUFFIX):
+                        with contextlib.suppress(IOError):
+                            sftp.remove(stale)
+        finally:
+            os.remove(delta_path)
+    if mode == 'full':
+        sftp_put(sftp, local_path, remote_path)
+    sent += write_signature_cache(sftp, local_path, remote_path)
+    
+    result = {
+        'local_path': local_path,
+        'mode': mode,
+        'file_size': size,
+        'bytes_sent': sent,
+        'signature': source,
+        'time': time.time() - start
+    }
+    if stats is not None:
+        stats.append(result)
+    return result
+
+class RemoteDirCache:
+    """Remote directories known to exist, shared by all upload paths.
+
+    Each directory is created at most once, top-down, with a single mkdir
+    when its parent is already known. calls counts the stat/mkdir requests
+    actually sent and hits the ensure() calls answered from the cache
+    without any request.
+    """
+
+    def __init__(self, known=()):
+        self.known = {path.replace('\\', '/').rstrip('/') for path in known}
+        self.calls = 0
+        self.hits = 0
+        self._lock = threading.Lock()
 
-def put_r(sftp, local_path, remote_path):
+    def ensure(self, sftp, remote_directory):
+        """Make sure remote_directory exists, creating missing levels top-down."""
+        remote_directory = remote_directory.replace('\\', '/').rstrip('/')
+        if not remote_directory:
+            return
+        with self._lock:
+            parts = remote_directory.split('/')
+            if remote_directory in self.known:
+                self.hits += 1
+                return
+            
+            # Find the deepest known ancestor, then create everything below it
+            depth = len(parts) - 1
+            while depth > 0 and '/'.join(parts[:depth]) not in self.known:
+                depth -= 1
+            for level in range(max(depth, 1), len(parts) + 1):
+                path = '/'.join(parts[:level])
+                if not path or path in self.known:
+                    continue
+                self.calls += 1
+                try:
+                    with instrument('mkdir', path=path):
+                        sftp.mkdir(path)
+                except IOError:
+                    # Usually "already exists"; confirm it really is a dir
+                    self.calls += 1
+                    with instrument('stat', path=path):
+                        attrs = sftp.stat(path)
+                    if not stat.S_ISDIR(attrs.st_mode or 0):
+                        raise IOError(f"Remote path is not a directory: {path}")
+                self.known.add(path)
+
+def put_r(sftp, local_path, remote_path, dir_cache=None):
     """Recursively upload a local directory to the remote path."""
+    if dir_cache is None:
+        dir_cache = RemoteDirCache()
     if os.path.isfile(local_path):
         # Simple file
         dirname = os.path.dirname(remote_path)
         if dirname:
-            sftp_mkdirs(sftp, dirname)
-        sftp.put(local_path, remote_path)
+            dir_cache.ensure(sftp, dirname)
+        sftp_put(sftp, local_path, remote_path)
     else:
         # Directory: walk tree
         for root, dirs, files in os.walk(local_path):
@@ -77,14 +1256,239 @@ def put_r(sftp, local_path, remote_path):
                 rdir = remote_path.rstrip('/')
             else:
                 rdir = (remote_path.rstrip('/') + '/' + rel)
-            sftp_mkdirs(sftp, rdir)
+            dir_cache.ensure(sftp, rdir)
             for fname in files:
                 local_file = os.path.join(root, fname)
                 remote_file = rdir + '/' + fname
-                sftp.put(local_file, remote_file)
+                sftp_put(sftp, local_file, remote_file)
+
+def build_upload_plan(local_path, remote_path, files=None, inventory=None):
+    """Return the remote directories to create and (local, remote, size) file jobs.
+
+    files optionally restricts a directory upload to the given '/'-separated
+    paths relative to local_path. inventory is a scan_tree result to reuse.
+    """
+    remote_path = remote_path.rstrip('/')
+    if inventory is None:
+        inventory = scan_tree(local_path)
+    if os.path.isfile(local_path):
+        dirname = os.path.dirname(remote_path)
+        entry = inventory['files'][0]
+        return ([dirname] if dirname else [],
+                [(local_path, remote_path, entry.size)])
+    if files is not None:
+        by_rel_path = {entry.rel_path: entry for entry in inventory['files']}
+        dirs = {remote_path}
+        jobs = []
+        for rel_path in files:
+            remote_file = remote_path + '/' + rel_path
+            dirs.add(remote_file.rsplit('/', 1)[0])
+            jobs.append((by_rel_path[rel_path].path, remote_file,
+                         by_rel_path[rel_path].size))
+        # Sorting puts every parent before its children
+        return sorted(dirs), jobs
+
+    dirs = [remote_path + '/' + rel if rel else remote_path
+            for rel in inventory['dirs']]
+    jobs = [(entry.path, remote_path + '/' + entry.rel_path, entry.size)
+            for entry in inventory['files']]
+    return dirs, jobs
+
+def upload_worker(sftp, jobs, results, resume=None, limiter=None,
+                  delta=None):
+    """Drain file jobs from a queue over one SFTP channel, recording each outcome.
+
+    delta is a delta_options result; files larger than its threshold are
+    sent with sftp_upload_delta. resume holds sftp_upload_resumable keyword
+    arguments; other files larger than its chunk_size are then sent through
+    the resumable path. The rest are paced by limiter, a BandwidthLimiter,
+    if given.
+    """
+    while True:
+        try:
+            local_file, remote_file, size = jobs.get_nowait()
+        except queue.Empty:
+            return
+        start = time.time()
+        try:
+            if delta and size > delta['threshold']:
+                sftp_upload_delta(sftp, local_file, remote_file,
+                                  delta['commands'], delta['helper'],
+                                  delta['stats'])
+            elif resume and size > resume['chunk_size']:
+                stats = sftp_upload_resumable(sftp, local_file, remote_file,
+                                              **resume)
+                # A reconnect replaces the channel for the rest of the queue
+                sftp = stats['sftp']
+            else:
+                sftp_put(sftp, local_file, remote_file, limiter)
+            error = None
+        except Exception as e:
+            error = str(e)
+        # list.append is atomic, so workers can share the results list
+        results.append({
+            'local_path': local_file,
+            'remote_path': remote_file,
+            'size': size,
+            'time': time.time() - start,
+            'success': error is None,
+            'error': error
+        })
+
+def upload_files(sftp_channels, files, resume=None, limiter=None, delta=None):
+    """Upload file jobs using one worker thread per SFTP channel."""
+    jobs = queue.Queue()
+    # Largest files first so the slowest transfers don't start last
+    for job in sorted(files, key=lambda job: job[2], reverse=True):
+        jobs.put(job)
+
+    results = []
+    if len(sftp_channels) == 1:
+        upload_worker(sftp_channels[0], jobs, results, resume, limiter, delta)
+        return results
+
+    threads = [
+        threading.Thread(target=upload_worker,
+                         args=(sftp, jobs, results, resume, limiter, delta))
+        for sftp in sftp_channels
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def open_sftp_channels(transports, count):
+    """Open count SFTP channels spread round-robin over the given transports."""
+    channels = []
+    try:
+        for i in range(count):
+            transport = transports[i % len(transports)]
+            channels.append(paramiko.SFTPClient.from_transport(transport))
+    except Exception:
+        for sftp in channels:
+            sftp.close()
+        raise
+    return channels
+
+def put_r_parallel(transports, local_path, remote_path, workers=4, files=None,
+                   dir_cache=None, resume=None, inventory=None, delta=None):
+    """Recursively upload over a pool of SFTP channels and return per-file results."""
+    if dir_cache is None:
+        dir_cache = RemoteDirCache()
+    dirs, files = build_upload_plan(local_path, remote_path, files, inventory)
+    channels = open_sftp_channels(transports, max(1, min(workers, len(files))))
+    try:
+        # Directories are created up front so workers only ever do puts
+        for rdir in dirs:
+            dir_cache.ensure(channels[0], rdir)
+        return upload_files(channels, files, resume, delta=delta)
+    finally:
+        for sftp in channels:
+            sftp.close()
+
+def _range_writer(sftp, local_path, remote_path, ranges, stats):
+    """Write byte ranges from a queue into the remote file over one channel."""
+    start = time.time()
+    try:
+        with open(local_path, 'rb') as local_file, \
+                sftp.open(remote_path, 'r+b') as remote_file:
+            remote_file.set_pipelined(True)
+            while True:
+                try:
+                    offset, length = ranges.get_nowait()
+                except queue.Empty:
+                    break
+                local_file.seek(offset)
+                data = local_file.read(length)
+                remote_file.seek(offset)
+                remote_file.write(data)
+                stats['bytes'] += len(data)
+                record_transfer(len(data))
+        # Leaving the with block waits for every pipelined write to be acked
+    except Exception as e:
+        stats['error'] = e
+    stats['time'] = time.time() - start
+
+def sftp_upload_multistream(transports, local_path, remote_path, streams=4,
+                            chunk_size=MULTISTREAM_CHUNK_SIZE):
+    """Upload one file as concurrent offset writes over several SFTP channels.
+
+    The file is cut into chunk_size byte ranges that streams channels, opened
+    round-robin over transports, pull from a shared queue and write into
+    the same remote file. Each channel has its own flow-control window, so
+    together they are not capped by one channel's window on long links.
+    """
+    start = time.time()
+    file_size = os.path.getsize(local_path)
+    print(f"Uploading {os.path.basename(local_path)} "
+          f"({file_size / (1024*1024):.1f} MB) over {streams} streams...")
+    
+    ranges = queue.Queue()
+    for offset in range(0, file_size, chunk_size):
+        ranges.put((offset, min(chunk_size, file_size - offset)))
+    streams = max(1, min(streams, ranges.qsize()))
+    
+    channels = open_sftp_channels(transports, streams)
+    try:
+        for sftp in channels:
+            sftp.get_channel().settimeout(300)
+        # Create/truncate once so every stream can open it for update
+        with channels[0].open(remote_path, 'wb'):
+            pass
+        
+        stream_stats = [{'bytes': 0, 'time': 0.0, 'error': None}
+                        for _ in channels]
+        threads = [
+            threading.Thread(target=_range_writer,
+                             args=(sftp, local_path, remote_path, ranges, stats))
+            for sftp, stats in zip(channels, stream_stats)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        errors = [stats['error'] for stats in stream_stats if stats['error']]
+        if errors:
+            raise IOError(f"Multi-stream upload failed: {errors[0]}")
+        remote_size = channels[0].stat(remote_path).st_size
+        if remote_size != file_size:
+            raise IOError(f"size mismatch in multi-stream upload! "
+                          f"{remote_size} != {file_size}")
+    finally:
+        for sftp in channels:
+            sftp.close()
+    
+    elapsed = time.time() - start
+    for stats in stream_stats:
+        stats['mbps'] = (stats['bytes'] / (1024 * 1024) / stats['time']
+                         if stats['time'] > 0 else 0.0)
+        del stats['error']
+    aggregate_mbps = file_size / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+    print(f"Upload completed in {elapsed:.2f} seconds "
+          f"({aggregate_mbps:.2f} MB/s aggregate)")
+    return {
+        'time': elapsed,
+        'size': file_size,
+        'streams': stream_stats,
+        'aggregate_mbps': aggregate_mbps
+    }
+
+def sftp_upload_folder_recursive(sftp, local_folder, remote_folder, ssh=None,
+                                 workers=1, transports=None, files=None,
+                                 dir_cache=None, resume=None, inventory=None,
+                                 delta=None):
+    """Upload a folder recursively via SFTP with explicit directory creation.
 
-def sftp_upload_folder_recursive(sftp, local_folder, remote_folder, ssh=None):
-    """Upload a folder recursively via SFTP with explicit directory creation."""
+    With workers > 1 files are spread over that many SFTP channels, opened
+    round-robin over transports (default: the transport behind sftp).
+    files optionally limits the upload to a list of relative paths, and
+    dir_cache is the RemoteDirCache shared with other uploads of the run.
+    resume enables chunked, resumable transfers for large files and delta
+    enables rsync-style deltas against remote copies (see upload_worker).
+    inventory is the run's scan_tree result, if any.
+    """
     start = time.time()
     
     # Convert to Unix-style path for remote
@@ -92,328 +1496,4121 @@ def sftp_upload_folder_recursive(sftp, local_folder, remote_folder, ssh=None):
     
     print(f"Uploading folder recursively: {local_folder} -> {remote_folder}")
     
-    uploaded_count = 0
-    failed_count = 0
-    
-    # Count total files first
-    total_files = sum(len(files) for _, _, files in os.walk(local_folder))
-    print(f"Found {total_files} files to upload...")
+    if dir_cache is None:
+        dir_cache = RemoteDirCache()
+    subset = files
+    dirs, files = build_upload_plan(local_folder, remote_folder, subset,
+                                    inventory)
+    print(f"Found {len(files)} files to upload with {workers} worker(s)...")
     
     try:
-        # Use the improved put_r function
-        put_r(sftp, local_folder, remote_folder)
-        
-        # Count successful uploads by walking the local directory
-        for root, _, files in os.walk(local_folder):
-            for file in files:
-                local_file = os.path.join(root, file)
-                rel_path = os.path.relpath(local_file, local_folder)
-                file_size = os.path.getsize(local_file)
-                print(f"  ✓ {rel_path} ({file_size / 1024:.1f} KB)")
-                uploaded_count += 1
-                
+        if workers > 1:
+            if transports is None:
+                transports = [sftp.get_channel().get_transport()]
+            file_results = put_r_parallel(transports, local_folder,
+                                          remote_folder, workers, subset,
+                                          dir_cache, resume, inventory, delta)
+        else:
+            for rdir in dirs:
+                dir_cache.ensure(sftp, rdir)
+            file_results = upload_files([sftp], files, resume, delta=delta)
     except Exception as e:
         print(f"  ✗ Upload failed: {e}")
-        failed_count = total_files
+        return time.time() - start, 0, len(files)
+    
+    uploaded_count = 0
+    failed_count = 0
+    for file_result in file_results:
+        rel_path = os.path.relpath(file_result['local_path'], local_folder)
+        if file_result['success']:
+            print(f"  ✓ {rel_path} ({file_result['size'] / 1024:.1f} KB)")
+            uploaded_count += 1
+        else:
+            print(f"  ✗ {rel_path}: {file_result['error']}")
+            failed_count += 1
     
     end = time.time()
     return end - start, uploaded_count, failed_count
 
-def create_remote_dir(ssh, remote_dir):
-    """Create remote directory if it doesn't exist."""
-    # Convert Windows path to Unix-style for PowerShell
-    remote_dir_unix = remote_dir.replace('\\', '/')
-    
-    # PowerShell command to create directory if it doesn't exist
-    mkdir_cmd = (
-        f'powershell -Command "if (!(Test-Path \'{remote_dir_unix}\')) {{ '
-        f'New-Item -ItemType Directory -Path \'{remote_dir_unix}\' -Force }}; '
-        f'Write-Host \'Directory ready: {remote_dir_unix}\'"'
-    )
+def build_micro_archive(batch, remote_root):
+    """Zip a batch of small-file jobs in memory, named relative to remote_root."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for local_file, remote_file, _ in batch:
+            zipf.write(local_file, arcname=remote_file[len(remote_root) + 1:],
+                       compress_type=member_compress_type(local_file))
+    buffer.seek(0)
+    return buffer
+
+def hybrid_upload(ssh, sftp, local_path, remote_dir,
+                  small_threshold=HYBRID_SMALL_FILE_THRESHOLD,
+                  batch_size=HYBRID_BATCH_SIZE, workers=1, extract_workers=2,
+                  inventory=None, extractor='expand-archive'):
+    """Upload small files as micro-archives and large files directly.
+
+    Files under small_threshold are grouped into in-memory zips of about
+    batch_size input bytes. A builder thread prepares the next archive
+    while the current one is sent (and is stopped and joined if sending
+    fails), and each archive is extracted remotely
+    as soon as it lands (with the extractor backend), up to extract_workers
+    at a time. Large files go up concurrently over workers SFTP channels of
+    their own.
+    """
+    start = time.time()
+    remote_root = remote_dir.replace('\\', '/').rstrip('/')
+    _, files = build_upload_plan(local_path, remote_root, inventory=inventory)
+    small = [job for job in files if job[2] < small_threshold]
+    large = [job for job in files if job[2] >= small_threshold]
     
-    stdin, stdout, stderr = ssh.exec_command(mkdir_cmd)
-    exit_status = stdout.channel.recv_exit_status()
+    batches = []
+    current = []
+    current_size = 0
+    for job in small:
+        if current and current_size + job[2] > batch_size:
+            batches.append(current)
+            current = []
+            current_size = 0
+        current.append(job)
+        current_size += job[2]
+    if current:
+        batches.append(current)
+    print(f"Hybrid plan: {len(small)} small files in {len(batches)} batches, "
+          f"{len(large)} large files sent directly")
     
-    if exit_status != 0:
-        error_msg = stderr.read().decode().strip()
-        print(f"Warning: Could not create remote directory: {error_msg}")
-        return False
-    else:
-        result = stdout.read().decode().strip()
-        print(result)
-        return True
-
-def clear_remote_directory(ssh, remote_dir):
-    """Clear the remote directory completely."""
-    remote_dir_unix = remote_dir.replace('\\', '/')
-    clear_cmd = (
-        f'powershell -Command "if (Test-Path \'{remote_dir_unix}\') {{ '
-        f'Remove-Item -Path \'{remote_dir_unix}\' -Recurse -Force }}; '
-        f'Write-Host \'Directory cleared: {remote_dir_unix}\'"'
-    )
+    large_results = []
+    large_channels = []
+    large_thread = None
+    if large:
+        dir_cache = RemoteDirCache(known=[remote_root])
+        for rdir in sorted({job[1].rsplit('/', 1)[0] for job in large}):
+            dir_cache.ensure(sftp, rdir)
+        large_channels = open_sftp_channels([ssh.get_transport()],
+                                            max(1, min(workers, len(large))))
+        large_thread = threading.Thread(
+            target=lambda: large_results.extend(upload_files(large_channels,
+                                                             large)))
+        large_thread.start()
     
-    stdin, stdout, stderr = ssh.exec_command(clear_cmd)
-    exit_status = stdout.channel.recv_exit_status()
+    # At most two built archives wait in memory ahead of the sender
+    archives = queue.Queue(maxsize=2)
+    build_errors = []
+    stop = threading.Event()
     
-    if exit_status != 0:
-        error_msg = stderr.read().decode().strip()
-        print(f"Warning: Could not clear remote directory: {error_msg}")
-        return False
-    else:
-        result = stdout.read().decode().strip()
-        print(result)
-        return True
-
-def ssh_unzip(ssh, remote_zip, remote_dest):
-    unzip_cmd = (
-        f'powershell -Command "Expand-Archive -Path {remote_zip} '
-        f'-DestinationPath {remote_dest} -Force"'
-    )
-    stdin, stdout, stderr = ssh.exec_command(unzip_cmd)
-    exit_status = stdout.channel.recv_exit_status()
-    if exit_status != 0:
-        print("Unzip failed:", stderr.read().decode())
-        return False
-    else:
-        print("Unzip succeeded.")
-        return True
-
-def create_zip_file(local_path):
-    """Create a zip file from the given local path and return the zip file path."""
-    temp_dir = tempfile.gettempdir()
-    zip_filename = f"upload_test_{int(time.time())}.zip"
-    zip_path = os.path.join(temp_dir, zip_filename)
+    def build_batches():
+        try:
+            for index, batch in enumerate(batches):
+                if stop.is_set():
+                    break
+                archives.put((index, batch,
+                              build_micro_archive(batch, remote_root)))
+        except Exception as e:
+            build_errors.append(e)
+        finally:
+            archives.put(None)
     
-    print(f"Creating zip file: {zip_path}")
-    if os.path.isdir(local_path):
-        zip_folder(local_path, zip_path)
-    else:
-        zip_file(local_path, zip_path)
+    def stop_builder():
+        # Drain the queue so a builder blocked on a full one can finish
+        stop.set()
+        while builder.is_alive():
+            with contextlib.suppress(queue.Empty):
+                archives.get(timeout=0.1)
+        builder.join()
     
-    # Get zip file size for progress reporting
-    zip_size = os.path.getsize(zip_path)
-    print(f"Zip file created: {zip_size / (1024*1024):.1f} MB")
+    def extract(remote_zip):
+        extract_start = time.time()
+        success = ssh_unzip(ssh, remote_zip, remote_root, extractor)
+        return success, time.time() - extract_start
     
-    return zip_path
-
-def test_ssh_connection(host, port, username, password):
-    """Simple SSH connection test."""
-    print("Testing SSH connection...")
+    builder = threading.Thread(target=build_batches)
+    builder.start()
+    stamp = int(time.time())
+    batch_upload_time = 0.0
+    extractions = []
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(
-            hostname=host, 
-            port=port, 
-            username=username, 
-            password=password,
-            timeout=10
-        )
-        ssh.close()
-        print("✓ SSH connection successful")
-        return True
-    except Exception as e:
-        print(f"✗ SSH connection failed: {e}")
-        print("Please check your connection parameters and try again.")
-        return False
-
-def calculate_directory_stats(local_path):
-    """Calculate file count and total size of a directory."""
-    if os.path.isfile(local_path):
-        return 1, os.path.getsize(local_path)
+        with ThreadPoolExecutor(max_workers=extract_workers) as extract_pool:
+            while True:
+                item = archives.get()
+                if item is None:
+                    break
+                index, batch, archive = item
+                remote_zip = f"{remote_root}/hybrid_batch_{stamp}_{index}.zip"
+                upload_start = time.time()
+                try:
+                    sftp.putfo(archive, remote_zip, callback=put_callback())
+                except Exception as e:
+                    print(f"  ✗ Batch {index} upload failed: {e}")
+                    extractions.append((remote_zip, batch, None))
+                    continue
+                finally:
+                    batch_upload_time += time.time() - upload_start
+                extractions.append((remote_zip, batch,
+                                    extract_pool.submit(extract, remote_zip)))
+            extracted = [(remote_zip, batch,
+                          future.result() if future else (False, 0.0))
+                         for remote_zip, batch, future in extractions]
+    finally:
+        # Neither thread may outlive a failed upload loop
+        stop_builder()
+        if large_thread is not None:
+            large_thread.join()
+            for channel in large_channels:
+                channel.close()
     
-    total_files = 0
-    total_size = 0
+    for remote_zip, _, _ in extracted:
+        try:
+            sftp.remove(remote_zip)
+        except IOError:
+            pass
+    
+    failed = sum(len(batch) for _, batch, (ok, _) in extracted if not ok)
+    failed += sum(1 for r in large_results if not r['success'])
+    failed += sum(len(batch) for batch in batches) - \
+        sum(len(batch) for _, batch, _ in extracted)
+    for r in large_results:
+        if not r['success']:
+            print(f"  ✗ {r['remote_path']}: {r['error']}")
+    if build_errors:
+        print(f"  ✗ Building micro-archives failed: {build_errors[0]}")
+    
+    return {
+        'time': time.time() - start,
+        'batches': len(batches),
+        'small_files': len(small),
+        'large_files': len(large),
+        'batch_upload_time': batch_upload_time,
+        'extract_time': sum(elapsed for _, _, (_, elapsed) in extracted),
+        'uploaded': len(files) - failed,
+        'failed': failed
+    }
+
+def _file_result(local_file, remote_file, size, start, error):
+    return {
+        'local_path': local_file,
+        'remote_path': remote_file,
+        'size': size,
+        'time': time.time() - start,
+        'success': error is None,
+        'error': error
+    }
+
+async def _asyncssh_put(sftp, local_file, remote_file, write_slots, block_size):
+    """Send one file as offset writes, each holding a global in-flight slot."""
+    writes = []
+    async with sftp.open(remote_file, 'wb') as remote:
+        with open(local_file, 'rb') as f:
+            offset = 0
+            while True:
+                data = f.read(block_size)
+                if not data:
+                    break
+                await write_slots.acquire()
+                write = asyncio.ensure_future(remote.write(data, offset))
+                write.add_done_callback(lambda _: write_slots.release())
+                writes.append(write)
+                offset += len(data)
+        # Wait for every write before closing, then surface the first error
+        for outcome in await asyncio.gather(*writes, return_exceptions=True):
+            if isinstance(outcome, BaseException):
+                raise outcome
+
+async def _async_upload_asyncssh(host, port, username, password, dirs, files,
+                                 channels, inflight, block_size,
+                                 transport_options=None):
+    """asyncssh backend: up to inflight write requests across all files.
+
+    Returns (results, handshake seconds).
+    """
+    connect_start = time.time()
+    async with asyncssh.connect(host, port=port, username=username,
+                                password=password, known_hosts=None,
+                                **asyncssh_options(transport_options)) as conn:
+        handshake_time = time.time() - connect_start
+        clients = [await conn.start_sftp_client() for _ in range(channels)]
+        for rdir in dirs:
+            await clients[0].makedirs(rdir, exist_ok=True)
+        
+        write_slots = asyncio.Semaphore(inflight)
+        # Bound open handles too; each open file has at least one write queued
+        file_slots = asyncio.Semaphore(inflight)
+        results = []
+        
+        async def upload(index, job):
+            local_file, remote_file, size = job
+            async with file_slots:
+                start = time.time()
+                try:
+                    await _asyncssh_put(clients[index % channels], local_file,
+                                        remote_file, write_slots, block_size)
+                    error = None
+                except (OSError, asyncssh.Error) as e:
+                    error = str(e)
+                results.append(_file_result(local_file, remote_file, size,
+                                            start, error))
+        
+        await asyncio.gather(*(upload(index, job)
+                               for index, job in enumerate(files)))
+        for client in clients:
+            client.exit()
+        return results, handshake_time
+
+async def _async_upload_paramiko(transport, dirs, files, channels, inflight):
+    """Fallback backend: paramiko puts run in an executor, one per idle channel.
+
+    Returns (results, 0.0); the transport is already connected.
+    """
+    loop = asyncio.get_running_loop()
+    sftp_channels = open_sftp_channels([transport], channels)
+    try:
+        dir_cache = RemoteDirCache()
+        for rdir in dirs:
+            dir_cache.ensure(sftp_channels[0], rdir)
+        
+        idle = asyncio.Queue()
+        for sftp in sftp_channels:
+            idle.put_nowait(sftp)
+        slots = asyncio.Semaphore(inflight)
+        results = []
+        
+        def put(sftp, job):
+            local_file, remote_file, size = job
+            start = time.time()
+            try:
+                sftp_put(sftp, local_file, remote_file)
+                error = None
+            except Exception as e:
+                error = str(e)
+            return _file_result(local_file, remote_file, size, start, error)
+        
+        with ThreadPoolExecutor(max_workers=channels) as executor:
+            async def upload(job):
+                async with slots:
+                    sftp = await idle.get()
+                    try:
+                        results.append(await loop.run_in_executor(
+                            executor, put, sftp, job))
+                    finally:
+                        idle.put_nowait(sftp)
+            
+            await asyncio.gather(*(upload(job) for job in files))
+        return results, 0.0
+    finally:
+        for sftp in sftp_channels:
+            sftp.close()
+
+def async_upload_tree(ssh, host, port, username, password, local_path,
+                      remote_dir, channels=4, inflight=64,
+                      block_size=ASYNC_BLOCK_SIZE, inventory=None,
+                      transport_options=None):
+    """Upload a tree with the asyncio backend.
+
+    Uses asyncssh when it is installed, keeping up to inflight SFTP write
+    requests outstanding across all files over channels SFTP sessions.
+    Without it, paramiko puts are scheduled from asyncio onto an executor,
+    which bounds in-flight files rather than individual writes.
+
+    asyncssh cannot share ssh's paramiko transport, so it opens its own
+    connection with transport_options applied (see asyncssh_options).
+
+    Returns (elapsed, per-file results, backend name, handshake seconds);
+    the asyncssh handshake is not in elapsed.
+    """
+    start = time.time()
+    remote_dir = remote_dir.replace('\\', '/')
+    dirs, files = build_upload_plan(local_path, remote_dir, inventory=inventory)
+    channels = max(1, min(channels, len(files)))
+    backend = 'asyncssh' if asyncssh is not None else 'paramiko-executor'
+    print(f"Uploading {len(files)} files with the {backend} backend "
+          f"({channels} channels, {inflight} requests in flight)...")
+    
+    if asyncssh is not None:
+        coroutine = _async_upload_asyncssh(host, port, username, password, dirs,
+                                           files, channels, inflight,
+                                           block_size, transport_options)
+    else:
+        coroutine = _async_upload_paramiko(ssh.get_transport(), dirs, files,
+                                           channels, inflight)
+    results, handshake_time = asyncio.run(coroutine)
+    return time.time() - start - handshake_time, results, backend, handshake_time
+
+def file_sha256(path):
+    """Return the hex SHA-256 of a local file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def default_manifest_path(host, remote_dir, test_name):
+    """Return the manifest cache file of a method, host and remote directory."""
+    key = hashlib.sha1(f"{host}:{remote_dir}:{test_name}".encode())
+    return os.path.join(STATE_DIR, 'manifests', f"{key.hexdigest()[:16]}.json")
+
+def method_manifest_path(manifest_path, test_name):
+    """Return the file a method keeps its part of a given manifest path in.
+
+    Each method tracks what it synced itself, e.g. 'sync.json' becomes
+    'sync.zip.json' for the ZIP test, so a comparison run does not leave
+    the second method with nothing to upload.
+    """
+    root, ext = os.path.splitext(manifest_path)
+    return f"{root}.{test_name.split()[0].lower()}{ext or '.json'}"
+
+def load_manifest(manifest_path):
+    """Load a sync manifest, returning an empty one if missing or unreadable."""
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get('files'), dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'files': {}}
+
+def save_manifest(manifest_path, manifest):
+    """Write a sync manifest atomically."""
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def scan_local_state(local_folder, cached_files, inventory=None):
+    """Return ({rel_path: {size, mtime, sha256}}, hashes computed).
+
+    Hashes are reused from the cached manifest when size and mtime match, so
+    only new or touched files are read. Sizes and mtimes come from inventory
+    (a scan_tree result) when given.
+    """
+    if inventory is None:
+        inventory = scan_tree(local_folder)
+    state = {}
+    hashed = 0
+    for entry in inventory['files']:
+        cached = cached_files.get(entry.rel_path)
+        if (cached and cached['size'] == entry.size
+                and cached['mtime'] == entry.mtime):
+            digest = cached['sha256']
+        else:
+            digest = file_sha256(entry.path)
+            hashed += 1
+        state[entry.rel_path] = {'size': entry.size, 'mtime': entry.mtime,
+                                 'sha256': digest}
+    return state, hashed
+
+def walk_remote_files(sftp, remote_root):
+    """Return {rel_path: size} for every file under remote_root.
+
+    Uses one listdir_attr round-trip per directory instead of a stat per file.
+    Delta signature caches are not part of the tree and are left out.
+    """
+    remote_files = {}
+    pending = ['']
+    while pending:
+        rel_dir = pending.pop()
+        remote_dir = remote_root + ('/' + rel_dir if rel_dir else '')
+        try:
+            entries = sftp.listdir_attr(remote_dir)
+        except IOError:
+            continue
+        for entry in entries:
+            rel_path = (rel_dir + '/' if rel_dir else '') + entry.filename
+            if stat.S_ISDIR(entry.st_mode or 0):
+                pending.append(rel_path)
+            elif not entry.filename.endswith(DELTA_SIGNATURE_SUFFIX):
+                remote_files[rel_path] = entry.st_size
+    return remote_files
+
+def plan_incremental_sync(sftp, local_folder, remote_dir, manifest_path,
+                          inventory=None):
+    """Compare local files against the manifest and remote tree.
+
+    A file needs uploading when it is missing remotely, has a different
+    remote size, or its content hash differs from the last synced one.
+    Remote files with no local counterpart are returned as deletions.
+    """
+    start = time.time()
+    remote_root = remote_dir.replace('\\', '/').rstrip('/')
+    manifest = load_manifest(manifest_path)
+    synced = manifest['files']
+    local_state, hashed = scan_local_state(local_folder, synced, inventory)
+    remote_files = walk_remote_files(sftp, remote_root)
+    
+    changed = []
+    for rel_path, entry in sorted(local_state.items()):
+        previous = synced.get(rel_path)
+        if (remote_files.get(rel_path) != entry['size'] or previous is None
+                or previous['sha256'] != entry['sha256']):
+            changed.append(rel_path)
+    deleted = sorted(set(remote_files) - set(local_state))
+    
+    plan = {
+        'local_state': local_state,
+        'changed': changed,
+        'deleted': deleted,
+        'unchanged': len(local_state) - len(changed),
+        'hashed': hashed,
+        'plan_time': time.time() - start
+    }
+    print(f"Sync plan: {len(changed)} changed, {plan['unchanged']} unchanged, "
+          f"{len(deleted)} remote-only ({hashed} files hashed, "
+          f"{plan['plan_time']:.2f} seconds)")
+    return plan
+
+def delete_remote_files(sftp, remote_dir, rel_paths):
+    """Remove remote files that no longer exist locally; return the count removed."""
+    remote_root = remote_dir.replace('\\', '/').rstrip('/')
+    removed = 0
+    for rel_path in rel_paths:
+        try:
+            sftp.remove(remote_root + '/' + rel_path)
+            removed += 1
+        except IOError as e:
+            print(f"  ✗ Could not delete {rel_path}: {e}")
+            continue
+        with contextlib.suppress(IOError):
+            sftp.remove(remote_root + '/' + rel_path + DELTA_SIGNATURE_SUFFIX)
+    return removed
+
+def finish_incremental_sync(manifest_path, plan, host, remote_dir, success):
+    """Record the synced state; on failure changed files stay unsynced."""
+    files = plan['local_state']
+    if not success:
+        changed = set(plan['changed'])
+        previous = load_manifest(manifest_path)['files']
+        files = {rel_path: (previous[rel_path] if rel_path in changed else entry)
+                 for rel_path, entry in files.items()
+                 if rel_path not in changed or rel_path in previous}
+    save_manifest(manifest_path, {
+        'host': host,
+        'remote_dir': remote_dir,
+        'updated': time.time(),
+        'files': files
+    })
+
+def complete_sync(sftp, plan, manifest_path, host, remote_dir, delete,
+                  success):
+    """Apply optional deletions, save the manifest and return result fields."""
+    deleted = 0
+    if delete and plan['deleted']:
+        print(f"Deleting {len(plan['deleted'])} remote-only files...")
+        deleted = delete_remote_files(sftp, remote_dir, plan['deleted'])
+    finish_incremental_sync(manifest_path, plan, host, remote_dir, success)
+    return {
+        'sync': True,
+        'sync_plan_time': plan['plan_time'],
+        'changed_files': len(plan['changed']),
+        'unchanged_files': plan['unchanged'],
+        'deleted_files': deleted
+    }
+
+# Long-lived PowerShell reading one command per line from stdin
+SHELL_COMMAND = 'powershell -NoLogo -NoProfile -NonInteractive -Command -'
+
+# Run first in the shell: cmdlet errors become catchable, progress bars
+# (which Expand-Archive would stream as CLIXML) are dropped
+SHELL_SETUP = ("$ErrorActionPreference = 'Stop'; "
+               "$ProgressPreference = 'SilentlyContinue'")
+
+# Cheap command used to time a new process against the persistent shell
+SHELL_NOOP = 'powershell -Command "Write-Output \'ready\'"'
+
+class RemoteShell:
+    """One long-lived remote PowerShell process that runs framed commands.
+
+    Each command is written to the shell's stdin as a single line, wrapped
+    so that after its output the shell prints a marker line with the exit
+    status, and replies are read back in order. run_batch writes several
+    commands at once, so they cost one round trip instead of one each.
+    Commands are PowerShell script or native command lines; the
+    'powershell -Command "..."' strings of the exec helpers are unwrapped.
+    stderr arrives merged into the output. startup_time is the time to
+    start the process, and commands counts what ran through it.
+    """
+    
+    def __init__(self, ssh):
+        start = time.time()
+        self.ssh = ssh
+        self.marker = f"__end_{uuid.uuid4().hex}__"
+        self._reply = re.compile(re.escape(self.marker).encode() +
+                                 rb' (-?\d+)\r?\n')
+        self._buffer = b''
+        self._lock = threading.Lock()
+        self.commands = 0
+        self.channel = ssh.get_transport().open_session()
+        self.channel.set_combine_stderr(True)
+        self.channel.exec_command(SHELL_COMMAND)
+        self.run(SHELL_SETUP)
+        self.startup_time = time.time() - start
+        self.commands = 0
+    
+    def _frame(self, command):
+        match = re.match(r'^powershell(?:\.exe)? -Command "(.*)"$', command, re.S)
+        script = match.group(1) if match else command
+        return (f'$global:LASTEXITCODE = 0; try {{ {script}; '
+                f'$s = $LASTEXITCODE }} catch {{ Write-Output '
+                f'$_.Exception.Message; $s = 1 }}; '
+                f'Write-Output "{self.marker} $s"\n')
+    
+    def _read_reply(self):
+        while True:
+            match = self._reply.search(self._buffer)
+            if match:
+                output = self._buffer[:match.start()]
+                self._buffer = self._buffer[match.end():]
+                return int(match.group(1)), output.decode(errors='replace')
+            data = self.channel.recv(65536)
+            if not data:
+                raise IOError("remote shell exited")
+            self._buffer += data
+    
+    def run_batch(self, commands):
+        """Run commands in turn, sent together; return [(status, output)]."""
+        with self._lock:
+            self.channel.sendall(''.join(self._frame(command)
+                                         for command in commands).encode())
+            replies = [self._read_reply() for _ in commands]
+            self.commands += len(commands)
+            return replies
+    
+    def run(self, command):
+        """Run one command and return (exit status, output)."""
+        return self.run_batch([command])[0]
+    
+    def is_alive(self):
+        return not (self.channel.closed or self.channel.exit_status_ready())
+    
+    def close(self):
+        try:
+            self.channel.shutdown_write()
+        except (OSError, EOFError):
+            pass
+        self.channel.close()
+
+def run_remote(ssh, cmd, **fields):
+    """Run a command over a RemoteShell, or a new exec channel of an SSHClient.
+
+    fields label the instrumented 'exec' operation. Returns (exit status,
+    stdout, stderr); over a shell stderr is part of stdout, and both hold
+    the merged output.
+    """
+    with instrument('exec', **fields):
+        if isinstance(ssh, RemoteShell):
+            exit_status, output = ssh.run(cmd)
+            return exit_status, output, output
+        stdin, stdout, stderr = ssh.exec_command(cmd)
+        exit_status = stdout.channel.recv_exit_status()
+    return (exit_status, stdout.read().decode(errors='replace'),
+            stderr.read().decode(errors='replace'))
+
+def measure_command_overhead(ssh, shell, repeats=2):
+    """Return the seconds a new remote process costs over a shell command.
+
+    SHELL_NOOP is run repeats times each way and the medians compared.
+    """
+    exec_times = []
+    shell_times = []
+    for _ in range(repeats):
+        start = time.time()
+        run_remote(ssh, SHELL_NOOP, command='noop')
+        exec_times.append(time.time() - start)
+        start = time.time()
+        run_remote(shell, SHELL_NOOP, command='noop')
+        shell_times.append(time.time() - start)
+    return max(statistics.median(exec_times) -
+               statistics.median(shell_times), 0.0)
+
+def create_dir_command(remote_dir):
+    """Return the PowerShell command that creates a missing remote directory."""
+    # Convert Windows path to Unix-style for PowerShell
+    remote_dir_unix = remote_dir.replace('\\', '/')
+    return (
+        f'powershell -Command "if (!(Test-Path \'{remote_dir_unix}\')) {{ '
+        f'New-Item -ItemType Directory -Path \'{remote_dir_unix}\' -Force }}; '
+        f'Write-Host \'Directory ready: {remote_dir_unix}\'"'
+    )
+
+def clear_dir_command(remote_dir):
+    """Return the PowerShell command that removes a remote directory tree."""
+    remote_dir_unix = remote_dir.replace('\\', '/')
+    return (
+        f'powershell -Command "if (Test-Path \'{remote_dir_unix}\') {{ '
+        f'Remove-Item -Path \'{remote_dir_unix}\' -Recurse -Force }}; '
+        f'Write-Host \'Directory cleared: {remote_dir_unix}\'"'
+    )
+
+def _report_dir_command(exit_status, stdout, stderr, action):
+    if exit_status != 0:
+        print(f"Warning: Could not {action} remote directory: {stderr.strip()}")
+        return False
+    print(stdout.strip())
+    return True
+
+def create_remote_dir(ssh, remote_dir):
+    """Create remote directory if it doesn't exist.
+
+    ssh is an SSHClient or a RemoteShell, as for every remote command.
+    """
+    return _report_dir_command(
+        *run_remote(ssh, create_dir_command(remote_dir), command='create'),
+        'create')
+
+def clear_remote_directory(ssh, remote_dir):
+    """Clear the remote directory completely."""
+    return _report_dir_command(
+        *run_remote(ssh, clear_dir_command(remote_dir), command='clear'),
+        'clear')
+
+def reset_remote_dir(ssh, remote_dir):
+    """Clear and recreate the remote directory.
+
+    Over a RemoteShell both commands are sent as one batch, costing a
+    single round trip.
+    """
+    print(f"Clearing remote directory: {remote_dir}")
+    if not isinstance(ssh, RemoteShell):
+        clear_remote_directory(ssh, remote_dir)
+        print(f"Creating remote directory: {remote_dir}")
+        return create_remote_dir(ssh, remote_dir)
+    print(f"Creating remote directory: {remote_dir}")
+    with instrument('exec', command='clear+create'):
+        replies = ssh.run_batch([clear_dir_command(remote_dir),
+                                 create_dir_command(remote_dir)])
+    return all([_report_dir_command(exit_status, output, output, action)
+                for (exit_status, output), action
+                in zip(replies, ('clear', 'create'))])
+
+# Remote extraction backends: name -> (availability probe, extract command).
+# Commands are formatted with the remote archive and destination paths.
+EXTRACTORS = {
+    'expand-archive': (
+        'powershell -Command "Get-Command Expand-Archive"',
+        'powershell -Command "Expand-Archive -Path {archive} '
+        '-DestinationPath {dest} -Force"'
+    ),
+    'dotnet': (
+        'powershell -Command "Add-Type -AssemblyName '
+        'System.IO.Compression.FileSystem"',
+        # ExtractToDirectory cannot overwrite on Windows PowerShell 5.1, so
+        # entries are extracted one by one
+        'powershell -Command "Add-Type -AssemblyName '
+        'System.IO.Compression.FileSystem; '
+        '$z = [System.IO.Compression.ZipFile]::OpenRead(\'{archive}\'); '
+        'try {{ foreach ($e in $z.Entries) {{ '
+        '$p = [System.IO.Path]::Combine(\'{dest}\', $e.FullName); '
+        'if ($e.Name) {{ [void][System.IO.Directory]::CreateDirectory('
+        '[System.IO.Path]::GetDirectoryName($p)); '
+        '[System.IO.Compression.ZipFileExtensions]::ExtractToFile('
+        '$e, $p, $true) }} '
+        'else {{ [void][System.IO.Directory]::CreateDirectory($p) }} }} }} '
+        'finally {{ $z.Dispose() }}"'
+    ),
+    'tar': ('tar --version', 'tar -xf "{archive}" -C "{dest}"'),
+    '7z': ('7z i', '7z x -y "-o{dest}" "{archive}"'),
+    'unzip': ('unzip -v', "unzip -o -q '{archive}' -d '{dest}'")
+}
+
+# Order in which --extractor auto tries backends before any has been timed
+EXTRACTOR_PREFERENCE = ('tar', '7z', 'dotnet', 'unzip', 'expand-archive')
+
+# C# helper uploaded next to the remote directory for delta transfers:
+# Signature prints '<adler32>:<md5>' per block of a file, Apply rebuilds a
+# file in place from a delta written by write_delta
+DELTA_HELPER_SOURCE = r'''
+using System;
+using System.IO;
+using System.Security.Cryptography;
+using System.Text;
+
+public static class UploadDelta
+{
+    static int Fill(Stream stream, byte[] buffer)
+    {
+        int total = 0, n;
+        while (total < buffer.Length &&
+               (n = stream.Read(buffer, total, buffer.Length - total)) > 0)
+            total += n;
+        return total;
+    }
+
+    static void Copy(Stream source, Stream target, long length, byte[] buffer,
+                     HashAlgorithm hash)
+    {
+        while (length > 0)
+        {
+            int n = source.Read(buffer, 0, (int)Math.Min(buffer.Length, length));
+            if (n == 0)
+                break;
+            target.Write(buffer, 0, n);
+            hash.TransformBlock(buffer, 0, n, null, 0);
+            length -= n;
+        }
+    }
+
+    public static string Signature(string path, int blockSize)
+    {
+        var text = new StringBuilder();
+        var block = new byte[blockSize];
+        using (var md5 = MD5.Create())
+        using (var file = File.OpenRead(path))
+        {
+            int n;
+            while ((n = Fill(file, block)) > 0)
+            {
+                uint a = 1, b = 0;
+                for (int i = 0; i < n; i++)
+                {
+                    a = (a + block[i]) % 65521;
+                    b = (b + a) % 65521;
+                }
+                text.Append(((b << 16) | a).ToString("x8")).Append(':');
+                foreach (byte x in md5.ComputeHash(block, 0, n))
+                    text.Append(x.ToString("x2"));
+                text.Append('\n');
+            }
+        }
+        return text.ToString();
+    }
+
+    public static void Apply(string path, string deltaPath)
+    {
+        string output = path + ".delta-new";
+        var buffer = new byte[1 << 20];
+        try
+        {
+            using (var basis = File.OpenRead(path))
+            using (var delta = new BinaryReader(File.OpenRead(deltaPath)))
+            using (var target = File.Create(output))
+            using (var sha256 = SHA256.Create())
+            {
+                if (Encoding.ASCII.GetString(delta.ReadBytes(8)) != "UPDELTA2")
+                    throw new InvalidDataException("not a delta file: " + deltaPath);
+                long blockSize = delta.ReadUInt32();
+                long size = delta.ReadInt64();
+                string expected = Convert.ToBase64String(delta.ReadBytes(32));
+                Stream ops = delta.BaseStream;
+                while (ops.Position < ops.Length)
+                {
+                    int op = ops.ReadByte();
+                    if (op == 'C')
+                    {
+                        long index = delta.ReadUInt32(), count = delta.ReadUInt32();
+                        basis.Position = index * blockSize;
+                        Copy(basis, target, count * blockSize, buffer, sha256);
+                    }
+                    else if (op == 'L')
+                        Copy(ops, target, delta.ReadUInt32(), buffer, sha256);
+                    else
+                        throw new InvalidDataException("bad delta op " + op);
+                }
+                if (target.Length != size)
+                    throw new InvalidDataException("rebuilt file has the wrong size");
+                sha256.TransformFinalBlock(buffer, 0, 0);
+                if (Convert.ToBase64String(sha256.Hash) != expected)
+                    throw new InvalidDataException("rebuilt file does not match the delta hash");
+            }
+        }
+        catch
+        {
+            // The old file is left untouched for the caller to replace whole
+            File.Delete(output);
+            throw;
+        }
+        File.Delete(path);
+        File.Move(output, path);
+        File.Delete(deltaPath);
+    }
+}
+'''
+
+# Loads the helper into the PowerShell session (once, if it is persistent)
+_DELTA_LOAD = ("if (-not ('UploadDelta' -as [type])) {{ Add-Type "
+               "-TypeDefinition ([IO.File]::ReadAllText('{helper}')) }}; ")
+DELTA_SIGNATURE_COMMAND = ('powershell -Command "' + _DELTA_LOAD +
+                           "[UploadDelta]::Signature('{path}', {block_size})\"")
+DELTA_APPLY_COMMAND = ('powershell -Command "' + _DELTA_LOAD +
+                       "[UploadDelta]::Apply('{path}', '{delta}')\"")
+
+def ssh_unzip(ssh, remote_zip, remote_dest, extractor='expand-archive'):
+    """Extract a remote zip with one of the EXTRACTORS backends."""
+    unzip_cmd = EXTRACTORS[extractor][1].format(archive=remote_zip,
+                                                dest=remote_dest)
+    exit_status, stdout, stderr = run_remote(ssh, unzip_cmd, command='unzip',
+                                             extractor=extractor)
+    if exit_status != 0:
+        print("Unzip failed:", stderr)
+        return False
+    else:
+        print("Unzip succeeded.")
+        return True
+
+def ssh_unzip_parallel(ssh, remote_zips, remote_dest, extractor='expand-archive'):
+    """Extract several archives into remote_dest at once, one remote process each."""
+    if len(remote_zips) == 1:
+        return ssh_unzip(ssh, remote_zips[0], remote_dest, extractor)
+    if isinstance(ssh, RemoteShell):
+        # A shell runs one command at a time; these need processes of their own
+        ssh = ssh.ssh
+    with ThreadPoolExecutor(max_workers=len(remote_zips)) as executor:
+        outcomes = list(executor.map(
+            lambda remote_zip: ssh_unzip(ssh, remote_zip, remote_dest,
+                                         extractor),
+            remote_zips))
+    return all(outcomes)
+
+def detect_extractors(ssh):
+    """Return the EXTRACTORS backends available on the server.
+
+    All probes run concurrently; the result is in EXTRACTOR_PREFERENCE order.
+    """
+    def probe(name):
+        with instrument('exec', command='probe', extractor=name):
+            stdin, stdout, stderr = ssh.exec_command(EXTRACTORS[name][0])
+            return stdout.channel.recv_exit_status() == 0
+    
+    with ThreadPoolExecutor(max_workers=len(EXTRACTOR_PREFERENCE)) as executor:
+        found = list(executor.map(probe, EXTRACTOR_PREFERENCE))
+    return [name for name, ok in zip(EXTRACTOR_PREFERENCE, found) if ok]
+
+def time_extractors(ssh, remote_zip, remote_dest, extractors):
+    """Time each backend extracting remote_zip into a scratch directory.
+
+    Each scratch directory is a sibling of remote_dest and is removed
+    again. Returns {name: seconds}, with None for backends that failed.
+    """
+    scratch_root = remote_dest.replace('\\', '/').rstrip('/')
+    times = {}
+    for name in extractors:
+        scratch = f"{scratch_root}_extract_{name}"
+        create_remote_dir(ssh, scratch)
+        start = time.time()
+        success = ssh_unzip(ssh, remote_zip, scratch, name)
+        times[name] = time.time() - start if success else None
+        print(f"  {name}: " + (f"{times[name]:.2f} seconds" if success
+                               else "failed"))
+        clear_remote_directory(ssh, scratch)
+    return times
+
+def available_extractors(pool):
+    """Return the EXTRACTORS backends the server has, detected once per pool."""
+    info = pool.target_info
+    if 'extractors' not in info:
+        info['extractors'] = detect_extractors(pool.client())
+        print(f"Available extractors: "
+              f"{', '.join(info['extractors']) or 'none'}")
+    return info['extractors']
+
+def resolve_extractor(pool, remote_zip=None, remote_dest=None, candidates=None):
+    """Pick the backend for extractor 'auto', remembering it in pool.target_info.
+
+    Only available backends that are also in candidates (all by default)
+    are considered. Given an uploaded archive, every one of them is timed
+    on it and the fastest is kept for the rest of the run; until then the
+    first one in EXTRACTOR_PREFERENCE is used. Returns (name, times or None).
+    """
+    available = [name for name in available_extractors(pool)
+                 if candidates is None or name in candidates]
+    chosen = pool.target_info.setdefault('extractor', {})
+    key = tuple(available)
+    if key in chosen:
+        return chosen[key], None
+    if not available:
+        return (candidates or ('expand-archive',))[0], None
+    if len(available) == 1:
+        chosen[key] = available[0]
+        return available[0], None
+    if remote_zip is None:
+        return available[0], None
+    
+    print("Timing extractors on the uploaded archive...")
+    times = time_extractors(pool.commands(), remote_zip, remote_dest,
+                            available)
+    timed = {name: seconds for name, seconds in times.items()
+             if seconds is not None}
+    if not timed:
+        return available[0], times
+    chosen[key] = min(timed, key=timed.get)
+    print(f"Fastest extractor: {chosen[key]}")
+    return chosen[key], times
+
+def detect_tar_codecs(ssh):
+    """Return the tar codecs ('zstd', 'lz4') the server's tar can unpack."""
+    stdin, stdout, stderr = ssh.exec_command('tar --version')
+    if stdout.channel.recv_exit_status() != 0:
+        return set()
+    version = stdout.read().decode(errors='replace')
+    if 'libarchive' in version:
+        # bsdtar (also the one bundled with Windows) lists its libraries
+        return {name for name, library in (('zstd', 'libzstd'),
+                                           ('lz4', 'liblz4'))
+                if library in version}
+    # GNU tar runs the external compressor
+    supported = set()
+    for name in ('zstd', 'lz4'):
+        stdin, stdout, stderr = ssh.exec_command(f'{name} --version')
+        if stdout.channel.recv_exit_status() == 0:
+            supported.add(name)
+    return supported
+
+def codec_extractors(codec, pool=None):
+    """Return the EXTRACTORS backends able to unpack a codec's archives.
+
+    The tar codecs also need a remote tar that supports them, which is
+    checked over pool once per pool; without a pool it is assumed.
+    """
+    name, _ = parse_codec(codec)
+    info = CODECS[name]
+    if info.compression is None and pool is not None:
+        if 'tar_codecs' not in pool.target_info:
+            pool.target_info['tar_codecs'] = detect_tar_codecs(pool.client())
+        if name not in pool.target_info['tar_codecs']:
+            return ()
+    return info.extractors
+
+def measure_bandwidth(sftp, remote_dir, size=BANDWIDTH_PROBE_SIZE):
+    """Upload size random bytes into remote_dir and return bytes per second."""
+    remote_probe = remote_dir.replace('\\', '/').rstrip('/') + '/.bandwidth_probe'
+    data = io.BytesIO(os.urandom(size))
+    start = time.time()
+    sftp.putfo(data, remote_probe)
+    elapsed = time.time() - start
+    sftp.remove(remote_probe)
+    return size / elapsed if elapsed > 0 else float('inf')
+
+def sample_tree(inventory, size=CODEC_SAMPLE_SIZE,
+                file_limit=CODEC_SAMPLE_FILE_LIMIT, seed=0):
+    """Copy the heads of randomly chosen files into a temporary directory.
+
+    Files are drawn until about size bytes are collected, at most
+    file_limit bytes from each. Returns the directory; the caller removes it.
+    """
+    sample_dir = tempfile.mkdtemp(prefix='codec_sample_')
+    files = list(inventory['files'])
+    random.Random(seed).shuffle(files)
+    collected = 0
+    for entry in files:
+        if collected >= size:
+            break
+        with open(entry.path, 'rb') as f:
+            data = f.read(min(file_limit, size - collected))
+        target = os.path.join(sample_dir, *entry.rel_path.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+        collected += len(data)
+    return sample_dir
+
+def _read_archive(data, codec):
+    """Decompress every member of an in-memory archive, discarding the output."""
+    name, _ = parse_codec(codec)
+    if CODECS[name].compression is not None:
+        with zipfile.ZipFile(io.BytesIO(data)) as zipf:
+            for member in zipf.infolist():
+                zipf.read(member)
+        return
+    if name == 'zstd':
+        stream = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data))
+    else:
+        stream = lz4.frame.LZ4FrameFile(io.BytesIO(data), 'rb')
+    with stream, tarfile.open(fileobj=stream, mode='r|') as tar:
+        for member in tar:
+            if member.isfile():
+                tar.extractfile(member).read()
+
+def choose_codec(pool, inventory, remote_dir, extractor='expand-archive',
+                 zip_workers=1, seed=0):
+    """Pick the codec with the lowest predicted compress + transfer + extract time.
+
+    Every codec in CODEC_CANDIDATES that can be written locally and
+    unpacked by the extractor (any available one for 'auto') compresses a
+    sample of the tree (see sample_tree). Its ratio and speed, with the
+    link bandwidth measured by measure_bandwidth, predict the time for the
+    whole tree; local decompression speed stands in for the remote
+    extraction speed. The choice is kept in pool.target_info, so a run
+    samples only once. Returns a dict with 'codec', 'bandwidth' (bytes per
+    second), 'sample_size' and a 'candidates' list of predictions.
+    """
+    if 'codec' in pool.target_info:
+        return pool.target_info['codec']
+    extractors = (available_extractors(pool) if extractor == 'auto'
+                  else [extractor])
+    candidates = [codec for codec in CODEC_CANDIDATES
+                  if codec_available(codec) and
+                  set(codec_extractors(codec, pool)) & set(extractors)]
+    if not candidates:
+        candidates = ['deflate']
+    
+    print("Choosing a codec: measuring bandwidth and compressing a sample...")
+    create_remote_dir(pool.commands(), remote_dir)
+    sftp = pool.open_sftp()
+    try:
+        bandwidth = measure_bandwidth(sftp, remote_dir)
+    finally:
+        sftp.close()
+    
+    sample_dir = sample_tree(inventory, seed=seed)
+    try:
+        sample_size = scan_tree(sample_dir)['total_size'] or 1
+        total_size = inventory['total_size']
+        predictions = []
+        for codec in candidates:
+            name, _ = parse_codec(codec)
+            # Parallel deflate and zstd threads spread compression over cores
+            speedup = (min(zip_workers, os.cpu_count() or 1)
+                       if name in ('deflate', 'zstd') else 1)
+            buffer = io.BytesIO()
+            start = time.perf_counter()
+            write_archive(sample_dir, buffer, codec)
+            compress_time = time.perf_counter() - start
+            start = time.perf_counter()
+            _read_archive(buffer.getvalue(), codec)
+            extract_time = time.perf_counter() - start
+            
+            ratio = len(buffer.getvalue()) / sample_size
+            scale = total_size / sample_size
+            predicted = {
+                'compress': compress_time * scale / speedup,
+                'transfer': total_size * ratio / bandwidth,
+                'extract': extract_time * scale
+            }
+            predicted['total'] = sum(predicted.values())
+            predictions.append({'codec': codec, 'ratio': ratio,
+                                'predicted': predicted})
+    finally:
+        shutil.rmtree(sample_dir, ignore_errors=True)
+    
+    best = min(predictions,
+               key=lambda prediction: prediction['predicted']['total'])
+    choice = {
+        'codec': best['codec'],
+        'bandwidth': bandwidth,
+        'sample_size': sample_size,
+        'candidates': predictions
+    }
+    pool.target_info['codec'] = choice
+    print_codec_choice(choice)
+    return choice
+
+def print_codec_choice(choice):
+    """Print the predictions behind an automatic codec choice."""
+    print(f"  Link bandwidth: {choice['bandwidth'] / (1024 * 1024):.2f} MB/s, "
+          f"sample: {choice['sample_size'] / (1024 * 1024):.1f} MB")
+    print(f"  {'codec':<10} {'ratio':>6} {'compress':>9} {'transfer':>9} "
+          f"{'extract':>8} {'total':>8}")
+    for prediction in choice['candidates']:
+        predicted = prediction['predicted']
+        marker = '  <- chosen' if prediction['codec'] == choice['codec'] else ''
+        print(f"  {prediction['codec']:<10} {prediction['ratio']:>6.3f} "
+              f"{predicted['compress']:>8.2f}s {predicted['transfer']:>8.2f}s "
+              f"{predicted['extract']:>7.2f}s {predicted['total']:>7.2f}s"
+              f"{marker}")
+
+class ZipStreamPipe:
+    """Bounded in-memory pipe that zipfile writes into while a sender drains it.
+
+    The pipe is deliberately not seekable, so zipfile falls back to data
+    descriptors and never needs to rewind over bytes already sent.
+    """
+
+    def __init__(self, chunk_size=256 * 1024, max_chunks=16):
+        self.chunk_size = chunk_size
+        self._queue = queue.Queue(max_chunks)
+        self._buffer = bytearray()
+        self.error = None
+        self.bytes_sent = 0
+        self.blocked_time = 0.0
+        self.send_time = 0.0
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            self._push(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Hand over any buffered bytes and signal end of stream."""
+        if self._buffer:
+            self._push(bytes(self._buffer))
+            self._buffer.clear()
+        self._push(None)
+
+    def abort(self):
+        """Stop the sender without completing the archive."""
+        if self.error is None:
+            self._queue.put(None)
+
+    def _push(self, item):
+        start = time.time()
+        try:
+            while True:
+                if self.error is not None:
+                    raise IOError(f"Streaming upload failed: {self.error}")
+                try:
+                    self._queue.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+        finally:
+            # Time spent waiting on a full pipe is upload time, not zip time
+            self.blocked_time += time.time() - start
+
+    def drain(self, remote_file):
+        """Sender thread body: write queued chunks until the stream ends."""
+        try:
+            while True:
+                chunk = self._queue.get()
+                if chunk is None:
+                    return
+                start = time.time()
+                remote_file.write(chunk)
+                self.send_time += time.time() - start
+                self.bytes_sent += len(chunk)
+                record_transfer(len(chunk))
+        except Exception as e:
+            self.error = e
+            # Unblock the producer, which will see the error on its next push
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+def stream_zip_upload(sftp, local_path, remote_zip, inventory=None,
+                      codec='deflate'):
+    """Zip local_path straight into a remote file, overlapping compression and upload.
+
+    codec is any of the CODECS. Returns a dict with the overlapped
+    wall-clock time and the time the zip and sender threads each spent
+    working.
+    """
+    print(f"Streaming zip of {local_path} -> {remote_zip}")
+    start = time.time()
+    sftp.get_channel().settimeout(300)
+    
+    with sftp.open(remote_zip, 'wb') as remote_file:
+        remote_file.set_pipelined(True)
+        pipe = ZipStreamPipe()
+        sender = threading.Thread(target=pipe.drain, args=(remote_file,))
+        sender.start()
+        try:
+            write_archive(local_path, pipe, codec, inventory=inventory)
+            pipe.close()
+        except Exception:
+            pipe.abort()
+            raise
+        finally:
+            zip_end = time.time()
+            sender.join()
+        if pipe.error is not None:
+            raise IOError(f"Streaming upload failed: {pipe.error}")
+    
+    # Closing the remote file waits for every pipelined write to be acked
+    remote_size = sftp.stat(remote_zip).st_size
+    if remote_size != pipe.bytes_sent:
+        raise IOError(f"size mismatch in streaming upload! "
+                      f"{remote_size} != {pipe.bytes_sent}")
+    
+    stream_time = time.time() - start
+    print(f"Streamed {pipe.bytes_sent / (1024*1024):.1f} MB "
+          f"in {stream_time:.2f} seconds")
+    return {
+        'stream_time': stream_time,
+        'zip_time': zip_end - start - pipe.blocked_time,
+        'upload_time': pipe.send_time,
+        'zip_size_mb': pipe.bytes_sent / (1024 * 1024)
+    }
+
+def remote_sha256(ssh, remote_path):
+    """Return the lowercase SHA-256 of a remote file, or None on failure."""
+    remote_path_unix = remote_path.replace('\\', '/')
+    hash_cmd = (
+        f'powershell -Command "(Get-FileHash -Algorithm SHA256 '
+        f'-LiteralPath \'{remote_path_unix}\').Hash"'
+    )
+    exit_status, stdout, stderr = run_remote(ssh, hash_cmd, command='hash')
+    if exit_status != 0:
+        print(f"Warning: Could not hash remote file: {stderr.strip()}")
+        return None
+    return stdout.strip().lower() or None
+
+# Threads hashing local files while an upload runs (see start_local_hashing)
+HASH_WORKERS = 4
+
+# Remote commands that hash a whole tree in one call: name -> (command,
+# skip). The command is formatted with the remote directory and skip, once
+# per file name in the root not to hash (the upload archives the run left
+# there), joined. Each prints a '<sha256> <relative path>' line per file.
+REMOTE_HASHERS = {
+    'powershell': (
+        'powershell -Command "$root = (Resolve-Path -LiteralPath \'{dir}\')'
+        '.Path.TrimEnd(\'\\\', \'/\'); '
+        'Get-ChildItem -LiteralPath $root -Recurse -File | '
+        'Where-Object {{ $_.DirectoryName -ne $root -or ($true{skip}) }} | '
+        'Get-FileHash -Algorithm SHA256 | '
+        'ForEach-Object {{ $_.Hash + \' \' + '
+        '$_.Path.Substring($root.Length + 1) }}"',
+        " -and $_.Name -ne '{name}'"
+    ),
+    'sha256sum': ("cd '{dir}' && find . -type f{skip} -exec sha256sum {{}} +",
+                  " ! -path './{name}'")
+}
+
+def parse_hash_lines(output):
+    """Parse '<sha256> <path>' lines into {'/'-separated rel_path: sha256}."""
+    hashes = {}
+    for line in output.splitlines():
+        digest, _, path = line.strip().partition(' ')
+        # sha256sum marks binary-mode files with '*'
+        path = path.strip().lstrip('*').replace('\\', '/')
+        if path.startswith('./'):
+            path = path[2:]
+        if len(digest) == 64 and path:
+            hashes[path] = digest.lower()
+    return hashes
+
+def remote_tree_hashes(ssh, remote_dir, hasher=None, skip=()):
+    """Hash every file under remote_dir with a single remote command.
+
+    Files in the root of remote_dir named in skip are left out. Tries
+    hasher, or each REMOTE_HASHERS command in turn, and returns (hasher
+    name, {rel_path: sha256}), or (None, None) if none works.
+    """
+    remote_dir_unix = remote_dir.replace('\\', '/').rstrip('/')
+    for name in ([hasher] if hasher else REMOTE_HASHERS):
+        command, skip_format = REMOTE_HASHERS[name]
+        exit_status, stdout, stderr = run_remote(
+            ssh, command.format(dir=remote_dir_unix, skip=''.join(
+                skip_format.format(name=file_name) for file_name in skip)),
+            command='hash-tree', hasher=name)
+        if exit_status == 0:
+            return name, parse_hash_lines(stdout)
+    return None, None
+
+def start_local_hashing(inventory, workers=HASH_WORKERS, known=None):
+    """Start hashing every inventory file in a thread pool.
+
+    Returns {rel_path: future of its SHA-256}; the hashing carries on in
+    the background while the caller uploads. Files in known, a
+    {rel_path: SHA-256} dict of hashes already taken this run, are not
+    read again.
+    """
+    known = known or {}
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {}
+    for entry in inventory['files']:
+        if entry.rel_path in known:
+            futures[entry.rel_path] = Future()
+            futures[entry.rel_path].set_result(known[entry.rel_path])
+        else:
+            futures[entry.rel_path] = executor.submit(file_sha256, entry.path)
+    # Queued hashes still run; the threads exit once they are done
+    executor.shutdown(wait=False)
+    return futures
+
+def verify_upload(pool, local_hashes, inventory, remote_dir, skip=()):
+    """Check an uploaded tree against local hashes and repair what differs.
+
+    Remote hashes for the whole tree come from one remote_tree_hashes
+    call, which leaves out the files named in skip (the upload archives in
+    the root of remote_dir). Files that are missing remotely or differ are re-uploaded over
+    SFTP, and if there were any the tree is hashed once more. Returns
+    'verify_time', 'verified_files', 'mismatched_files' (relative paths),
+    'reuploaded_files', 'hasher' and 'verified' (everything matches).
+    """
+    print("Verifying remote files against local hashes...")
+    start = time.time()
+    remote_root = remote_dir.replace('\\', '/').rstrip('/')
+    hasher = pool.target_info.get('hasher')
+    hasher, remote_hashes = remote_tree_hashes(pool.commands(), remote_root,
+                                               hasher, skip)
+    local = {rel_path: future.result()
+             for rel_path, future in local_hashes.items()}
+    if remote_hashes is None:
+        print("  ✗ No remote hash command worked, files not verified")
+        return {'verify_time': time.time() - start, 'verified_files': 0,
+                'mismatched_files': sorted(local), 'reuploaded_files': 0,
+                'hasher': None, 'verified': False}
+    pool.target_info['hasher'] = hasher
+    
+    mismatched = sorted(rel_path for rel_path, digest in local.items()
+                        if remote_hashes.get(rel_path) != digest)
+    remaining = mismatched
+    if mismatched:
+        print(f"  Re-uploading {len(mismatched)} missing or mismatched file(s)")
+        entries = {entry.rel_path: entry for entry in inventory['files']}
+        dir_cache = RemoteDirCache(known=[remote_root])
+        sftp = pool.open_sftp()
+        try:
+            jobs = []
+            for rel_path in mismatched:
+                remote_file = f"{remote_root}/{rel_path}"
+                dir_cache.ensure(sftp, remote_file.rsplit('/', 1)[0])
+                jobs.append((entries[rel_path].path, remote_file,
+                             entries[rel_path].size))
+            upload_files([sftp], jobs)
+        finally:
+            sftp.close()
+        _, remote_hashes = remote_tree_hashes(pool.commands(), remote_root,
+                                              hasher, skip)
+        remaining = [rel_path for rel_path in mismatched
+                     if (remote_hashes or {}).get(rel_path) != local[rel_path]]
+    
+    verify_time = time.time() - start
+    print(f"Verified {len(local)} files with {hasher}: "
+          f"{len(mismatched)} mismatched, "
+          f"{len(mismatched) - len(remaining)} repaired "
+          f"({verify_time:.2f} seconds)")
+    return {
+        'verify_time': verify_time,
+        'verified_files': len(local),
+        'mismatched_files': mismatched,
+        'reuploaded_files': len(mismatched),
+        'hasher': hasher,
+        'verified': not remaining
+    }
+
+# PowerShell statement materialising one duplicate $d from its source $s,
+# per dedup mode
+DEDUP_MODES = {
+    'copy': 'Copy-Item -LiteralPath $s -Destination $d -Force',
+    'hardlink': '[void](New-Item -ItemType HardLink -Path $d -Target $s -Force)'
+}
+
+# Longest replication command sent at once: Windows OpenSSH runs commands
+# through cmd.exe, which rejects lines over 8191 characters
+DEDUP_COMMAND_LIMIT = 8000
+
+def find_duplicates(inventory, workers=HASH_WORKERS):
+    """Group byte-identical files of an inventory, by size first, then SHA-256.
+
+    Only files sharing their size with another one are hashed. Returns
+    'files' (relative paths to upload: all but the duplicates), 'copies'
+    ((source, duplicate) relative path pairs, the source being the first
+    of its group in path order), 'digests' ({rel_path: SHA-256} of the
+    files hashed, for start_local_hashing), 'unique_bytes', 'saved_bytes'
+    and 'dedup_time'.
+    """
+    start = time.time()
+    by_size = {}
+    for entry in inventory['files']:
+        by_size.setdefault(entry.size, []).append(entry)
+    candidates = [entry for group in by_size.values() if len(group) > 1
+                  for entry in group]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = list(executor.map(lambda entry: file_sha256(entry.path),
+                                    candidates))
+    groups = {}
+    for entry, digest in zip(candidates, digests):
+        groups.setdefault((entry.size, digest), []).append(entry)
+    
+    copies = []
+    saved_bytes = 0
+    for group in groups.values():
+        group.sort(key=lambda entry: entry.rel_path)
+        copies.extend((group[0].rel_path, entry.rel_path) for entry in group[1:])
+        saved_bytes += group[0].size * (len(group) - 1)
+    duplicates = {duplicate for _, duplicate in copies}
+    dedup_time = time.time() - start
+    print(f"Dedup: {len(copies)} duplicate file(s), "
+          f"{saved_bytes / (1024 * 1024):.1f} MB not sent "
+          f"({dedup_time:.2f} seconds)")
+    return {
+        'files': [entry.rel_path for entry in inventory['files']
+                  if entry.rel_path not in duplicates],
+        'copies': sorted(copies, key=lambda pair: pair[1]),
+        'digests': {entry.rel_path: digest
+                    for entry, digest in zip(candidates, digests)},
+        'unique_bytes': inventory['total_size'] - saved_bytes,
+        'saved_bytes': saved_bytes,
+        'dedup_time': dedup_time
+    }
+
+def replicate_commands(remote_dir, copies, mode='copy'):
+    """Build batched commands that materialise duplicates from their sources.
+
+    Each command handles as many (source, duplicate) pairs as fit in
+    DEDUP_COMMAND_LIMIT characters, creating parent directories first.
+    """
+    root = remote_dir.replace('\\', '/').rstrip('/')
+    head = f'powershell -Command "$r = \'{root}\'; foreach ($p in @('
+    tail = (")) { $s, $d = $p -split '\\|'; $s = Join-Path $r $s; "
+            "$d = Join-Path $r $d; [void](New-Item -ItemType Directory "
+            f"-Force -Path (Split-Path $d)); {DEDUP_MODES[mode]} }}\"")
+    commands = []
+    batch = []
+    length = len(head) + len(tail)
+    for source, duplicate in copies:
+        # '|' cannot appear in Windows file names; quotes are doubled
+        pair = "'" + f"{source}|{duplicate}".replace("'", "''") + "'"
+        if batch and length + len(pair) + 1 > DEDUP_COMMAND_LIMIT:
+            commands.append(head + ','.join(batch) + tail)
+            batch = []
+            length = len(head) + len(tail)
+        batch.append(pair)
+        length += len(pair) + 1
+    if batch:
+        commands.append(head + ','.join(batch) + tail)
+    return commands
+
+def replicate_duplicates(ssh, remote_dir, plan, mode='copy'):
+    """Materialise a find_duplicates plan's duplicates on the remote side.
+
+    Returns the plan's counts with 'replicate_time', 'replicate_commands'
+    and 'replicated' (every command succeeded).
+    """
+    commands = replicate_commands(remote_dir, plan['copies'], mode)
+    print(f"Replicating {len(plan['copies'])} duplicate file(s) remotely "
+          f"({mode}, {len(commands)} command(s))...")
+    start = time.time()
+    replicated = True
+    for command in commands:
+        exit_status, stdout, stderr = run_remote(ssh, command,
+                                                 command='replicate',
+                                                 mode=mode)
+        if exit_status != 0:
+            print("Replication failed:", stderr or stdout)
+            replicated = False
+            break
+    replicate_time = time.time() - start
+    print(f"Replication time: {replicate_time:.2f} seconds")
+    return {
+        'dedup_mode': mode,
+        'duplicate_files': len(plan['copies']),
+        'dedup_saved_mb': plan['saved_bytes'] / (1024 * 1024),
+        'dedup_time': plan['dedup_time'],
+        'replicate_time': replicate_time,
+        'replicate_commands': len(commands),
+        'replicated': replicated
+    }
+
+def create_zip_file(local_path, workers=1, files=None, inventory=None,
+                    codec='deflate'):
+    """Create a zip file from the given local path and return the zip file path.
+
+    files optionally restricts a folder archive to those relative paths.
+    With a tar codec (see CODECS) the archive is a compressed tar instead.
+    """
+    temp_dir = tempfile.gettempdir()
+    suffix = CODECS[parse_codec(codec)[0]].suffix
+    zip_filename = f"upload_test_{int(time.time())}{suffix}"
+    zip_path = os.path.join(temp_dir, zip_filename)
+    
+    print(f"Creating zip file: {zip_path}")
+    write_archive(local_path, zip_path, codec, workers=workers, files=files,
+                  inventory=inventory)
+    
+    # Get zip file size for progress reporting
+    zip_size = os.path.getsize(zip_path)
+    print(f"Zip file created: {zip_size / (1024*1024):.1f} MB")
+    
+    return zip_path
+
+def create_zip_parts(local_path, parts, workers=1, files=None, inventory=None,
+                     codec='deflate'):
+    """Split local_path into up to parts zip files of similar input size.
+
+    Members are assigned largest first to the lightest part. files restricts
+    the archives like create_zip_file. Returns the local zip paths.
+    """
+    members = zip_members(local_path, files, inventory)
+    loads = [(0, index) for index in range(max(1, min(parts, len(members))))]
+    part_files = [[] for _ in loads]
+    for entry in sorted(members, key=lambda entry: entry.size, reverse=True):
+        load, index = heapq.heappop(loads)
+        part_files[index].append(entry.rel_path)
+        heapq.heappush(loads, (load + entry.size, index))
+    
+    stamp = int(time.time())
+    suffix = CODECS[parse_codec(codec)[0]].suffix
+    zip_paths = []
+    for index, rel_paths in enumerate(part_files):
+        zip_path = os.path.join(tempfile.gettempdir(),
+                                f"upload_test_{stamp}_part{index + 1}{suffix}")
+        write_archive(local_path, zip_path, codec, workers=workers,
+                      files=rel_paths, inventory=inventory)
+        zip_paths.append(zip_path)
+    total_mb = sum(os.path.getsize(path) for path in zip_paths) / (1024 * 1024)
+    print(f"Created {len(zip_paths)} zip parts: {total_mb:.1f} MB")
+    return zip_paths
+
+def prefer_algorithms(preferred, defaults):
+    """Order defaults with the preferred names first, in the given order."""
+    unknown = [name for name in preferred if name not in defaults]
+    if unknown:
+        raise ValueError(f"unsupported algorithm(s): {', '.join(unknown)}")
+    return tuple(preferred) + tuple(name for name in defaults
+                                    if name not in preferred)
+
+def transport_factory(transport_options):
+    """Return a paramiko transport_factory applying transport_options.
+
+    transport_options holds window_size and max_packet_size (bytes this
+    side advertises per channel; paramiko clamps them to its limits) and
+    ciphers and macs (names tried before paramiko's defaults). Uploads are
+    also bounded by the server's own window and packet size, so these
+    mainly matter where the server offers more than paramiko asks for.
+    """
+    def make_transport(sock, **kwargs):
+        transport = paramiko.Transport(
+            sock,
+            default_window_size=(transport_options.get('window_size') or
+                                 paramiko.common.DEFAULT_WINDOW_SIZE),
+            default_max_packet_size=(transport_options.get('max_packet_size') or
+                                     paramiko.common.DEFAULT_MAX_PACKET_SIZE),
+            **kwargs
+        )
+        security = transport.get_security_options()
+        if transport_options.get('ciphers'):
+            security.ciphers = prefer_algorithms(transport_options['ciphers'],
+                                                 security.ciphers)
+        if transport_options.get('macs'):
+            security.digests = prefer_algorithms(transport_options['macs'],
+                                                 security.digests)
+        return transport
+    return make_transport
+
+def asyncssh_options(transport_options):
+    """Return asyncssh.connect keyword arguments applying transport_options.
+
+    Mirrors transport_factory: window and packet sizes become the channel
+    defaults, and ciphers and macs are tried before asyncssh's defaults.
+    """
+    transport_options = transport_options or {}
+    options = {}
+    if transport_options.get('window_size'):
+        options['window'] = transport_options['window_size']
+    if transport_options.get('max_packet_size'):
+        options['max_pktsize'] = transport_options['max_packet_size']
+    if transport_options.get('ciphers'):
+        options['encryption_algs'] = '^' + ','.join(transport_options['ciphers'])
+    if transport_options.get('macs'):
+        options['mac_algs'] = '^' + ','.join(transport_options['macs'])
+    if transport_options.get('compress'):
+        options['compression_algs'] = ['zlib@openssh.com', 'zlib', 'none']
+    return options
+
+def describe_transport(transport_options):
+    """Return a one-line summary of SSH transport options."""
+    if not transport_options:
+        return "paramiko defaults"
+    parts = []
+    if transport_options.get('window_size'):
+        parts.append(f"window {transport_options['window_size'] // 1024} KB")
+    if transport_options.get('max_packet_size'):
+        parts.append(f"packet {transport_options['max_packet_size'] // 1024} KB")
+    if transport_options.get('ciphers'):
+        parts.append(f"cipher {'/'.join(transport_options['ciphers'])}")
+    if transport_options.get('macs'):
+        parts.append(f"mac {'/'.join(transport_options['macs'])}")
+    if transport_options.get('compress'):
+        parts.append("compression")
+    return ', '.join(parts) or "paramiko defaults"
+
+def connect_ssh(host, port, username, password, timeout=None,
+                transport_options=None):
+    """Open an authenticated SSH connection.
+
+    transport_options tunes the SSH transport (see transport_factory);
+    its compress entry turns on SSH-level zlib compression.
+    """
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    options = {}
+    if transport_options:
+        options = {'compress': bool(transport_options.get('compress')),
+                   'transport_factory': transport_factory(transport_options)}
+    ssh.connect(hostname=host, port=port, username=username,
+                password=password, timeout=timeout, **options)
+    return ssh
+
+class SSHSessionPool:
+    """Authenticated SSH connections shared by every phase of a run.
+
+    Connections are opened on first use and kept alive until close(), so
+    each phase gets SFTP and exec channels without paying for another
+    handshake. A connection whose transport has died is replaced on the
+    next request. Handshakes are timed separately in handshake_time, and
+    target_info holds what the tests learn about the server (such as the
+    fastest extractor) for the rest of the run. Every connection is opened
+    with transport_options (see connect_ssh). With persistent_shell,
+    commands() hands out one RemoteShell on the first connection, and
+    shell_time_saved() estimates what it saved over a process per command.
+    """
+    
+    def __init__(self, host, port, username, password, timeout=30,
+                 transport_options=None, persistent_shell=False):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.transport_options = transport_options or {}
+        self.clients = []
+        self.handshakes = 0
+        self.handshake_time = 0.0
+        self.reconnects = 0
+        self.target_info = {}
+        self.persistent_shell = persistent_shell
+        self.shell_startup = 0.0
+        self.command_overhead = None
+        self._shell = None
+        self._shell_commands = 0
+        self._lock = threading.Lock()
+        self._shell_lock = threading.Lock()
+    
+    def _connect(self):
+        start = time.time()
+        client = connect_ssh(self.host, self.port, self.username,
+                             self.password, timeout=self.timeout,
+                             transport_options=self.transport_options)
+        self.add_handshake(time.time() - start)
+        return client
+    
+    def add_handshake(self, seconds):
+        """Account for a handshake made outside the pool (e.g. asyncssh)."""
+        self.handshakes += 1
+        self.handshake_time += seconds
+    
+    def _is_alive(self, client):
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+    
+    def client(self, index=0):
+        """Return live connection number index, connecting if needed."""
+        with self._lock:
+            while len(self.clients) <= index:
+                self.clients.append(self._connect())
+            if not self._is_alive(self.clients[index]):
+                self.clients[index].close()
+                self.clients[index] = self._connect()
+                self.reconnects += 1
+            return self.clients[index]
+    
+    def negotiated(self):
+        """Return the cipher, MAC and compression of the first connection."""
+        transport = self.client().get_transport()
+        return {'cipher': transport.local_cipher, 'mac': transport.local_mac,
+                'compression': transport.local_compression}
+    
+    def commands(self):
+        """Return what remote commands should run over.
+
+        That is the persistent RemoteShell when enabled (started on first
+        use and restarted if it died), otherwise the first connection.
+        """
+        client = self.client()
+        if not self.persistent_shell:
+            return client
+        with self._shell_lock:
+            if self._shell is not None and self._shell.is_alive():
+                return self._shell
+            if self._shell is not None:
+                self._shell_commands += self._shell.commands
+                self._shell.close()
+            self._shell = RemoteShell(client)
+            self.shell_startup += self._shell.startup_time
+            if self.command_overhead is None:
+                self.command_overhead = measure_command_overhead(client,
+                                                                 self._shell)
+                self._shell.commands = 0
+            return self._shell
+    
+    @property
+    def shell_commands(self):
+        """Commands run through persistent shells so far."""
+        current = self._shell.commands if self._shell is not None else 0
+        return self._shell_commands + current
+    
+    def shell_time_saved(self):
+        """Estimate the seconds the persistent shell saved, net of start-ups."""
+        if self.command_overhead is None:
+            return 0.0
+        return (self.shell_commands * self.command_overhead -
+                self.shell_startup)
+    
+    def transports(self, count):
+        """Return the transports of the first count connections."""
+        return [self.client(i).get_transport() for i in range(count)]
+    
+    def open_sftp(self, index=0):
+        """Open a new SFTP channel on connection index."""
+        return self.client(index).open_sftp()
+    
+    def revive(self):
+        """Replace every dead connection and return the first one."""
+        for index in range(len(self.clients)):
+            self.client(index)
+        return self.client()
+    
+    def close(self):
+        with self._shell_lock:
+            if self._shell is not None:
+                self._shell_commands += self._shell.commands
+                self._shell.close()
+                self._shell = None
+        with self._lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def resume_options(resume, pool):
+    """Expand resume settings into sftp_upload_resumable keyword arguments.
+
+    resume holds chunk_size, checkpoint_dir, max_retries, backoff and verify.
+    Reconnects go through the SSHSessionPool, which replaces dead
+    connections, and checksums are taken over its first live connection.
+    """
+    if not resume:
+        return None
+    
+    options = {
+        'reconnect': lambda: pool.revive().open_sftp(),
+        'chunk_size': resume['chunk_size'],
+        'checkpoint_dir': resume.get('checkpoint_dir'),
+        'max_retries': resume['max_retries'],
+        'backoff': resume['backoff']
+    }
+    if resume.get('verify'):
+        options['verify'] = (lambda remote_path:
+                             remote_sha256(pool.commands(), remote_path))
+    return options
+
+def delta_options(threshold, pool, remote_dir):
+    """Expand a delta size threshold into the settings upload_worker uses.
+
+    The C# helper is uploaded next to remote_dir, where remove_delta_helper
+    deletes it again once the test is done. Returns None without a
+    threshold; the dict's 'stats' collects one sftp_upload_delta result per
+    file sent that way.
+    """
+    if threshold is None:
+        return None
+    
+    helper = remote_dir.replace('\\', '/').rstrip('/') + '_delta_helper.cs'
+    sftp = pool.open_sftp()
+    try:
+        with sftp.open(helper, 'w') as f:
+            f.write(DELTA_HELPER_SOURCE)
+    finally:
+        sftp.close()
+    return {'threshold': threshold, 'commands': pool.commands,
+            'helper': helper, 'stats': []}
+
+def remove_delta_helper(pool, delta):
+    """Delete the helper delta_options uploaded, if it is still there."""
+    sftp = pool.open_sftp()
+    try:
+        with contextlib.suppress(IOError):
+            sftp.remove(delta['helper'])
+    finally:
+        sftp.close()
+
+def summarize_deltas(stats):
+    """Return result fields summarising sftp_upload_delta results."""
+    return {
+        'delta_files': len(stats),
+        'delta_full_files': sum(1 for entry in stats if entry['mode'] == 'full'),
+        'delta_file_mb': sum(entry['file_size'] for entry in stats) / (1024 * 1024),
+        'delta_sent_mb': sum(entry['bytes_sent'] for entry in stats) / (1024 * 1024),
+        'delta_time': sum(entry['time'] for entry in stats)
+    }
+
+def test_ssh_connection(host, port, username, password, pool=None):
+    """Simple SSH connection test.
+
+    With a pool the tested connection is kept open for the run.
+    """
+    print("Testing SSH connection...")
+    try:
+        if pool is not None:
+            pool.client()
+        else:
+            ssh = connect_ssh(host, port, username, password, timeout=10)
+            ssh.close()
+        print("✓ SSH connection successful")
+        return True
+    except Exception as e:
+        print(f"✗ SSH connection failed: {e}")
+        print("Please check your connection parameters and try again.")
+        return False
+
+def calculate_directory_stats(local_path, inventory=None):
+    """Calculate file count and total size of a directory."""
+    if inventory is None:
+        inventory = scan_tree(local_path)
+    return len(inventory['files']), inventory['total_size']
+
+# Human-readable method names used in the recommendation
+METHOD_LABELS = {
+    "ZIP Upload Test": "ZIP upload",
+    "Recursive Upload Test": "recursive upload",
+    "Streaming ZIP Test": "streaming ZIP upload",
+    "Async Upload Test": "asyncio upload",
+    "Hybrid Upload Test": "hybrid batched upload",
+}
+
+def _zip_upload_test(test):
+    """Archive the tree locally, upload the archive and extract it remotely.
+
+    The archive is compressed by zip_workers processes with codec (a CODECS
+    entry, optionally with a level, e.g. 'deflate:1'). extractor names the
+    EXTRACTORS backend; 'auto' times the available ones on the uploaded
+    archive (see resolve_extractor). With extract_parts > 1 the tree is
+    split into that many archives, extracted by concurrent remote processes.
+    With streams > 1 the archive is uploaded as that many concurrent
+    byte-range streams of stream_chunk_size bytes over transports
+    connections, and resume makes the upload chunked and resumable (see
+    resume_options).
+    With sync the remote directory is kept and only files changed since
+    the manifest are archived; sync_delete also removes remote files that
+    no longer exist locally, and changed files over the delta threshold
+    are sent as deltas (see sftp_upload_delta). With a dedup_plan each
+    distinct content is archived once and the duplicates are recreated
+    remotely (see replicate_duplicates); that is part of 'total_time'.
+    """
+    pool, inventory, delta = test['pool'], test['inventory'], test['delta']
+    local_path, remote_dir = test['local_path'], test['remote_dir']
+    sync, resume, streams = test['sync'], test['resume'], test['streams']
+    zip_workers, codec = test['zip_workers'], test['codec']
+    dedup_plan, extractor = test['dedup_plan'], test['extractor']
+    extractor_times = None
+    
+    # Split archives only go through the plain upload path
+    parts = (test['extract_parts'] if os.path.isdir(local_path) and not resume
+             and streams == 1 else 1)
+    sync_plan = None
+    # Deduplicated trees only archive one copy of each content
+    sync_files = dedup_plan['files'] if dedup_plan else None
+    if sync:
+        # Sync needs the remote tree before it knows what to zip
+        sftp = pool.open_sftp()
+        sync_plan = plan_incremental_sync(sftp, local_path, remote_dir,
+                                          test['manifest_path'], inventory)
+        sync_files = sync_plan['changed']
+    delta_jobs = []
+    remote_archives = []
+    if delta:
+        # Large changed files go as deltas instead of into the archive
+        sizes = {entry.rel_path: entry.size for entry in inventory['files']}
+        remote_root = remote_dir.replace('\\', '/').rstrip('/')
+        delta_jobs = [(os.path.join(local_path, *rel_path.split('/')),
+                       remote_root + '/' + rel_path, sizes[rel_path])
+                      for rel_path in sync_files
+                      if sizes[rel_path] > delta['threshold']]
+        sync_files = [rel_path for rel_path in sync_files
+                      if sizes[rel_path] <= delta['threshold']]
+    
+    if sync_files == [] and delta_jobs:
+        print("Only large files changed, skipping zip")
+        zip_time = upload_time = unzip_time = 0.0
+        archive_size = 0
+        unzip_success = True
+    elif sync_files == []:
+        print("Nothing changed since the last sync, skipping zip and upload")
+        zip_time = upload_time = unzip_time = 0.0
+        archive_size = 0
+        unzip_success = True
+    else:
+        # Create zip file BEFORE touching the remote side
+        print("Creating zip file before connection...")
+        instrument_phase('zip')
+        zip_start = time.time()
+        if parts > 1:
+            zip_paths = create_zip_parts(local_path, parts,
+                                         workers=zip_workers,
+                                         files=sync_files,
+                                         inventory=inventory, codec=codec)
+        else:
+            zip_paths = [create_zip_file(local_path, workers=zip_workers,
+                                         files=sync_files,
+                                         inventory=inventory, codec=codec)]
+        archive_size = sum(os.path.getsize(zip_path)
+                           for zip_path in zip_paths)
+        zip_time = time.time() - zip_start
+        print(f"Zip creation time: {zip_time:.2f} seconds")
+        
+        instrument_phase('setup')
+        commands = pool.commands()
+        if sync:
+            print(f"Creating remote directory: {remote_dir}")
+            create_remote_dir(commands, remote_dir)
+        else:
+            # Clear and recreate remote directory
+            reset_remote_dir(commands, remote_dir)
+            
+            # Now take the pooled SSH connection
+            sftp = pool.open_sftp()
+        
+        # Upload the pre-created zip file(s)
+        remote_zips = [(os.path.join(remote_dir, os.path.basename(zip_path))
+                        .replace('\\', '/')) for zip_path in zip_paths]
+        
+        print("Uploading zip file...")
+        instrument_phase('upload')
+        resume_kwargs = resume_options(resume, pool)
+        if resume_kwargs:
+            reconnect_start = pool.handshake_time
+            resume_stats = sftp_upload_resumable(sftp, zip_paths[0],
+                                                 remote_zips[0],
+                                                 **resume_kwargs)
+            # Reconnect handshakes are reported with the others
+            upload_time = (resume_stats['time'] -
+                           (pool.handshake_time - reconnect_start))
+            sftp = resume_stats['sftp']
+            commands = pool.commands()
+        elif streams > 1:
+            multistream = sftp_upload_multistream(
+                pool.transports(test['transports']), zip_paths[0],
+                remote_zips[0], streams, test['stream_chunk_size'])
+            upload_time = multistream['time']
+        else:
+            dir_cache = RemoteDirCache(known=[remote_dir])
+            upload_time = sum(sftp_upload(sftp, zip_path, remote_zip,
+                                          dir_cache)
+                              for zip_path, remote_zip
+                              in zip(zip_paths, remote_zips))
+        print(f"Upload time: {upload_time:.2f} seconds")
+        
+        print("Extracting zip file...")
+        instrument_phase('extract')
+        if extractor == 'auto':
+            # Calibration extractions are not part of the unzip time
+            extractor, extractor_times = resolve_extractor(
+                pool, remote_zips[0], remote_dir,
+                codec_extractors(codec, pool))
+        unzip_start = time.time()
+        unzip_success = ssh_unzip_parallel(commands, remote_zips,
+                                           remote_dir, extractor)
+        unzip_time = time.time() - unzip_start
+        
+        # Clean up local zip(s)
+        for zip_path in zip_paths:
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
+        if sync:
+            # The delta archive would otherwise look like a remote-only file
+            for remote_zip in remote_zips:
+                sftp.remove(remote_zip)
+        else:
+            remote_archives = [os.path.basename(zip_path)
+                               for zip_path in zip_paths]
+    
+    if delta_jobs:
+        print(f"Uploading {len(delta_jobs)} large file(s) as deltas...")
+        instrument_phase('upload')
+        delta_start = time.time()
+        dir_cache = RemoteDirCache(known=[remote_root])
+        for _, remote_file, _ in delta_jobs:
+            dir_cache.ensure(sftp, remote_file.rsplit('/', 1)[0])
+        delta_results = upload_files([sftp], delta_jobs, delta=delta)
+        upload_time += time.time() - delta_start
+        unzip_success = unzip_success and all(r['success']
+                                              for r in delta_results)
+    
+    total_time = zip_time + upload_time + unzip_time
+    
+    result = {
+        'zip_time': zip_time,
+        'upload_time': upload_time,
+        'unzip_time': unzip_time,
+        'total_time': total_time,
+        'zip_workers': zip_workers,
+        'codec': codec,
+        'archive_size_mb': archive_size / (1024 * 1024),
+        'extractor': extractor,
+        'extract_parts': parts,
+        'remote_archives': remote_archives,
+        'success': unzip_success
+    }
+    if streams > 1 and not resume and sync_files != []:
+        result.update({
+            'streams': len(multistream['streams']),
+            'stream_mbps': [stats['mbps']
+                            for stats in multistream['streams']],
+            'aggregate_mbps': multistream['aggregate_mbps']
+        })
+    if resume and sync_files != []:
+        result.update({
+            'resumed_from_mb': resume_stats['resumed_from'] / (1024 * 1024),
+            'reconnects': resume_stats['reconnects'],
+            'checksum_verified': resume_stats['verified']
+        })
+    if delta:
+        result.update(summarize_deltas(delta['stats']))
+    if dedup_plan:
+        instrument_phase('replicate')
+        result.update(replicate_duplicates(pool.commands(), remote_dir,
+                                           dedup_plan, test['dedup']))
+        # Not measured: archiving, transfer and extraction are assumed to
+        # scale with the bytes
+        result['dedup_time_saved_estimate'] = (
+            total_time * dedup_plan['saved_bytes'] /
+            max(dedup_plan['unique_bytes'], 1) -
+            result['dedup_time'] - result['replicate_time'])
+        result['total_time'] += (result['dedup_time'] +
+                                 result['replicate_time'])
+        result['success'] = unzip_success and result['replicated']
+    if sync:
+        instrument_phase('sync')
+        result.update(complete_sync(sftp, sync_plan, test['manifest_path'],
+                                    test['host'], remote_dir,
+                                    test['sync_delete'], unzip_success))
+        result['total_time'] += sync_plan['plan_time']
+    if extractor_times:
+        result['extractor_times'] = extractor_times
+    print(f"Total time: {result['total_time']:.2f} seconds")
     
-    for root, _, files in os.walk(local_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            total_files += 1
-            total_size += os.path.getsize(file_path)
+    sftp.close()
+    return result
+
+def _streaming_zip_test(test):
+    """Stream the archive straight into the remote file, then extract it.
+
+    codec and extractor are used as by _zip_upload_test.
+    """
+    pool, inventory, codec = test['pool'], test['inventory'], test['codec']
+    local_path, remote_dir = test['local_path'], test['remote_dir']
+    extractor = test['extractor']
+    extractor_times = None
+    
+    commands = pool.commands()
+    
+    # Clear and recreate remote directory
+    reset_remote_dir(commands, remote_dir)
+    
+    sftp = pool.open_sftp()
+    
+    # The archive is built straight into the remote file, never on disk
+    suffix = CODECS[parse_codec(codec)[0]].suffix
+    remote_zip = (remote_dir.rstrip('/\\') +
+                  f"/upload_test_{int(time.time())}{suffix}").replace('\\', '/')
+    print("Streaming zip file...")
+    instrument_phase('upload')
+    stream = stream_zip_upload(sftp, local_path, remote_zip, inventory,
+                               codec)
+    print(f"Overlapped zip+upload time: {stream['stream_time']:.2f} seconds")
+    
+    print("Extracting zip file...")
+    instrument_phase('extract')
+    if extractor == 'auto':
+        extractor, extractor_times = resolve_extractor(
+            pool, remote_zip, remote_dir, codec_extractors(codec, pool))
+    unzip_start = time.time()
+    unzip_success = ssh_unzip(commands, remote_zip, remote_dir, extractor)
+    unzip_time = time.time() - unzip_start
+    
+    total_time = stream['stream_time'] + unzip_time
+    print(f"Total time: {total_time:.2f} seconds")
+    
+    result = {
+        'zip_time': stream['zip_time'],
+        'upload_time': stream['upload_time'],
+        'stream_time': stream['stream_time'],
+        'unzip_time': unzip_time,
+        'total_time': total_time,
+        'codec': codec,
+        'archive_size_mb': stream['zip_size_mb'],
+        'extractor': extractor,
+        'remote_archives': [remote_zip.rsplit('/', 1)[1]],
+        'success': unzip_success
+    }
+    if extractor_times:
+        result['extractor_times'] = extractor_times
+    
+    sftp.close()
+    return result
+
+def _recursive_upload_test(test):
+    """Upload the tree file by file over the pooled SFTP channels.
+
+    Files are spread over workers SFTP channels, multiplexed over
+    transports SSH connections, and resume sends large files as chunked,
+    resumable transfers (see resume_options). sync, sync_delete, the delta
+    threshold and dedup_plan work as in _zip_upload_test, with changed
+    files uploaded one by one instead of archived.
+    """
+    pool, inventory, delta = test['pool'], test['inventory'], test['delta']
+    local_path, remote_dir = test['local_path'], test['remote_dir']
+    sync, workers = test['sync'], test['workers']
+    transports = test['transports']
+    dedup_plan, size_mb = test['dedup_plan'], test['size_mb']
+    
+    # Pooled SSH connection(s) for recursive upload
+    ssh_transports = pool.transports(transports)
+    ssh = pool.client()
+    
+    # Clear and recreate remote directory (sync keeps what is there)
+    if sync:
+        print(f"Creating remote directory: {remote_dir}")
+        create_remote_dir(pool.commands(), remote_dir)
+    else:
+        reset_remote_dir(pool.commands(), remote_dir)
+    
+    sftp = ssh.open_sftp()
+    
+    sync_plan = None
+    sync_files = None
+    if sync:
+        sync_plan = plan_incremental_sync(sftp, local_path, remote_dir,
+                                          test['manifest_path'], inventory)
+        sync_files = sync_plan['changed']
+    
+    # create_remote_dir just made the root, so only subdirs cost calls
+    dir_cache = RemoteDirCache(known=[remote_dir])
+    
+    # Recursive upload test
+    print("Uploading folder recursively...")
+    instrument_phase('upload')
+    reconnect_start = pool.handshake_time
+    upload_time, uploaded_count, failed_count = (
+        sftp_upload_folder_recursive(sftp, local_path, remote_dir, ssh,
+                                     workers=workers,
+                                     transports=ssh_transports,
+                                     files=(dedup_plan['files']
+                                            if dedup_plan else sync_files),
+                                     dir_cache=dir_cache,
+                                     resume=resume_options(test['resume'],
+                                                           pool),
+                                     inventory=inventory, delta=delta)
+    )
+    # Reconnect handshakes are reported with the others
+    upload_time -= pool.handshake_time - reconnect_start
+    
+    result = {
+        'upload_time': upload_time,
+        'total_time': upload_time,
+        'uploaded_files': uploaded_count,
+        'failed_files': failed_count,
+        'workers': workers,
+        'transports': transports,
+        'throughput_mbps': (size_mb / upload_time
+                            if upload_time > 0 else 0.0),
+        'remote_fs_calls': dir_cache.calls,
+        'remote_fs_cache_hits': dir_cache.hits,
+        'success': failed_count == 0
+    }
+    if delta:
+        result.update(summarize_deltas(delta['stats']))
+    if dedup_plan:
+        instrument_phase('replicate')
+        result.update(replicate_duplicates(pool.commands(), remote_dir,
+                                           dedup_plan, test['dedup']))
+        # Not measured: small-file uploads are assumed to be bound by
+        # per-file round trips
+        result['dedup_time_saved_estimate'] = (
+            upload_time * len(dedup_plan['copies']) /
+            max(uploaded_count, 1) -
+            result['dedup_time'] - result['replicate_time'])
+        result['total_time'] += (result['dedup_time'] +
+                                 result['replicate_time'])
+        result['success'] = failed_count == 0 and result['replicated']
+    if sync:
+        instrument_phase('sync')
+        result.update(complete_sync(sftp, sync_plan, test['manifest_path'],
+                                    test['host'], remote_dir,
+                                    test['sync_delete'], failed_count == 0))
+        result['total_time'] += sync_plan['plan_time']
+    
+    sftp.close()
+    return result
+
+def _async_upload_test(test):
+    """Upload the tree with the asyncio backend (see async_upload_tree).
+
+    It uses async_channels SFTP sessions and keeps up to async_inflight
+    write requests outstanding across all files.
+    """
+    pool, local_path, remote_dir = (test['pool'], test['local_path'],
+                                    test['remote_dir'])
+    channels, inflight = test['async_channels'], test['async_inflight']
+    size_mb = test['size_mb']
+    
+    ssh = pool.client()
+    
+    # Clear and recreate remote directory
+    reset_remote_dir(pool.commands(), remote_dir)
+    
+    instrument_phase('upload')
+    upload_time, file_results, backend, async_handshake = async_upload_tree(
+        ssh, test['host'], test['port'], test['username'], test['password'],
+        local_path, remote_dir, channels=channels, inflight=inflight,
+        inventory=test['inventory'], transport_options=pool.transport_options
+    )
+    if async_handshake:
+        pool.add_handshake(async_handshake)
+    failed = [r for r in file_results if not r['success']]
+    for file_result in failed:
+        rel_path = os.path.relpath(file_result['local_path'], local_path)
+        print(f"  ✗ {rel_path}: {file_result['error']}")
+    print(f"Upload time: {upload_time:.2f} seconds")
     
-    return total_files, total_size
+    return {
+        'upload_time': upload_time,
+        'total_time': upload_time,
+        'uploaded_files': len(file_results) - len(failed),
+        'failed_files': len(failed),
+        'async_backend': backend,
+        'async_channels': channels,
+        'async_inflight': inflight,
+        'throughput_mbps': (size_mb / upload_time
+                            if upload_time > 0 else 0.0),
+        'success': not failed
+    }
+
+def _hybrid_upload_test(test):
+    """Send small files in micro-archives and large ones individually.
+
+    Files under small_file_threshold bytes are batched into micro-archives
+    of about batch_size bytes, each extracted with extractor as soon as it
+    lands; larger files go over workers SFTP channels.
+    """
+    pool, local_path, remote_dir = (test['pool'], test['local_path'],
+                                    test['remote_dir'])
+    small_file_threshold, batch_size = (test['small_file_threshold'],
+                                        test['batch_size'])
+    extractor = test['extractor']
+    extractor_times = None
+    
+    ssh = pool.client()
+    
+    # Clear and recreate remote directory
+    reset_remote_dir(pool.commands(), remote_dir)
+    
+    sftp = ssh.open_sftp()
+    
+    if extractor == 'auto':
+        extractor, extractor_times = resolve_extractor(pool)
+    
+    print("Uploading with small-file batching...")
+    instrument_phase('upload')
+    hybrid = hybrid_upload(ssh, sftp, local_path, remote_dir,
+                           small_threshold=small_file_threshold,
+                           batch_size=batch_size, workers=test['workers'],
+                           inventory=test['inventory'], extractor=extractor)
+    print(f"Total time: {hybrid['time']:.2f} seconds")
+    
+    result = {
+        'upload_time': hybrid['batch_upload_time'],
+        'unzip_time': hybrid['extract_time'],
+        'total_time': hybrid['time'],
+        'uploaded_files': hybrid['uploaded'],
+        'failed_files': hybrid['failed'],
+        'batches': hybrid['batches'],
+        'small_files': hybrid['small_files'],
+        'large_files': hybrid['large_files'],
+        'small_file_threshold_kb': small_file_threshold / 1024,
+        'batch_size_mb': batch_size / (1024 * 1024),
+        'extractor': extractor,
+        'success': hybrid['failed'] == 0
+    }
+    if extractor_times:
+        result['extractor_times'] = extractor_times
+    
+    sftp.close()
+    return result
+
+# The function run_single_test runs for each test name
+TEST_METHODS = {
+    "ZIP Upload Test": _zip_upload_test,
+    "Recursive Upload Test": _recursive_upload_test,
+    "Streaming ZIP Test": _streaming_zip_test,
+    "Async Upload Test": _async_upload_test,
+    "Hybrid Upload Test": _hybrid_upload_test,
+}
 
 def run_single_test(host, port, username, password, local_path,
-                   remote_dir, test_name):
-    """Run a single test synchronously."""
+                   remote_dir, test_name, workers=1, transports=1,
+                   zip_workers=1, sync=False, manifest_path=None,
+                   sync_delete=False, resume=None, streams=1,
+                   stream_chunk_size=MULTISTREAM_CHUNK_SIZE, async_channels=4,
+                   async_inflight=64,
+                   small_file_threshold=HYBRID_SMALL_FILE_THRESHOLD,
+                   batch_size=HYBRID_BATCH_SIZE, inventory=None, pool=None,
+                   extractor='expand-archive', extract_parts=1,
+                   codec='deflate', verify=False, dedup=None,
+                   delta_threshold=None):
+    """Run a single test synchronously.
+
+    The upload itself is done by the test's TEST_METHODS function, which
+    receives the options in a test dict and documents the ones it uses;
+    this wraps it with the shared setup, verification and accounting.
+    inventory is a scan_tree result of local_path; it is scanned here if
+    not given. Connections come from pool (an SSHSessionPool), or from a
+    pool private to this test; handshakes are reported separately and are
+    not part of any upload time; with a persistent shell in the pool the
+    result counts the commands run through it and the time that saved net
+    of any shell started during the test ('shell_commands',
+    'shell_time_saved'). While instrumentation is enabled the result's
+    'instrumentation' entry holds the test's operation breakdown.
+    
+    Setup: with sync the test's own manifest is derived from manifest_path
+    by method_manifest_path (or is a default one per method), and with a
+    delta_threshold (bytes) the delta helper is uploaded for the run (see
+    delta_options). dedup ('copy' or 'hardlink', see DEDUP_MODES) finds
+    the duplicates of a folder for the ZIP and recursive tests; it is
+    ignored with sync. codec 'auto' is resolved with choose_codec.
+    With verify the local files are hashed in the background during the
+    upload and checked afterwards against the remote tree, re-uploading any
+    that differ (see verify_upload); the time that takes is reported as
+    'verify_time' and is not part of 'total_time'.
+    """
     print(f"\n{'='*60}")
     print(f"Running {test_name}")
     print(f"{'='*60}")
     
+    if inventory is None:
+        inventory = scan_tree(local_path)
+    
     # Calculate directory statistics
-    file_count, total_size = calculate_directory_stats(local_path)
+    file_count, total_size = calculate_directory_stats(local_path, inventory)
     size_mb = total_size / (1024 * 1024)
     print(f"Directory stats: {file_count} files, {size_mb:.1f} MB")
     
-    if test_name == "ZIP Upload Test":
-        # Create zip file BEFORE establishing connection
-        print("Creating zip file before connection...")
-        zip_start = time.time()
-        zip_path = create_zip_file(local_path)
-        zip_time = time.time() - zip_start
-        print(f"Zip creation time: {zip_time:.2f} seconds")
-        
-        # Now establish SSH connection
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(hostname=host, port=port, username=username, 
-                   password=password)
-        
-        # Clear and recreate remote directory
-        print(f"Clearing remote directory: {remote_dir}")
-        clear_remote_directory(ssh, remote_dir)
-        print(f"Creating remote directory: {remote_dir}")
-        create_remote_dir(ssh, remote_dir)
-        
-        sftp = ssh.open_sftp()
+    if sync and manifest_path is None:
+        manifest_path = default_manifest_path(host, remote_dir, test_name)
+    elif sync:
+        manifest_path = method_manifest_path(manifest_path, test_name)
+    
+    owns_pool = pool is None
+    if owns_pool:
+        pool = SSHSessionPool(host, port, username, password)
+    delta = None
+    try:
+        handshakes_start = pool.handshakes
+        handshake_start = pool.handshake_time
+        shell_commands_start = pool.shell_commands
+        shell_startup_start = pool.shell_startup
+        if INSTRUMENTATION is not None:
+            INSTRUMENTATION.begin_test(test_name)
+        instrument_phase('setup')
+        dedup_plan = None
+        if (dedup and not sync and os.path.isdir(local_path) and
+                test_name in ("ZIP Upload Test", "Recursive Upload Test")):
+            dedup_plan = find_duplicates(inventory)
+        local_hashes = None
+        if verify:
+            # Files dedup already hashed are not read again
+            local_hashes = start_local_hashing(
+                inventory, known=dedup_plan['digests'] if dedup_plan else None)
+        if sync and test_name in ("ZIP Upload Test", "Recursive Upload Test"):
+            delta = delta_options(delta_threshold, pool, remote_dir)
+        if codec == 'auto' and test_name in ("ZIP Upload Test",
+                                             "Streaming ZIP Test"):
+            codec = choose_codec(pool, inventory, remote_dir, extractor,
+                                 zip_workers)['codec']
         
-        # Upload the pre-created zip file
-        remote_zip = (os.path.join(remote_dir, os.path.basename(zip_path))
-                     .replace('\\', '/'))
+        test = {
+            'host': host, 'port': port, 'username': username,
+            'password': password, 'local_path': local_path,
+            'remote_dir': remote_dir, 'pool': pool, 'inventory': inventory,
+            'size_mb': size_mb, 'workers': workers, 'transports': transports,
+            'zip_workers': zip_workers, 'sync': sync,
+            'manifest_path': manifest_path, 'sync_delete': sync_delete,
+            'resume': resume, 'streams': streams,
+            'stream_chunk_size': stream_chunk_size,
+            'async_channels': async_channels, 'async_inflight': async_inflight,
+            'small_file_threshold': small_file_threshold,
+            'batch_size': batch_size, 'extractor': extractor,
+            'extract_parts': extract_parts, 'codec': codec, 'dedup': dedup,
+            'dedup_plan': dedup_plan, 'delta': delta
+        }
+        result = {
+            'test_name': test_name,
+            'file_count': file_count,
+            'total_size_mb': size_mb
+        }
+        result.update(TEST_METHODS[test_name](test))
         
-        print("Uploading zip file...")
-        upload_time = sftp_upload(sftp, zip_path, remote_zip)
-        print(f"Upload time: {upload_time:.2f} seconds")
+        if verify:
+            instrument_phase('verify')
+            result.update(verify_upload(pool, local_hashes, inventory,
+                                        remote_dir,
+                                        result.get('remote_archives', ())))
+            result['success'] = result['success'] and result['verified']
+        result['handshakes'] = pool.handshakes - handshakes_start
+        result['handshake_time'] = pool.handshake_time - handshake_start
+        if pool.persistent_shell:
+            result['shell_commands'] = (pool.shell_commands -
+                                        shell_commands_start)
+            # Net of the start-ups paid during this test, as the pool's total
+            result['shell_time_saved'] = (
+                result['shell_commands'] * (pool.command_overhead or 0.0) -
+                (pool.shell_startup - shell_startup_start))
+        if INSTRUMENTATION is not None:
+            result['instrumentation'] = INSTRUMENTATION.end_test()
+    finally:
+        # The delta helper must not be left next to the user's directory
+        if delta:
+            remove_delta_helper(pool, delta)
+        # An exception mid-test must not leak the test's own connections
+        if owns_pool:
+            pool.close()
+    
+    return result
+
+# Per-phase timings summarised across benchmark trials
+TIMING_PHASES = ('zip_time', 'upload_time', 'unzip_time', 'total_time',
+                 'verify_time')
+
+def _betacf(a, b, x):
+    """Continued fraction of the regularized incomplete beta function."""
+    tiny = 1e-300
+    c = 1.0
+    d = 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 300):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x
+                          / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            delta = c * d
+            h *= delta
+        if abs(delta - 1.0) < 1e-12:
+            break
+    return h
+
+def _betainc(a, b, x):
+    """Regularized incomplete beta function I_x(a, b)."""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                     + a * math.log(x) + b * math.log1p(-x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+def t_two_sided_p(t, df):
+    """Two-sided p-value of Student's t statistic with df degrees of freedom."""
+    return _betainc(df / 2.0, 0.5, df / (df + t * t))
+
+def t_critical(df, alpha):
+    """Return the t value whose two-sided tail probability is alpha."""
+    low, high = 0.0, 1.0
+    while t_two_sided_p(high, df) > alpha:
+        high *= 2
+    for _ in range(100):
+        mid = (low + high) / 2
+        if t_two_sided_p(mid, df) > alpha:
+            low = mid
+        else:
+            high = mid
+    return high
+
+def summarize_samples(values, alpha=0.05):
+    """Return median, p95, mean, stddev and a (1 - alpha) CI of the mean."""
+    ordered = sorted(values)
+    n = len(ordered)
+    rank = (n - 1) * 0.95
+    lower = int(rank)
+    upper = min(lower + 1, n - 1)
+    p95 = ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+    mean = statistics.fmean(ordered)
+    stddev = statistics.stdev(ordered) if n > 1 else 0.0
+    half_width = (t_critical(n - 1, alpha) * stddev / math.sqrt(n)
+                  if n > 1 else 0.0)
+    return {
+        'n': n,
+        'median': statistics.median(ordered),
+        'p95': p95,
+        'mean': mean,
+        'stddev': stddev,
+        'ci_low': mean - half_width,
+        'ci_high': mean + half_width
+    }
+
+def welch_t_test(a, b):
+    """Two-sided Welch's t-test p-value for samples a and b (None if n < 2)."""
+    if len(a) < 2 or len(b) < 2:
+        return None
+    var_a = statistics.variance(a) / len(a)
+    var_b = statistics.variance(b) / len(b)
+    diff = statistics.fmean(a) - statistics.fmean(b)
+    if var_a + var_b == 0:
+        return 0.0 if diff else 1.0
+    t = diff / math.sqrt(var_a + var_b)
+    df = (var_a + var_b) ** 2 / (var_a ** 2 / (len(a) - 1)
+                                 + var_b ** 2 / (len(b) - 1))
+    return t_two_sided_p(t, df)
+
+def summarize_trials(trial_results, alpha=0.05):
+    """Fold one method's trial results into a single result with statistics.
+
+    The trial whose total time is closest to the median is kept as the
+    representative result; 'samples' holds every trial's phase timings and
+    'stats' their summarize_samples output.
+    """
+    totals = [result['total_time'] for result in trial_results]
+    median_total = statistics.median(totals)
+    result = dict(min(trial_results,
+                      key=lambda result: abs(result['total_time'] - median_total)))
+    result['trials'] = len(trial_results)
+    result['samples'] = {
+        phase: [trial[phase] for trial in trial_results]
+        for phase in TIMING_PHASES if phase in result
+    }
+    result['stats'] = {phase: summarize_samples(values, alpha)
+                       for phase, values in result['samples'].items()}
+    return result
+
+def print_sync_summary(result):
+    """Print the incremental sync lines of a test result, if it has any."""
+    if not result.get('sync'):
+        return
+    print(f"  Sync plan time: {result['sync_plan_time']:.2f} seconds")
+    print(f"  Changed files sent: {result['changed_files']} "
+          f"(unchanged: {result['unchanged_files']}, "
+          f"deleted remotely: {result['deleted_files']})")
+
+def print_deltas(result):
+    """Print the delta transfer lines of a test result, if it sent any."""
+    if not result.get('delta_files'):
+        return
+    file_mb = result['delta_file_mb']
+    sent_mb = result['delta_sent_mb']
+    print(f"  Delta transfers: {result['delta_files']} large file(s), "
+          f"{sent_mb:.2f} MB sent for {file_mb:.2f} MB of files "
+          f"({sent_mb / file_mb * 100 if file_mb else 0:.1f}%, "
+          f"{result['delta_full_files']} sent whole, "
+          f"{result['delta_time']:.2f} seconds)")
+
+def print_dedup(result):
+    """Print the content deduplication lines of a test result, if any."""
+    if 'duplicate_files' not in result:
+        return
+    print(f"  Dedup: {result['duplicate_files']} duplicate file(s), "
+          f"{result['dedup_saved_mb']:.1f} MB not sent, recreated remotely by "
+          f"{result['dedup_mode']} ({result['replicate_commands']} command(s))")
+    print(f"  Dedup hashing / replication time: "
+          f"{result['dedup_time']:.2f} / {result['replicate_time']:.2f} "
+          f"seconds (estimated time saved: "
+          f"{result['dedup_time_saved_estimate']:.2f} seconds)")
+
+def print_verification(result):
+    """Print the integrity verification lines of a test result, if any."""
+    if 'verify_time' not in result:
+        return
+    print(f"  Verify time: {result['verify_time']:.2f} seconds "
+          f"(not counted in total time)")
+    print(f"  Files verified: {result['verified_files']} "
+          f"({len(result['mismatched_files'])} mismatched, "
+          f"{result['reuploaded_files']} re-uploaded, "
+          f"{'all match' if result['verified'] else 'NOT all match'})")
+
+def describe_extraction(result):
+    """Describe how a test result's archives were extracted."""
+    parts = result.get('extract_parts', 1)
+    if parts > 1:
+        return f"{result['extractor']}, {parts} archives in parallel"
+    return result['extractor']
+
+def print_extractor_times(result):
+    """Print the extractor calibration timings of a test result, if any."""
+    times = result.get('extractor_times')
+    if not times:
+        return
+    timings = ', '.join(f"{name} {seconds:.2f}s" if seconds is not None
+                        else f"{name} failed"
+                        for name, seconds in times.items())
+    print(f"  Extractor timings: {timings}")
+
+def print_instrumentation(result):
+    """Print the phase and operation breakdown of a test result, if it has one."""
+    breakdown = result.get('instrumentation')
+    if not breakdown:
+        return
+    print(f"  {result['test_name']}:")
+    for phase, summary in breakdown['phases'].items():
+        ops = ', '.join(f"{op} {stats['total']:.2f}s x{stats['count']}"
+                        for op, stats in sorted(summary['ops'].items()))
+        print(f"    {phase:<8} {summary['wall_time']:7.2f}s  {ops}".rstrip())
+    print(f"    {'op':<8} {'count':>7} {'p50':>8} {'p95':>8} {'p99':>8} "
+          f"{'max':>8} {'total s':>8}")
+    for op, stats in sorted(breakdown['ops'].items()):
+        print(f"    {op:<8} {stats['count']:>7} "
+              f"{stats['p50'] * 1000:>8.2f} {stats['p95'] * 1000:>8.2f} "
+              f"{stats['p99'] * 1000:>8.2f} {stats['max'] * 1000:>8.2f} "
+              f"{stats['total']:>8.2f}")
+    rates = [rate for _, rate in breakdown['throughput']]
+    if rates:
+        print(f"    Throughput: median "
+              f"{statistics.median(rates) / (1024 * 1024):.2f} MB/s, peak "
+              f"{max(rates) / (1024 * 1024):.2f} MB/s "
+              f"({len(rates)} samples)")
+
+def benchmark_methods(workers=1, transports=1, stream_zip=False,
+                      zip_workers=1, sync=False, manifest_path=None,
+                      sync_delete=False, resume=None, streams=1,
+                      stream_chunk_size=MULTISTREAM_CHUNK_SIZE,
+                      async_upload=False, async_channels=4, async_inflight=64,
+                      hybrid=False,
+                      small_file_threshold=HYBRID_SMALL_FILE_THRESHOLD,
+                      batch_size=HYBRID_BATCH_SIZE, extractor='expand-archive',
+                      extract_parts=1, codec='deflate', verify=False,
+                      dedup=None, delta_threshold=None):
+    """Return the methods to compare, each with its run_single_test options.
+
+    The two standard methods always come first; stream_zip, async_upload
+    and hybrid add the optional ones (see run_comprehensive_tests). verify
+    is passed to every method, dedup and delta_threshold to the two
+    standard ones.
+    """
+    methods = [
+        ("ZIP Upload Test", {
+            'zip_workers': zip_workers, 'sync': sync,
+            'manifest_path': manifest_path, 'sync_delete': sync_delete,
+            'resume': resume, 'transports': transports, 'streams': streams,
+            'stream_chunk_size': stream_chunk_size, 'extractor': extractor,
+            'extract_parts': extract_parts, 'codec': codec, 'dedup': dedup,
+            'delta_threshold': delta_threshold
+        }),
+        ("Recursive Upload Test", {
+            'workers': workers, 'transports': transports, 'sync': sync,
+            'manifest_path': manifest_path, 'sync_delete': sync_delete,
+            'resume': resume, 'dedup': dedup,
+            'delta_threshold': delta_threshold
+        })
+    ]
+    if stream_zip:
+        methods.append(("Streaming ZIP Test", {'extractor': extractor,
+                                               'codec': codec}))
+    if async_upload:
+        methods.append(("Async Upload Test", {
+            'async_channels': async_channels, 'async_inflight': async_inflight
+        }))
+    if hybrid:
+        methods.append(("Hybrid Upload Test", {
+            'workers': workers, 'small_file_threshold': small_file_threshold,
+            'batch_size': batch_size, 'extractor': extractor
+        }))
+    if verify:
+        for _, options in methods:
+            options['verify'] = True
+    return methods
+
+def run_comprehensive_tests(host, port, username, password, local_path, 
+                           remote_dir, workers=1, transports=1,
+                           stream_zip=False, zip_workers=1, sync=False,
+                           manifest_path=None, sync_delete=False,
+                           resume=None, streams=1,
+                           stream_chunk_size=MULTISTREAM_CHUNK_SIZE,
+                           async_upload=False, async_channels=4,
+                           async_inflight=64, hybrid=False,
+                           small_file_threshold=HYBRID_SMALL_FILE_THRESHOLD,
+                           batch_size=HYBRID_BATCH_SIZE, inventory=None,
+                           pool=None, trials=1, warmup=0, alpha=0.05,
+                           seed=None, extractor='expand-archive',
+                           extract_parts=1, codec='deflate',
+                           transport_options=None, persistent_shell=False,
+                           verify=False, dedup=None, delta_threshold=None):
+    """Run comprehensive speed comparison tests.
+
+    stream_zip adds the pipelined "Streaming ZIP Test", async_upload the
+    "Async Upload Test" and hybrid the "Hybrid Upload Test" after the two
+    standard methods. sync, resume and delta_threshold are passed to both
+    standard methods, streams, stream_chunk_size and extract_parts to the ZIP test, codec to
+    both ZIP tests, extractor to every method that extracts archives,
+    verify to every method and dedup to the standard methods (see
+    run_single_test). codec 'auto' is resolved once, before the first
+    test, with choose_codec.
+    local_path is scanned once (or inventory reused) and the same
+    inventory is shared by every test, as are the SSH connections of pool
+    (an SSHSessionPool, created here with transport_options and
+    persistent_shell if not given).
+    
+    Every method is run warmup times unrecorded, then trials times in an
+    order shuffled per trial (seeded by seed). Phase timings are summarised
+    with median, p95, stddev and a (1 - alpha) confidence interval, and with
+    several trials a method is only recommended when Welch's t-test finds
+    it significantly faster than the runner-up. A single trial only prints
+    the medians, and methods that failed are never recommended.
+    """
+    print(f"\n{'='*80}")
+    print("COMPREHENSIVE UPLOAD SPEED COMPARISON TEST")
+    print(f"{'='*80}")
+    print(f"Local path: {local_path}")
+    print(f"Remote directory: {remote_dir}")
+    print(f"Server: {host}:{port}")
+    
+    if inventory is None:
+        inventory = scan_tree(local_path)
+    print(f"Scanned {len(inventory['files'])} files in "
+          f"{len(inventory['dirs'])} directories "
+          f"({inventory['scan_time']:.3f} seconds)")
+    
+    owns_pool = pool is None
+    if owns_pool:
+        pool = SSHSessionPool(host, port, username, password,
+                              transport_options=transport_options,
+                              persistent_shell=persistent_shell)
+    try:
+        negotiated = pool.negotiated()
         
-        print("Extracting zip file...")
-        unzip_start = time.time()
-        unzip_success = ssh_unzip(ssh, remote_zip, remote_dir)
-        unzip_time = time.time() - unzip_start
+        codec_choice = None
+        if codec == 'auto':
+            codec_choice = choose_codec(pool, inventory, remote_dir, extractor,
+                                        zip_workers, seed or 0)
+            codec = codec_choice['codec']
         
-        total_time = zip_time + upload_time + unzip_time
-        print(f"Total time: {total_time:.2f} seconds")
+        methods = benchmark_methods(
+            workers=workers, transports=transports, stream_zip=stream_zip,
+            zip_workers=zip_workers, sync=sync, manifest_path=manifest_path,
+            sync_delete=sync_delete, resume=resume, streams=streams,
+            stream_chunk_size=stream_chunk_size, async_upload=async_upload,
+            async_channels=async_channels, async_inflight=async_inflight,
+            hybrid=hybrid, small_file_threshold=small_file_threshold,
+            batch_size=batch_size, extractor=extractor,
+            extract_parts=extract_parts, codec=codec, verify=verify,
+            dedup=dedup, delta_threshold=delta_threshold)
         
-        # Clean up local zip
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
+        def run_method(test_name, options):
+            return run_single_test(host, port, username, password, local_path,
+                                   remote_dir, test_name, inventory=inventory,
+                                   pool=pool, **options)
         
-        result = {
-            'test_name': test_name,
-            'file_count': file_count,
-            'total_size_mb': size_mb,
-            'zip_time': zip_time,
-            'upload_time': upload_time,
-            'unzip_time': unzip_time,
-            'total_time': total_time,
-            'success': unzip_success
-        }
+        # Run tests sequentially to avoid conflicts
+        print("\nRunning tests sequentially...")
+        for round_number in range(warmup):
+            print(f"\nWarmup round {round_number + 1}/{warmup} (not recorded)")
+            for test_name, options in methods:
+                run_method(test_name, options)
         
-        sftp.close()
-        ssh.close()
+        rng = random.Random(seed)
+        trial_results = {test_name: [] for test_name, _ in methods}
+        for trial in range(trials):
+            order = list(methods)
+            if trials > 1:
+                # A fixed order would give every method the same neighbours
+                rng.shuffle(order)
+                print(f"\nTrial {trial + 1}/{trials}: "
+                      f"{', '.join(test_name for test_name, _ in order)}")
+            for test_name, options in order:
+                trial_results[test_name].append(run_method(test_name, options))
+    finally:
+        if owns_pool:
+            pool.close()
+    
+    results = [summarize_trials(trial_results[test_name], alpha)
+               for test_name, _ in methods]
+    by_name = {result['test_name']: result for result in results}
+    zip_result = by_name["ZIP Upload Test"]
+    recursive_result = by_name["Recursive Upload Test"]
+    stream_result = by_name.get("Streaming ZIP Test")
+    async_result = by_name.get("Async Upload Test")
+    hybrid_result = by_name.get("Hybrid Upload Test")
+    
+    # Generate comprehensive report
+    print(f"\n{'='*80}")
+    print("SPEED COMPARISON REPORT")
+    print(f"{'='*80}")
+    
+    print(f"\nDirectory Information:")
+    print(f"  Files: {zip_result['file_count']}")
+    print(f"  Total size: {zip_result['total_size_mb']:.1f} MB")
+    print(f"  Scan time: {inventory['scan_time']:.3f} seconds "
+          f"(one pass, shared by all tests)")
+    
+    print("\nConnection Setup:")
+    print(f"  SSH handshakes: {pool.handshakes} "
+          f"({pool.handshake_time:.2f} seconds, not counted in upload times)")
+    print(f"  Reconnects: {pool.reconnects}")
+    print(f"  Transport: {describe_transport(pool.transport_options)} "
+          f"(negotiated {negotiated['cipher']}"
+          f"{', ' + negotiated['mac'] if negotiated['mac'] else ''}, "
+          f"compression {negotiated['compression']})")
+    if pool.persistent_shell and pool.command_overhead is not None:
+        print(f"  Persistent shell: {pool.shell_commands} commands, "
+              f"{pool.shell_time_saved():.2f} seconds saved "
+              f"({pool.command_overhead:.2f} seconds per command over a new "
+              f"process, {pool.shell_startup:.2f} seconds start-up)")
+    
+    if codec_choice:
+        print("\nCodec Selection (predicted for the whole tree):")
+        print_codec_choice(codec_choice)
+    
+    print("\nZIP Upload Test:")
+    print(f"  Zip creation time: {zip_result['zip_time']:.2f} seconds "
+          f"({zip_result['codec']}, {zip_result['zip_workers']} process(es))")
+    print(f"  Archive size: {zip_result['archive_size_mb']:.1f} MB")
+    print(f"  Upload time: {zip_result['upload_time']:.2f} seconds")
+    print(f"  Unzip time: {zip_result['unzip_time']:.2f} seconds "
+          f"({describe_extraction(zip_result)})")
+    print(f"  Total time: {zip_result['total_time']:.2f} seconds")
+    print_extractor_times(zip_result)
+    if 'streams' in zip_result:
+        per_stream = ', '.join(f"{mbps:.2f}" for mbps in zip_result['stream_mbps'])
+        print(f"  Upload streams: {zip_result['streams']} "
+              f"({per_stream} MB/s each, "
+              f"{zip_result['aggregate_mbps']:.2f} MB/s aggregate)")
+    if 'reconnects' in zip_result:
+        verified = zip_result['checksum_verified']
+        print(f"  Resumable upload: {zip_result['reconnects']} reconnect(s), "
+              f"resumed from {zip_result['resumed_from_mb']:.1f} MB, "
+              f"checksum {'not checked' if verified is None else 'verified'}")
+    print_sync_summary(zip_result)
+    print_deltas(zip_result)
+    print_dedup(zip_result)
+    print_verification(zip_result)
+    print(f"  Success: {zip_result['success']}")
+    
+    print("\nRecursive Upload Test:")
+    print(f"  Upload time: {recursive_result['upload_time']:.2f} seconds")
+    print(f"  Total time: {recursive_result['total_time']:.2f} seconds")
+    print(f"  Files uploaded: {recursive_result['uploaded_files']}")
+    print(f"  Files failed: {recursive_result['failed_files']}")
+    print(f"  Workers: {recursive_result['workers']} "
+          f"over {recursive_result['transports']} transport(s)")
+    print(f"  Throughput: {recursive_result['throughput_mbps']:.2f} MB/s")
+    print(f"  Directory stat/mkdir calls: {recursive_result['remote_fs_calls']} "
+          f"({recursive_result['remote_fs_cache_hits']} directory lookups "
+          f"answered by the cache)")
+    print_sync_summary(recursive_result)
+    print_deltas(recursive_result)
+    print_dedup(recursive_result)
+    print_verification(recursive_result)
+    print(f"  Success: {recursive_result['success']}")
+    
+    if stream_result:
+        serial_time = zip_result['zip_time'] + zip_result['upload_time']
+        print("\nStreaming ZIP Test:")
+        print(f"  Overlapped zip+upload time: "
+              f"{stream_result['stream_time']:.2f} seconds "
+              f"(serial ZIP: {serial_time:.2f} seconds)")
+        print(f"  Zip busy time: {stream_result['zip_time']:.2f} seconds "
+              f"({stream_result['codec']})")
+        print(f"  Upload busy time: {stream_result['upload_time']:.2f} seconds")
+        print(f"  Unzip time: {stream_result['unzip_time']:.2f} seconds "
+              f"({describe_extraction(stream_result)})")
+        print(f"  Total time: {stream_result['total_time']:.2f} seconds")
+        print_extractor_times(stream_result)
+        print_verification(stream_result)
+        print(f"  Success: {stream_result['success']}")
+    
+    if async_result:
+        print("\nAsync Upload Test:")
+        print(f"  Upload time: {async_result['upload_time']:.2f} seconds")
+        print(f"  Total time: {async_result['total_time']:.2f} seconds")
+        print(f"  Files uploaded: {async_result['uploaded_files']}")
+        print(f"  Files failed: {async_result['failed_files']}")
+        print(f"  Backend: {async_result['async_backend']} "
+              f"({async_result['async_channels']} channels, "
+              f"{async_result['async_inflight']} in flight)")
+        print(f"  Throughput: {async_result['throughput_mbps']:.2f} MB/s")
+        print_verification(async_result)
+        print(f"  Success: {async_result['success']}")
+    
+    if hybrid_result:
+        print("\nHybrid Upload Test:")
+        print(f"  Batches: {hybrid_result['batches']} "
+              f"({hybrid_result['small_files']} files under "
+              f"{hybrid_result['small_file_threshold_kb']:.0f} KB, "
+              f"up to {hybrid_result['batch_size_mb']:.1f} MB each)")
+        print(f"  Large files sent directly: {hybrid_result['large_files']}")
+        print(f"  Batch upload time: {hybrid_result['upload_time']:.2f} seconds")
+        print(f"  Remote extract time (overlapped): "
+              f"{hybrid_result['unzip_time']:.2f} seconds "
+              f"({describe_extraction(hybrid_result)})")
+        print(f"  Total time: {hybrid_result['total_time']:.2f} seconds")
+        print(f"  Files uploaded: {hybrid_result['uploaded_files']}")
+        print(f"  Files failed: {hybrid_result['failed_files']}")
+        print_verification(hybrid_result)
+        print(f"  Success: {hybrid_result['success']}")
+    
+    if trials > 1:
+        confidence = f"{(1 - alpha) * 100:.0f}% CI"
+        print(f"\nTrial Statistics ({trials} trials, {warmup} warmup round(s), "
+              f"seconds):")
+        for result in results:
+            print(f"  {result['test_name']}:")
+            for phase, summary in result['stats'].items():
+                print(f"    {phase.replace('_time', ''):<7} "
+                      f"median {summary['median']:.2f}  "
+                      f"p95 {summary['p95']:.2f}  "
+                      f"stddev {summary['stddev']:.2f}  "
+                      f"{confidence} [{summary['ci_low']:.2f}, "
+                      f"{summary['ci_high']:.2f}]")
+    
+    if any(result.get('instrumentation') for result in results):
+        print("\nOperation Breakdown (representative trial, latencies in ms):")
+        for result in results:
+            print_instrumentation(result)
+    
+    # Calculate speed difference (medians over all trials)
+    zip_total = zip_result['stats']['total_time']['median']
+    recursive_total = recursive_result['stats']['total_time']['median']
+    time_diff = recursive_total - zip_total
+    speed_ratio = (zip_total / recursive_total
+                   if recursive_total > 0 else float('inf'))
+    
+    print(f"\n{'='*50}")
+    print("COMPARISON SUMMARY")
+    print(f"{'='*50}")
+    
+    if time_diff > 0:
+        print(f"ZIP method is {time_diff:.2f} seconds FASTER")
+        print(f"ZIP method is {speed_ratio:.2f}x faster than recursive upload")
+    else:
+        print(f"Recursive method is {abs(time_diff):.2f} seconds FASTER")
+        print(f"Recursive method is {1/speed_ratio:.2f}x faster than ZIP upload")
+    
+    if stream_result:
+        stream_saving = (zip_total -
+                         stream_result['stats']['total_time']['median'])
+        print(f"Streaming ZIP saves {stream_saving:.2f} seconds over serial ZIP")
+    
+    print("\nRecommendation:")
+    ranked = sorted([result for result in results if result['success']],
+                    key=lambda result: result['stats']['total_time']['median'])
+    if len(ranked) < 2:
+        if ranked:
+            print(f"  Use {METHOD_LABELS[ranked[0]['test_name']]} method "
+                  f"(the only one that succeeded)")
+        else:
+            print("  No method succeeded")
+        return results
+    fastest = ranked[0]
+    runner_up = ranked[1]
+    p_value = welch_t_test(fastest['samples']['total_time'],
+                           runner_up['samples']['total_time'])
+    if p_value is None:
+        print("  Median total times of a single trial:")
+        for result in ranked:
+            print(f"    {METHOD_LABELS[result['test_name']]:<22} "
+                  f"{result['stats']['total_time']['median']:.2f}s")
+        print("  Run with --trials N to get a recommendation")
+    elif p_value < alpha:
+        print(f"  Use {METHOD_LABELS[fastest['test_name']]} method "
+              f"for better performance")
+        print(f"  (faster than {METHOD_LABELS[runner_up['test_name']]}, "
+              f"Welch's t-test p = {p_value:.3f})")
+    else:
+        print(f"  No significant difference between "
+              f"{METHOD_LABELS[fastest['test_name']]} and "
+              f"{METHOD_LABELS[runner_up['test_name']]} "
+              f"(p = {p_value:.3f} >= {alpha}); run more trials to decide")
+    
+    return results
+
+def dataset_fingerprint(inventory):
+    """Hash the relative paths and sizes of an inventory into a short id."""
+    digest = hashlib.sha1()
+    for entry in sorted(inventory['files']):
+        digest.update(f"{entry.rel_path}\0{entry.size}\n".encode())
+    return digest.hexdigest()[:16]
+
+def build_run_record(results, inventory, host, port, remote_dir, options,
+                     label=None):
+    """Bundle one benchmark run into a JSON-serialisable record.
+
+    The record holds the environment, the target, a dataset fingerprint,
+    the options used and every method result (phase samples and statistics
+    included), each with an effective throughput over its median total.
+    """
+    methods = []
+    for result in results:
+        method = dict(result)
+        median_total = result['stats']['total_time']['median']
+        method['effective_mbps'] = (result['total_size_mb'] / median_total
+                                    if median_total > 0 else 0.0)
+        methods.append(method)
+    return {
+        'run_id': f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'label': label,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.node(),
+            'cpu_count': os.cpu_count(),
+            'paramiko': paramiko.__version__,
+            'asyncssh': asyncssh.__version__ if asyncssh is not None else None
+        },
+        'target': {'host': host, 'port': port, 'remote_dir': remote_dir},
+        'dataset': {
+            'path': inventory['root'],
+            'fingerprint': dataset_fingerprint(inventory),
+            'files': len(inventory['files']),
+            'dirs': len(inventory['dirs']),
+            'total_size': inventory['total_size']
+        },
+        'options': {key: value for key, value in options.items()
+                    if key != 'pool'},
+        'methods': methods
+    }
+
+def export_json(records, path):
+    """Write run records to path as indented JSON (a single run unwrapped)."""
+    with open(path, 'w') as f:
+        json.dump(records[0] if len(records) == 1 else records, f, indent=2)
+    print(f"Results written to {path}")
+
+def export_csv(records, path):
+    """Write one CSV row per run, method and timing phase."""
+    columns = ['run_id', 'timestamp', 'label', 'dataset_fingerprint', 'method',
+               'phase', 'n', 'median', 'p95', 'mean', 'stddev', 'ci_low',
+               'ci_high', 'effective_mbps', 'success']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for record, method in ((record, method) for record in records
+                               for method in record['methods']):
+            for phase, summary in method['stats'].items():
+                writer.writerow({
+                    'run_id': record['run_id'],
+                    'timestamp': record['timestamp'],
+                    'label': record['label'],
+                    'dataset_fingerprint': record['dataset']['fingerprint'],
+                    'method': method['test_name'],
+                    'phase': phase,
+                    'effective_mbps': method['effective_mbps'],
+                    'success': method['success'],
+                    **{key: summary[key] for key in columns if key in summary}
+                })
+    print(f"Results written to {path}")
+
+def default_history_path():
+    """Return the append-only run history file."""
+    return os.path.join(STATE_DIR, 'history.jsonl')
+
+def append_history(record, path=None):
+    """Append a run record to the history store, one JSON line per run."""
+    path = path or default_history_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    print(f"Run {record['run_id']} recorded in {path}")
+
+def load_history(path=None):
+    """Return every run record in the history store, oldest first."""
+    path = path or default_history_path()
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    except OSError:
+        pass
+    return records
+
+def find_run(history, ref, like=None):
+    """Resolve a run reference against the history.
+
+    ref is a run id (or unique prefix), a label (its latest run), 'latest',
+    or the path of a JSON export. With like, 'latest' only considers runs
+    on the same dataset and target as that record, excluding it.
+    """
+    if ref and os.path.isfile(ref):
+        with open(ref) as f:
+            return json.load(f)
+    candidates = history
+    if like is not None:
+        candidates = [record for record in history
+                      if record['run_id'] != like['run_id']
+                      and record['dataset']['fingerprint']
+                      == like['dataset']['fingerprint']
+                      and record['target'] == like['target']]
+    if ref in (None, 'latest'):
+        return candidates[-1] if candidates else None
+    labelled = [record for record in candidates if record.get('label') == ref]
+    if labelled:
+        return labelled[-1]
+    matches = [record for record in candidates
+               if record['run_id'].startswith(ref)]
+    return matches[-1] if len(matches) == 1 else None
+
+def compare_runs(current, baseline, threshold=0.10, alpha=0.05):
+    """Compare phase medians of two run records method by method.
+
+    A phase regresses when its median grew by more than threshold (a
+    fraction of the baseline). When both runs have several trials the
+    Welch p-value is included and a regression must also be significant.
+    Returns one row dict per method and phase present in both runs.
+    """
+    baseline_methods = {method['test_name']: method
+                        for method in baseline['methods']}
+    rows = []
+    for method in current['methods']:
+        previous = baseline_methods.get(method['test_name'])
+        if previous is None:
+            continue
+        for phase, summary in method['stats'].items():
+            if phase not in previous['stats']:
+                continue
+            before = previous['stats'][phase]['median']
+            after = summary['median']
+            change = (after - before) / before if before > 0 else 0.0
+            p_value = welch_t_test(method['samples'][phase],
+                                   previous['samples'][phase])
+            rows.append({
+                'method': method['test_name'],
+                'phase': phase,
+                'baseline': before,
+                'current': after,
+                'change': change,
+                'p_value': p_value,
+                'regression': change > threshold and (p_value is None
+                                                      or p_value < alpha)
+            })
+    return rows
+
+def print_comparison(current, baseline, rows, threshold):
+    """Print a comparison table and return the number of regressions."""
+    print(f"\n{'='*80}")
+    print(f"REGRESSION CHECK: {current['run_id']} vs baseline "
+          f"{baseline['run_id']} (threshold {threshold:.0%})")
+    print(f"{'='*80}")
+    if current['dataset']['fingerprint'] != baseline['dataset']['fingerprint']:
+        print("  Warning: the runs used different datasets")
+    for key in ('paramiko', 'asyncssh', 'python'):
+        if current['environment'][key] != baseline['environment'][key]:
+            print(f"  Note: {key} {baseline['environment'][key]} -> "
+                  f"{current['environment'][key]}")
+    regressions = 0
+    for row in rows:
+        p_text = f"p={row['p_value']:.3f}" if row['p_value'] is not None else ""
+        flag = "REGRESSION" if row['regression'] else ""
+        regressions += row['regression']
+        print(f"  {row['method']:<24} {row['phase'].replace('_time', ''):<7} "
+              f"{row['baseline']:>8.2f}s -> {row['current']:>8.2f}s "
+              f"{row['change']:>+7.1%}  {p_text:<8} {flag}")
+    if not rows:
+        print("  No methods in common")
+    print(f"\n{regressions} regression(s) beyond {threshold:.0%}")
+    return regressions
+
+def compare_main(argv):
+    """'compare' command: check a recorded run against a baseline."""
+    parser = argparse.ArgumentParser(
+        prog='main.py compare',
+        description="Compare a recorded benchmark run against a baseline "
+                    "and flag regressions"
+    )
+    parser.add_argument('--history',
+                        help='History file (default: '
+                             '~/.upload_speed_test/history.jsonl)')
+    parser.add_argument('--run', default='latest',
+                        help='Run id, label or JSON export to check '
+                             '(default: latest)')
+    parser.add_argument('--baseline', default='latest',
+                        help='Run id, label or JSON export to compare against '
+                             '(default: the previous run on the same dataset '
+                             'and target)')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Allowed slowdown in percent (default: 10)')
+    parser.add_argument('--alpha', type=float, default=0.05,
+                        help='Significance level when both runs have several '
+                             'trials (default: 0.05)')
+    parser.add_argument('--list', action='store_true',
+                        help='List recorded runs and exit')
+    args = parser.parse_args(argv)
+    
+    history = load_history(args.history)
+    if args.list:
+        for record in history:
+            label = f" [{record['label']}]" if record.get('label') else ""
+            fastest = min(record['methods'],
+                          key=lambda method: method['stats']['total_time']['median'])
+            print(f"{record['run_id']}{label}  {record['timestamp']}  "
+                  f"{record['target']['host']}  "
+                  f"{record['dataset']['files']} files "
+                  f"({record['dataset']['fingerprint']})  fastest: "
+                  f"{METHOD_LABELS[fastest['test_name']]}")
+        return 0
+    
+    current = find_run(history, args.run)
+    if current is None:
+        print(f"Error: no run matches '{args.run}'")
+        return 1
+    baseline = find_run(history, args.baseline, like=current)
+    if baseline is None:
+        print(f"Error: no baseline matches '{args.baseline}'")
+        return 1
+    threshold = args.threshold / 100
+    rows = compare_runs(current, baseline, threshold, args.alpha)
+    return 1 if print_comparison(current, baseline, rows, threshold) else 0
+
+# File size buckets of the advisor's dataset profile (upper bounds in bytes)
+PROFILE_BUCKETS = ((4 * 1024, '< 4 KB'), (64 * 1024, '4-64 KB'),
+                   (1024 * 1024, '64 KB-1 MB'), (16 * 1024 * 1024, '1-16 MB'),
+                   (float('inf'), '>= 16 MB'))
+
+# Tiny files the advisor uploads one by one to time per-file round trips
+ADVISOR_PROBE_FILES = 8
+
+# Calibration uses at most this many logged runs per method and target
+ADVISOR_CALIBRATION_RUNS = 10
+
+def profile_tree(inventory, small_file_threshold=HYBRID_SMALL_FILE_THRESHOLD):
+    """Summarise an inventory: counts, a size histogram and the small-file share.
+
+    large_dirs counts the subdirectories holding files of at least
+    small_file_threshold bytes, which the hybrid method creates remotely.
+    """
+    histogram = [[label, 0, 0] for _, label in PROFILE_BUCKETS]
+    small_files = small_size = 0
+    large_dirs = set()
+    for entry in inventory['files']:
+        index = next(index for index, (bound, _) in enumerate(PROFILE_BUCKETS)
+                     if entry.size < bound)
+        histogram[index][1] += 1
+        histogram[index][2] += entry.size
+        if entry.size < small_file_threshold:
+            small_files += 1
+            small_size += entry.size
+        else:
+            large_dirs.add(os.path.dirname(entry.rel_path))
+    return {
+        'files': len(inventory['files']),
+        'dirs': len(inventory['dirs']),
+        'total_size': inventory['total_size'],
+        'histogram': histogram,
+        'small_files': small_files,
+        'small_size': small_size,
+        'large_dirs': len(large_dirs - {''})
+    }
+
+def profile_sample(inventory, codec, seed=0):
+    """Compress a sample of the tree with codec and time it locally.
+
+    Returns the sample's size and file count, its compression ratio and
+    the seconds taken to compress it, with the archive left in a temporary
+    file ('archive') for the extraction probe; the caller removes it.
+    """
+    sample_dir = sample_tree(inventory, seed=seed)
+    try:
+        sample = scan_tree(sample_dir)
+        suffix = CODECS[parse_codec(codec)[0]].suffix
+        fd, archive = tempfile.mkstemp(prefix='advisor_sample_', suffix=suffix)
+        os.close(fd)
+        start = time.perf_counter()
+        write_archive(sample_dir, archive, codec, inventory=sample)
+        compress_time = time.perf_counter() - start
+    finally:
+        shutil.rmtree(sample_dir, ignore_errors=True)
+    size = sample['total_size'] or 1
+    return {
+        'size': size,
+        'files': len(sample['files']) or 1,
+        'ratio': os.path.getsize(archive) / size,
+        'compress_time': compress_time,
+        'archive': archive
+    }
+
+def probe_target(pool, remote_dir, sample, extractor='expand-archive',
+                 codec='deflate'):
+    """Measure the link and the server with small transfers.
+
+    Works in a scratch directory next to remote_dir, recreated empty first
+    and removed afterwards even if the probe fails.
+    Returns round-trip seconds of an SFTP stat ('rtt'), of a remote command
+    ('exec'), of opening an SFTP session ('session'), of a one-file upload
+    ('put') and of a mkdir ('mkdir'), the bandwidth in bytes per second,
+    and the seconds the server spends extracting the sample archive
+    beyond the command itself ('extract').
+    An 'auto' extractor is resolved on the sample archive first.
+    """
+    probe_dir = remote_dir.replace('\\', '/').rstrip('/') + '_advisor_probe'
+    # Commands run the way the tests will run them (see pool.commands)
+    ssh = pool.commands()
+    print("Probing the link and the server...")
+    # Anything left by an interrupted probe would make the mkdirs fail
+    reset_remote_dir(ssh, probe_dir)
+    try:
+        exec_times = []
+        for _ in range(2):
+            start = time.time()
+            create_remote_dir(ssh, probe_dir)
+            exec_times.append(time.time() - start)
         
-    elif test_name == "Recursive Upload Test":
-        # Establish SSH connection for recursive upload
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(hostname=host, port=port, username=username, 
-                   password=password)
+        start = time.time()
+        sftp = pool.open_sftp()
+        session_time = time.time() - start
+        fd, tiny_file = tempfile.mkstemp(prefix='advisor_probe_')
+        try:
+            os.write(fd, os.urandom(1024))
+            os.close(fd)
+            stat_times = []
+            for _ in range(ADVISOR_PROBE_FILES):
+                start = time.time()
+                sftp.stat(probe_dir)
+                stat_times.append(time.time() - start)
+            put_times = []
+            mkdir_times = []
+            for index in range(ADVISOR_PROBE_FILES):
+                start = time.time()
+                sftp.mkdir(f"{probe_dir}/dir_{index}")
+                mkdir_times.append(time.time() - start)
+                start = time.time()
+                sftp_put(sftp, tiny_file, f"{probe_dir}/dir_{index}/file")
+                put_times.append(time.time() - start)
+            bandwidth = (pool.target_info['codec']['bandwidth']
+                         if 'codec' in pool.target_info
+                         else measure_bandwidth(sftp, probe_dir))
+            
+            suffix = CODECS[parse_codec(codec)[0]].suffix
+            remote_archive = f"{probe_dir}/sample{suffix}"
+            sftp_put(sftp, sample['archive'], remote_archive)
+        finally:
+            sftp.close()
+            os.remove(tiny_file)
         
-        # Clear and recreate remote directory
-        print(f"Clearing remote directory: {remote_dir}")
-        clear_remote_directory(ssh, remote_dir)
-        print(f"Creating remote directory: {remote_dir}")
-        create_remote_dir(ssh, remote_dir)
+        extract_dir = f"{probe_dir}/extract"
+        if extractor == 'auto':
+            extractor, _ = resolve_extractor(pool, remote_archive, extract_dir,
+                                             codec_extractors(codec, pool))
+        create_remote_dir(ssh, extract_dir)
+        start = time.time()
+        ssh_unzip(ssh, remote_archive, extract_dir, extractor)
+        extract_time = time.time() - start
+    finally:
+        clear_remote_directory(ssh, probe_dir)
+    
+    exec_time = statistics.median(exec_times)
+    probe = {
+        'rtt': statistics.median(stat_times),
+        'exec': exec_time,
+        'session': session_time,
+        'put': statistics.median(put_times),
+        'mkdir': statistics.median(mkdir_times),
+        'bandwidth': bandwidth,
+        'extract': max(extract_time - exec_time, 0.0),
+        'extractor': extractor
+    }
+    print(f"  RTT {probe['rtt'] * 1000:.1f} ms, remote command "
+          f"{probe['exec'] * 1000:.0f} ms, file upload {probe['put'] * 1000:.1f} "
+          f"ms, bandwidth {bandwidth / (1024 * 1024):.2f} MB/s, "
+          f"sample extraction {probe['extract']:.2f} seconds ({extractor})")
+    return probe
+
+def predict_methods(profile, sample, probe, methods):
+    """Predict the phase times of every method from the profile and probes.
+
+    Archive methods scale the sample's compress and extract times to the
+    whole tree (compression over zip_workers for deflate and zstd); file
+    methods open a session per channel and pay one upload round trip per
+    file and a mkdir per directory, with the files spread over their
+    channels (SFTP sessions) while sharing the bandwidth.
+    Returns {test name: {'zip', 'upload', 'unzip', 'total'}} in seconds.
+    """
+    total_size = profile['total_size']
+    scale = total_size / sample['size']
+    bandwidth = probe['bandwidth']
+    dir_time = profile['dirs'] * probe['mkdir']
+    
+    def file_upload(files, size, channels):
+        serial = files * probe['put'] + size / bandwidth
+        return (channels * probe['session'] +
+                max(size / bandwidth, serial / max(1, channels)))
+    
+    predictions = {}
+    for test_name, options in methods:
+        if test_name in ("ZIP Upload Test", "Streaming ZIP Test"):
+            name, _ = parse_codec(options['codec'])
+            workers = (options.get('zip_workers', 1)
+                       if name in ('deflate', 'zstd') else 1)
+            compress = (sample['compress_time'] * scale /
+                        min(workers, os.cpu_count() or 1))
+            upload = total_size * sample['ratio'] / bandwidth + probe['put']
+            extract = probe['exec'] + probe['extract'] * scale
+            if test_name == "Streaming ZIP Test":
+                # Compression and upload overlap
+                predicted = {'zip': compress, 'upload': upload,
+                             'unzip': extract,
+                             'total': max(compress, upload) + extract}
+            else:
+                predicted = {'zip': compress, 'upload': upload,
+                             'unzip': extract,
+                             'total': compress + upload + extract}
+        elif test_name == "Hybrid Upload Test":
+            small_size = profile['small_size']
+            small_scale = small_size / sample['size']
+            batch_scale = (min(small_size, options['batch_size']) /
+                           sample['size'])
+            batches = math.ceil(small_size / options['batch_size'])
+            upload = (sample['compress_time'] * small_scale +
+                      small_size * sample['ratio'] / bandwidth +
+                      batches * probe['put'] +
+                      profile['large_dirs'] * probe['mkdir'])
+            large_files = profile['files'] - profile['small_files']
+            if large_files:
+                upload += file_upload(large_files, total_size - small_size,
+                                      options['workers'])
+            # Only the last batch's extraction is not overlapped with sending
+            extract = (probe['exec'] + probe['extract'] * batch_scale
+                       if profile['small_files'] else 0.0)
+            predicted = {'zip': 0.0, 'upload': upload, 'unzip': extract,
+                         'total': upload + extract}
+        else:
+            channels = (options['async_channels']
+                        if test_name == "Async Upload Test"
+                        else options['workers'])
+            upload = (file_upload(profile['files'], total_size, channels) +
+                      dir_time)
+            predicted = {'zip': 0.0, 'upload': upload, 'unzip': 0.0,
+                         'total': upload}
+        predictions[test_name] = predicted
+    return predictions
+
+def default_advisor_log_path():
+    """Return the append-only log of advisor predictions and outcomes."""
+    return os.path.join(STATE_DIR, 'advisor.jsonl')
+
+def calibration_factors(log, host, port):
+    """Return {test name: median actual/predicted total} for a target.
+
+    Only the ADVISOR_CALIBRATION_RUNS most recent logged runs of each
+    method against host:port are used.
+    """
+    ratios = {}
+    for entry in log:
+        if entry['target']['host'] != host or entry['target']['port'] != port:
+            continue
+        predicted = entry['predicted'][entry['method']]['total']
+        if predicted > 0:
+            ratios.setdefault(entry['method'], []).append(
+                entry['actual']['total'] / predicted)
+    return {test_name: statistics.median(values[-ADVISOR_CALIBRATION_RUNS:])
+            for test_name, values in ratios.items()}
+
+def print_advice(profile, predictions, factors, chosen):
+    """Print the dataset profile and the predicted time of every method."""
+    print("\nDataset profile:")
+    print(f"  {profile['files']} files in {profile['dirs']} directories, "
+          f"{profile['total_size'] / (1024 * 1024):.1f} MB "
+          f"({profile['small_files']} small files, "
+          f"{profile['small_size'] / (1024 * 1024):.1f} MB)")
+    for label, count, size in profile['histogram']:
+        if count:
+            print(f"  {label:>11}: {count:>7} files {size / (1024 * 1024):>9.1f} MB")
+    print("\nPredicted seconds:")
+    print(f"  {'method':<22} {'zip':>7} {'upload':>7} {'unzip':>7} "
+          f"{'total':>7} {'calibrated':>10}")
+    for test_name, predicted in predictions.items():
+        factor = factors.get(test_name, 1.0)
+        marker = '  <- run' if test_name == chosen else ''
+        print(f"  {METHOD_LABELS[test_name]:<22} {predicted['zip']:>7.2f} "
+              f"{predicted['upload']:>7.2f} {predicted['unzip']:>7.2f} "
+              f"{predicted['total']:>7.2f} {predicted['total'] * factor:>10.2f}"
+              f"{marker}")
+
+def run_advisor(host, port, username, password, local_path, remote_dir,
+                inventory=None, pool=None, log_path=None, seed=None,
+                alpha=0.05, **options):
+    """Predict the fastest method from probes and run only that one.
+
+    The local tree is profiled (profile_tree) and a sample compressed with
+    the codec (profile_sample); the link and server are probed with small
+    transfers (probe_target). Every method of benchmark_methods (all of
+    them, whatever the stream_zip, async_upload and hybrid options say) is
+    then predicted with predict_methods, scaled by the calibration factor
+    of earlier runs in the advisor log, and the fastest is run once.
+    options are benchmark_methods keyword arguments. Predicted and actual
+    phase times are appended to the log at log_path. Returns the winner's
+    result, summarised like one trial (see summarize_trials).
+    """
+    if inventory is None:
+        inventory = scan_tree(local_path)
+    owns_pool = pool is None
+    if owns_pool:
+        pool = SSHSessionPool(host, port, username, password)
+    options = dict(options, stream_zip=True, async_upload=True, hybrid=True)
+    
+    print(f"\n{'='*80}")
+    print("UPLOAD METHOD ADVISOR")
+    print(f"{'='*80}")
+    try:
+        if options.get('codec', 'deflate') == 'auto':
+            options['codec'] = choose_codec(pool, inventory, remote_dir,
+                                            options.get('extractor',
+                                                        'expand-archive'),
+                                            options.get('zip_workers', 1),
+                                            seed or 0)['codec']
+        codec = options.get('codec', 'deflate')
+        profile = profile_tree(inventory,
+                               options.get('small_file_threshold',
+                                           HYBRID_SMALL_FILE_THRESHOLD))
+        sample = profile_sample(inventory, codec, seed or 0)
+        try:
+            probe = probe_target(pool, remote_dir, sample,
+                                 options.get('extractor', 'expand-archive'),
+                                 codec)
+        finally:
+            os.remove(sample['archive'])
+        del sample['archive']
+        options['extractor'] = probe['extractor']
+        methods = benchmark_methods(**options)
+        predictions = predict_methods(profile, sample, probe, methods)
         
-        sftp = ssh.open_sftp()
+        log_path = log_path or default_advisor_log_path()
+        factors = calibration_factors(load_history(log_path), host, port)
+        chosen = min(predictions, key=lambda test_name: (
+            predictions[test_name]['total'] * factors.get(test_name, 1.0)))
+        print_advice(profile, predictions, factors, chosen)
         
-        # Recursive upload test
-        print("Uploading folder recursively...")
-        upload_time, uploaded_count, failed_count = (
-            sftp_upload_folder_recursive(sftp, local_path, remote_dir, ssh)
-        )
+        result = run_single_test(host, port, username, password, local_path,
+                                 remote_dir, chosen, inventory=inventory,
+                                 pool=pool, **dict(methods)[chosen])
+    finally:
+        if owns_pool:
+            pool.close()
+    actual = {phase: result.get(f"{phase}_time", 0.0)
+              for phase in ('zip', 'upload', 'unzip', 'total')}
+    
+    print(f"\n{'='*80}")
+    print("ADVISOR REPORT")
+    print(f"{'='*80}")
+    print(f"Ran {METHOD_LABELS[chosen]} "
+          f"({'succeeded' if result['success'] else 'FAILED'})")
+    print(f"  {'phase':<8} {'predicted':>10} {'actual':>10} {'error':>8}")
+    for phase, seconds in actual.items():
+        predicted = predictions[chosen][phase]
+        error = (f"{(predicted - seconds) / seconds:+.0%}" if seconds > 0
+                 else '')
+        print(f"  {phase:<8} {predicted:>9.2f}s {seconds:>9.2f}s {error:>8}")
+    print_verification(result)
+    
+    entry = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'target': {'host': host, 'port': port, 'remote_dir': remote_dir},
+        'dataset': {'fingerprint': dataset_fingerprint(inventory),
+                    'files': profile['files'],
+                    'total_size': profile['total_size']},
+        'profile': profile,
+        'sample': sample,
+        'probe': probe,
+        'predicted': predictions,
+        'calibration': factors,
+        'method': chosen,
+        'actual': actual,
+        'success': result['success']
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    with open(log_path, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+    print(f"Prediction logged in {log_path}")
+    return summarize_trials([result], alpha)
+
+def parse_size(text):
+    """Parse a byte count such as '512', '16KB' or '1.5MB' (1024-based)."""
+    units = {'GB': 1024 ** 3, 'MB': 1024 ** 2, 'KB': 1024, 'B': 1}
+    text = text.strip().upper()
+    for unit, factor in units.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(float(text))
+
+def parse_dataset_spec(text):
+    """Parse 'files=1000,size=16KB,dist=lognormal,...' into a full spec dict.
+
+    Keys are those of DATASET_DEFAULTS: dist is fixed, lognormal (mean size,
+    shape sigma) or bimodal (large_fraction of files are large_size), and
+    content is text (compressible) or random (incompressible).
+    """
+    spec = dict(DATASET_DEFAULTS)
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        key, _, value = item.partition('=')
+        key = key.strip()
+        if key not in spec:
+            raise ValueError(f"unknown dataset key: {key}")
+        if key in ('size', 'large_size'):
+            spec[key] = parse_size(value)
+        elif key in ('sigma', 'large_fraction'):
+            spec[key] = float(value)
+        elif key in ('dist', 'content'):
+            spec[key] = value.strip().lower()
+        else:
+            spec[key] = int(value)
+    if spec['dist'] not in ('fixed', 'lognormal', 'bimodal'):
+        raise ValueError(f"unknown size distribution: {spec['dist']}")
+    if spec['content'] not in ('text', 'random'):
+        raise ValueError(f"unknown content type: {spec['content']}")
+    if spec['files'] < 1 or spec['depth'] < 0 or spec['fanout'] < 1:
+        raise ValueError("files and fanout must be at least 1, depth >= 0")
+    return spec
+
+def describe_dataset(spec):
+    """Return a one-line summary of a dataset spec."""
+    sizes = f"{spec['size'] / 1024:.1f} KB"
+    if spec['dist'] == 'lognormal':
+        sizes = f"lognormal mean {sizes}, sigma {spec['sigma']}"
+    elif spec['dist'] == 'bimodal':
+        sizes = (f"{sizes} + {spec['large_fraction']:.0%} at "
+                 f"{spec['large_size'] / (1024 * 1024):.1f} MB")
+    return (f"{spec['files']} files ({sizes}), depth {spec['depth']} x "
+            f"{spec['fanout']}, {spec['content']} content, seed {spec['seed']}")
+
+def _dataset_sizes(spec, rng):
+    """Draw every file size of a dataset from its distribution."""
+    if spec['dist'] == 'lognormal':
+        # Pick mu so that the mean file size equals spec['size']
+        mu = math.log(max(spec['size'], 1)) - spec['sigma'] ** 2 / 2
+        return [int(rng.lognormvariate(mu, spec['sigma']))
+                for _ in range(spec['files'])]
+    if spec['dist'] == 'bimodal':
+        return [spec['large_size'] if rng.random() < spec['large_fraction']
+                else spec['size'] for _ in range(spec['files'])]
+    return [spec['size']] * spec['files']
+
+def _text_block(rng, size=1024 * 1024):
+    """Return size bytes of pseudo-text built from a small random vocabulary."""
+    letters = 'etaoinshrdlucmfwypvbgkqjxz'
+    vocabulary = [''.join(rng.choice(letters) for _ in range(rng.randint(2, 9)))
+                  for _ in range(500)]
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(vocabulary)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words).encode()[:size]
+
+def generate_dataset(spec, cache_dir=None):
+    """Build the tree described by spec (see parse_dataset_spec) and return its path.
+
+    Generation is seeded, so a spec always yields the same tree; trees are
+    cached under cache_dir (default: ~/.upload_speed_test/datasets) by a
+    hash of the spec and reused on later runs.
+    """
+    cache_dir = cache_dir or os.path.join(STATE_DIR, 'datasets')
+    key = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    path = os.path.join(cache_dir, key[:16])
+    # The spec file is written last, so it only exists for complete trees
+    spec_path = path + '.json'
+    if os.path.isdir(path) and os.path.exists(spec_path):
+        print(f"Reusing cached dataset {path}: {describe_dataset(spec)}")
+        return path
+    
+    print(f"Generating dataset {path}: {describe_dataset(spec)}")
+    start = time.time()
+    rng = random.Random(spec['seed'])
+    dirs = ['']
+    level = ['']
+    for _ in range(spec['depth']):
+        level = [os.path.join(parent, f"dir{i:02d}")
+                 for parent in level for i in range(spec['fanout'])]
+        dirs.extend(level)
+    
+    build_path = path + '.tmp'
+    if os.path.exists(build_path):
+        shutil.rmtree(build_path)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    for rel_dir in dirs:
+        os.makedirs(os.path.join(build_path, rel_dir), exist_ok=True)
+    
+    text = _text_block(rng) if spec['content'] == 'text' else None
+    extension = '.txt' if text else '.bin'
+    total_size = 0
+    for index, size in enumerate(_dataset_sizes(spec, rng)):
+        file_path = os.path.join(build_path, rng.choice(dirs),
+                                 f"file{index:06d}{extension}")
+        with open(file_path, 'wb') as f:
+            remaining = size
+            while remaining:
+                piece = min(remaining, 1024 * 1024)
+                if text:
+                    offset = rng.randrange(len(text) - piece + 1)
+                    f.write(text[offset:offset + piece])
+                else:
+                    f.write(rng.randbytes(piece))
+                remaining -= piece
+        total_size += size
+    
+    os.rename(build_path, path)
+    with open(spec_path, 'w') as f:
+        json.dump({'spec': spec, 'total_size': total_size}, f, indent=2)
+    print(f"Generated {spec['files']} files, "
+          f"{total_size / (1024 * 1024):.1f} MB in {len(dirs)} directories "
+          f"({time.time() - start:.2f} seconds)")
+    return path
+
+def run_sweep(host, port, username, password, remote_dir, spec, counts,
+              cache_dir=None, **options):
+    """Benchmark generated datasets of each file count and report crossovers.
+
+    Every point uses spec with 'files' replaced by the count; options are
+    passed on to run_comprehensive_tests. Returns [(count, inventory, results)].
+    """
+    points = []
+    for count in counts:
+        point_spec = dict(spec, files=count)
+        local_path = generate_dataset(point_spec, cache_dir)
+        inventory = scan_tree(local_path)
+        points.append((count, inventory, run_comprehensive_tests(
+            host, port, username, password, local_path, remote_dir,
+            inventory=inventory, **options)))
+    
+    test_names = [result['test_name'] for result in points[0][2]]
+    print(f"\n{'='*80}")
+    print("SWEEP SUMMARY (median total seconds)")
+    print(f"{'='*80}")
+    print(f"{'Files':>8}  " +
+          "  ".join(f"{METHOD_LABELS[name]:>22}" for name in test_names) +
+          "  Fastest")
+    previous = None
+    crossovers = []
+    for count, _, results in points:
+        medians = {result['test_name']: result['stats']['total_time']['median']
+                   for result in results}
+        fastest = min(medians, key=medians.get)
+        print(f"{count:>8}  " +
+              "  ".join(f"{medians[name]:>22.2f}" for name in test_names) +
+              f"  {METHOD_LABELS[fastest]}")
+        if previous and previous[1] != fastest:
+            crossovers.append((previous, (count, fastest)))
+        previous = (count, fastest)
+    
+    print("\nCrossovers:")
+    if not crossovers:
+        print(f"  None: {METHOD_LABELS[previous[1]]} is fastest at every size")
+    for (low_count, low_method), (high_count, high_method) in crossovers:
+        print(f"  {METHOD_LABELS[low_method]} -> {METHOD_LABELS[high_method]} "
+              f"between {low_count} and {high_count} files")
+    return points
+
+# --transport-sweep axis names and the transport option each one sets
+TRANSPORT_AXES = {
+    'window': 'window_size',
+    'packet': 'max_packet_size',
+    'cipher': 'ciphers',
+    'mac': 'macs',
+    'compress': 'compress'
+}
+
+def parse_on_off(text):
+    """Parse on/off, yes/no or true/false into a bool."""
+    value = text.strip().lower()
+    if value in ('on', 'yes', 'true', '1'):
+        return True
+    if value in ('off', 'no', 'false', '0'):
+        return False
+    raise ValueError(f"expected on or off, got '{text}'")
+
+def parse_transport_matrix(text):
+    """Parse 'window=2MB,16MB;cipher=aes128-ctr,aes256-ctr;compress=off,on'.
+
+    Axes are the keys of TRANSPORT_AXES, separated by ';', each with
+    comma-separated values. Returns {transport option: [values]}; a cipher
+    or mac value is a single preferred algorithm.
+    """
+    matrix = {}
+    for axis in filter(None, (part.strip() for part in text.split(';'))):
+        name, _, values = axis.partition('=')
+        name = name.strip().lower()
+        if name not in TRANSPORT_AXES:
+            raise ValueError(f"unknown transport axis: {name}")
+        values = [value.strip() for value in values.split(',') if value.strip()]
+        if not values:
+            raise ValueError(f"no values for transport axis: {name}")
+        key = TRANSPORT_AXES[name]
+        if key in ('window_size', 'max_packet_size'):
+            matrix[key] = [parse_size(value) for value in values]
+        elif key == 'compress':
+            matrix[key] = [parse_on_off(value) for value in values]
+        else:
+            matrix[key] = [[value] for value in values]
+    if not matrix:
+        raise ValueError("empty transport matrix")
+    return matrix
+
+def expand_transport_matrix(matrix, base=None):
+    """Return one transport options dict per combination of matrix values.
+
+    Options not swept keep their value from base.
+    """
+    keys = list(matrix)
+    return [dict(base or {}, **dict(zip(keys, values)))
+            for values in itertools.product(*(matrix[key] for key in keys))]
+
+def run_transport_sweep(host, port, username, password, local_path,
+                        remote_dir, matrix, base=None, inventory=None,
+                        **options):
+    """Benchmark every SSH transport configuration of a sweep matrix.
+
+    Each configuration from expand_transport_matrix(matrix, base) gets its
+    own SSHSessionPool and a full run_comprehensive_tests run; options are
+    passed on unchanged. The summary compares the median upload time of
+    the ZIP upload (sftp_upload) and the recursive upload (put_r) and names
+    the fastest configuration for each. Returns [(transport options,
+    results)].
+    """
+    if inventory is None:
+        inventory = scan_tree(local_path)
+    points = []
+    for transport_options in expand_transport_matrix(matrix, base):
+        print(f"\nTransport: {describe_transport(transport_options)}")
+        points.append((transport_options, run_comprehensive_tests(
+            host, port, username, password, local_path, remote_dir,
+            inventory=inventory, transport_options=transport_options,
+            **options)))
+    
+    methods = ("ZIP Upload Test", "Recursive Upload Test")
+    print(f"\n{'='*80}")
+    print("TRANSPORT SWEEP SUMMARY (median upload seconds)")
+    print(f"{'='*80}")
+    print(f"{'Transport':<62}  {'sftp_upload':>11}  {'put_r':>11}")
+    medians = []
+    for transport_options, results in points:
+        by_name = {result['test_name']: result for result in results}
+        upload = {name: by_name[name]['stats']['upload_time']['median']
+                  for name in methods}
+        medians.append((transport_options, upload))
+        print(f"{describe_transport(transport_options):<62}  "
+              f"{upload[methods[0]]:>11.2f}  {upload[methods[1]]:>11.2f}")
+    
+    print("\nBest configuration:")
+    for name, label in zip(methods, ('sftp_upload', 'put_r')):
+        best_options, best = min(medians, key=lambda point: point[1][name])
+        print(f"  {label}: {describe_transport(best_options)} "
+              f"({best[name]:.2f} seconds)")
+    return points
+
+def parse_hosts(text, default_port=22):
+    """Parse a host list into [(host, port)], dropping duplicates.
+
+    text is a file with one host per line ('#' starts a comment) or a
+    comma-separated list; each entry is 'host' or 'host:port'.
+    """
+    if os.path.isfile(text):
+        with open(text) as f:
+            entries = [line.split('#', 1)[0].strip() for line in f]
+    else:
+        entries = [entry.strip() for entry in text.split(',')]
+    targets = []
+    for entry in entries:
+        if not entry:
+            continue
+        host, port = entry, default_port
+        if entry.count(':') == 1:
+            host, port_text = entry.split(':')
+            if not port_text.isdigit() or not 1 <= int(port_text) <= 65535:
+                raise ValueError(f"bad port in host entry '{entry}'")
+            port = int(port_text)
+        if (host, port) not in targets:
+            targets.append((host, port))
+    if not targets:
+        raise ValueError("no hosts given")
+    return targets
+
+def prepare_fanout_payload(local_path, remote_dir, inventory, method='zip',
+                           codec='deflate', zip_workers=1):
+    """Build what a fan-out sends to every host, once for all of them.
+
+    'zip' builds one archive with create_zip_file; 'recursive' plans the
+    per-file jobs with build_upload_plan. Returns a dict with 'method',
+    'archive' (local path, or None), 'dirs', 'jobs', 'codec', 'size' (bytes
+    sent to each host) and 'prepare_time'.
+    """
+    start = time.time()
+    payload = {'method': method, 'archive': None, 'dirs': [], 'jobs': [],
+               'codec': codec}
+    if method == 'zip':
+        payload['archive'] = create_zip_file(local_path, workers=zip_workers,
+                                             inventory=inventory, codec=codec)
+        payload['size'] = os.path.getsize(payload['archive'])
+    else:
+        payload['dirs'], payload['jobs'] = build_upload_plan(
+            local_path, remote_dir.replace('\\', '/').rstrip('/'),
+            inventory=inventory)
+        payload['size'] = sum(size for _, _, size in payload['jobs'])
+    payload['prepare_time'] = time.time() - start
+    return payload
+
+def fanout_host(host, port, username, password, remote_dir, payload,
+                limiter=None, extractor='expand-archive', workers=1,
+                inventory=None, local_hashes=None, **pool_options):
+    """Send a prepare_fanout_payload payload to one host.
+
+    Never raises: any failure is recorded in the result's 'error' so one
+    bad host cannot stop the others. pool_options go to the host's own
+    SSHSessionPool. With local_hashes (see start_local_hashing) the upload
+    is checked with verify_upload. Returns the host's timings, 'bytes'
+    sent and 'success'.
+    """
+    label = f"{host}:{port}"
+    result = {'host': host, 'port': port, 'connect_time': 0.0,
+              'upload_time': 0.0, 'unzip_time': 0.0, 'bytes': 0,
+              'success': False, 'error': None}
+    start = time.time()
+    pool = SSHSessionPool(host, port, username, password, **pool_options)
+    try:
+        commands = pool.commands()
+        result['connect_time'] = pool.handshake_time
+        reset_remote_dir(commands, remote_dir)
         
-        result = {
-            'test_name': test_name,
-            'file_count': file_count,
-            'total_size_mb': size_mb,
-            'upload_time': upload_time,
-            'total_time': upload_time,
-            'uploaded_files': uploaded_count,
-            'failed_files': failed_count,
-            'success': failed_count == 0
-        }
+        upload_start = time.time()
+        if payload['archive']:
+            remote_zip = (remote_dir.replace('\\', '/').rstrip('/') + '/' +
+                          os.path.basename(payload['archive']))
+            sftp = pool.client().open_sftp()
+            try:
+                sftp_put(sftp, payload['archive'], remote_zip, limiter)
+            finally:
+                sftp.close()
+            result['bytes'] = payload['size']
+            result['upload_time'] = time.time() - upload_start
+            
+            if extractor == 'auto':
+                extractor, _ = resolve_extractor(
+                    pool, remote_zip, remote_dir,
+                    codec_extractors(payload['codec'], pool))
+            result['extractor'] = extractor
+            unzip_start = time.time()
+            success = ssh_unzip(commands, remote_zip, remote_dir, extractor)
+            result['unzip_time'] = time.time() - unzip_start
+            if not success:
+                result['error'] = 'extraction failed'
+        else:
+            channels = open_sftp_channels(
+                pool.transports(1), max(1, min(workers, len(payload['jobs']))))
+            try:
+                dir_cache = RemoteDirCache()
+                for rdir in payload['dirs']:
+                    dir_cache.ensure(channels[0], rdir)
+                file_results = upload_files(channels, payload['jobs'],
+                                            limiter=limiter)
+            finally:
+                for sftp in channels:
+                    sftp.close()
+            result['upload_time'] = time.time() - upload_start
+            result['bytes'] = sum(r['size'] for r in file_results
+                                  if r['success'])
+            failed = [r for r in file_results if not r['success']]
+            success = not failed
+            if failed:
+                result['error'] = (f"{len(failed)} file(s) failed, first: "
+                                   f"{failed[0]['error']}")
         
-        sftp.close()
-        ssh.close()
+        if local_hashes is not None:
+            skip = ([os.path.basename(payload['archive'])]
+                    if payload['archive'] else [])
+            result.update(verify_upload(pool, local_hashes, inventory,
+                                        remote_dir, skip))
+            if success and not result['verified']:
+                result['error'] = 'verification failed'
+            success = success and result['verified']
+        result['success'] = success
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        pool.close()
+    result['total_time'] = time.time() - start
     
+    status = 'done' if result['success'] else f"FAILED: {result['error']}"
+    print(f"[{label}] {status} ({result['total_time']:.2f} seconds)")
     return result
 
-def run_comprehensive_tests(host, port, username, password, local_path, 
-                           remote_dir):
-    """Run comprehensive speed comparison tests."""
+def fanout_upload(targets, username, password, local_path, remote_dir,
+                  inventory=None, method='zip', concurrency=FANOUT_CONCURRENCY,
+                  bandwidth_cap=None, codec='deflate', zip_workers=1,
+                  extractor='expand-archive', workers=1, verify=False,
+                  transport_options=None, persistent_shell=False):
+    """Upload the same tree to many hosts concurrently.
+
+    targets is a parse_hosts list. The tree is scanned and archived (or
+    planned) once by prepare_fanout_payload, then sent to up to concurrency
+    hosts at a time, each over its own connections (see fanout_host).
+    bandwidth_cap, in bytes per second, is shared by every upload through
+    one BandwidthLimiter. Codec 'auto' is chosen against the first host.
+    Prints a per-host and aggregate report and returns it as a dict.
+    """
     print(f"\n{'='*80}")
-    print("COMPREHENSIVE UPLOAD SPEED COMPARISON TEST")
+    print(f"FAN-OUT UPLOAD TO {len(targets)} HOST(S)")
     print(f"{'='*80}")
-    print(f"Local path: {local_path}")
-    print(f"Remote directory: {remote_dir}")
-    print(f"Server: {host}:{port}")
-    
-    # Run tests sequentially to avoid conflicts
-    print("\nRunning tests sequentially...")
-    
-    # Run ZIP test first
-    zip_result = run_single_test(
-        host, port, username, password, local_path, remote_dir, 
-        "ZIP Upload Test"
-    )
+    wall_start = time.time()
+    if inventory is None:
+        inventory = scan_tree(local_path)
+    pool_options = {'transport_options': transport_options,
+                    'persistent_shell': persistent_shell}
     
-    # Run recursive test second
-    recursive_result = run_single_test(
-        host, port, username, password, local_path, remote_dir, 
-        "Recursive Upload Test"
-    )
+    if method == 'zip' and codec == 'auto':
+        host, port = targets[0]
+        with contextlib.closing(SSHSessionPool(host, port, username, password,
+                                               **pool_options)) as pool:
+            choice = choose_codec(pool, inventory, remote_dir, extractor,
+                                  zip_workers)
+        print_codec_choice(choice)
+        codec = choice['codec']
+    local_hashes = start_local_hashing(inventory) if verify else None
+    payload = prepare_fanout_payload(local_path, remote_dir, inventory,
+                                     method, codec, zip_workers)
+    limiter = BandwidthLimiter(bandwidth_cap) if bandwidth_cap else None
     
-    results = [zip_result, recursive_result]
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(fanout_host, host, port, username,
+                                       password, remote_dir, payload, limiter,
+                                       extractor, workers, inventory,
+                                       local_hashes, **pool_options)
+                       for host, port in targets]
+            hosts = [future.result() for future in futures]
+    finally:
+        if payload['archive'] and os.path.exists(payload['archive']):
+            os.remove(payload['archive'])
+    wall_time = time.time() - wall_start
     
-    # Generate comprehensive report
+    total_bytes = sum(result['bytes'] for result in hosts)
+    aggregate_mbps = (total_bytes / (1024 * 1024) / wall_time
+                      if wall_time > 0 else 0.0)
+    failed = [result for result in hosts if not result['success']]
+    cap = (f"{bandwidth_cap / (1024 * 1024):.1f} MB/s cap" if bandwidth_cap
+           else "no bandwidth cap")
     print(f"\n{'='*80}")
-    print("SPEED COMPARISON REPORT")
+    print("FAN-OUT REPORT")
     print(f"{'='*80}")
-    
-    print(f"\nDirectory Information:")
-    print(f"  Files: {zip_result['file_count']}")
-    print(f"  Total size: {zip_result['total_size_mb']:.1f} MB")
-    
-    print("\nZIP Upload Test:")
-    print(f"  Zip creation time: {zip_result['zip_time']:.2f} seconds")
-    print(f"  Upload time: {zip_result['upload_time']:.2f} seconds")
-    print(f"  Unzip time: {zip_result['unzip_time']:.2f} seconds")
-    print(f"  Total time: {zip_result['total_time']:.2f} seconds")
-    print(f"  Success: {zip_result['success']}")
-    
-    print("\nRecursive Upload Test:")
-    print(f"  Upload time: {recursive_result['upload_time']:.2f} seconds")
-    print(f"  Total time: {recursive_result['total_time']:.2f} seconds")
-    print(f"  Files uploaded: {recursive_result['uploaded_files']}")
-    print(f"  Files failed: {recursive_result['failed_files']}")
-    print(f"  Success: {recursive_result['success']}")
-    
-    # Calculate speed difference
-    time_diff = recursive_result['total_time'] - zip_result['total_time']
-    speed_ratio = (zip_result['total_time'] / recursive_result['total_time'] 
-                   if recursive_result['total_time'] > 0 else float('inf'))
-    
-    print(f"\n{'='*50}")
-    print("COMPARISON SUMMARY")
-    print(f"{'='*50}")
-    
-    if time_diff > 0:
-        print(f"ZIP method is {time_diff:.2f} seconds FASTER")
-        print(f"ZIP method is {speed_ratio:.2f}x faster than recursive upload")
-    else:
-        print(f"Recursive method is {abs(time_diff):.2f} seconds FASTER")
-        print(f"Recursive method is {1/speed_ratio:.2f}x faster than ZIP upload")
-    
-    print("\nRecommendation:")
-    if zip_result['total_time'] < recursive_result['total_time']:
-        print("  Use ZIP upload method for better performance")
+    if payload['archive']:
+        print(f"Payload: {payload['size'] / (1024 * 1024):.1f} MB archive "
+              f"({codec}), built once in {payload['prepare_time']:.2f} seconds")
     else:
-        print("  Use recursive upload method for better performance")
-    
-    return results
+        print(f"Payload: {len(payload['jobs'])} files, "
+              f"{payload['size'] / (1024 * 1024):.1f} MB, planned once in "
+              f"{payload['prepare_time']:.2f} seconds")
+    print(f"Hosts: {len(targets)} ({concurrency} at a time, {cap})")
+    print(f"  {'host':<28} {'connect':>8} {'upload':>8} {'extract':>8} "
+          f"{'total':>8}  status")
+    for result in hosts:
+        status = 'ok' if result['success'] else result['error']
+        print(f"  {result['host'] + ':' + str(result['port']):<28} "
+              f"{result['connect_time']:>7.2f}s {result['upload_time']:>7.2f}s "
+              f"{result['unzip_time']:>7.2f}s {result['total_time']:>7.2f}s  "
+              f"{status}")
+    print(f"Succeeded: {len(hosts) - len(failed)}, failed: {len(failed)}")
+    print(f"Moved {total_bytes / (1024 * 1024):.1f} MB in {wall_time:.2f} "
+          f"seconds wall-clock "
+          f"({aggregate_mbps:.2f} MB/s aggregate)")
+    return {
+        'method': method,
+        'codec': codec if payload['archive'] else None,
+        'payload_size': payload['size'],
+        'prepare_time': payload['prepare_time'],
+        'concurrency': concurrency,
+        'bandwidth_cap': bandwidth_cap,
+        'hosts': hosts,
+        'bytes': total_bytes,
+        'wall_time': wall_time,
+        'failed_hosts': len(failed)
+    }
 
 def main():
     """CLI entry point for the upload speed comparison tool."""
+    if sys.argv[1:2] == ['compare']:
+        sys.exit(compare_main(sys.argv[2:]))
+    
     parser = argparse.ArgumentParser(
         description="Upload Speed Comparison Tool - Compare ZIP vs Recursive upload methods",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -421,15 +5618,23 @@ def main():
 Examples:
   python main.py --host 192.168.1.100 --username admin --password secret --local-path ./data --remote-dir "C:/Uploads"
   python main.py -H 10.0.0.5 -u user -p pass -l ./files -r "D:/TestUploads" --port 2222
+  python main.py compare --baseline nightly --threshold 15
         """
     )
     
     # Required arguments
-    parser.add_argument(
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
         '--host', '-H',
-        required=True,
         help='SSH server hostname or IP address'
     )
+    target.add_argument(
+        '--hosts',
+        help='Fan out one upload to many servers instead of benchmarking '
+             'one: a file with one host[:port] per line or a comma-separated '
+             'list. The tree is archived once and uploaded to the hosts '
+             'concurrently'
+    )
     parser.add_argument(
         '--username', '-u',
         required=True,
@@ -440,11 +5645,18 @@ Examples:
         required=True,
         help='SSH password'
     )
-    parser.add_argument(
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
         '--local-path', '-l',
-        required=True,
         help='Local file or directory path to upload'
     )
+    source.add_argument(
+        '--dataset',
+        help='Upload a generated synthetic tree instead, described as '
+             '"files=1000,size=16KB,dist=fixed|lognormal|bimodal,sigma=1.0,'
+             'large_size=4MB,large_fraction=0.05,depth=2,fanout=4,'
+             'content=text|random,seed=0" (omitted keys use these defaults)'
+    )
     parser.add_argument(
         '--remote-dir', '-r',
         required=True,
@@ -458,6 +5670,330 @@ Examples:
         default=22,
         help='SSH port (default: 22)'
     )
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=1,
+        help='Parallel SFTP channels for the recursive upload (default: 1)'
+    )
+    parser.add_argument(
+        '--transports',
+        type=int,
+        default=1,
+        help='SSH connections to spread upload channels and zip streams over '
+             '(default: 1)'
+    )
+    parser.add_argument(
+        '--window-size',
+        help='SSH channel window size to advertise, e.g. 16MB '
+             '(default: paramiko\'s 2MB)'
+    )
+    parser.add_argument(
+        '--max-packet-size',
+        help='SSH maximum packet size to advertise, e.g. 256KB '
+             '(default: paramiko\'s 32KB)'
+    )
+    parser.add_argument(
+        '--ciphers',
+        help='Comma-separated ciphers to prefer, e.g. '
+             'aes128-gcm@openssh.com,aes128-ctr (default: paramiko order)'
+    )
+    parser.add_argument(
+        '--macs',
+        help='Comma-separated MACs to prefer, e.g. hmac-sha2-256-etm@openssh.com '
+             '(default: paramiko order)'
+    )
+    parser.add_argument(
+        '--compression',
+        action='store_true',
+        help='Enable SSH-level zlib compression'
+    )
+    parser.add_argument(
+        '--transport-sweep',
+        help='Benchmark every combination of SSH transport settings, given '
+             'as "window=2MB,16MB;packet=32KB,256KB;cipher=aes128-ctr,'
+             'aes128-gcm@openssh.com;mac=hmac-sha2-256;compress=off,on", '
+             'and report the best for the ZIP and recursive uploads'
+    )
+    parser.add_argument(
+        '--persistent-shell',
+        action='store_true',
+        help='Run remote commands (clear, create, extract, hash) through one '
+             'long-lived PowerShell process instead of starting one per '
+             'command, and report the time saved'
+    )
+    parser.add_argument(
+        '--dedup',
+        choices=list(DEDUP_MODES),
+        help='Upload each distinct file content once in the ZIP and '
+             'recursive tests and recreate byte-identical duplicates remotely '
+             'by copy or hardlink, in batched commands'
+    )
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='After each upload, compare local SHA-256 hashes (computed '
+             'during the upload) with the whole remote tree in one batched '
+             'remote call, re-upload mismatches and report the verification '
+             'time separately'
+    )
+    parser.add_argument(
+        '--async-upload',
+        action='store_true',
+        help='Also run the asyncio upload test (uses asyncssh if installed)'
+    )
+    parser.add_argument(
+        '--async-channels',
+        type=int,
+        default=4,
+        help='SFTP sessions used by the asyncio upload (default: 4)'
+    )
+    parser.add_argument(
+        '--async-inflight',
+        type=int,
+        default=64,
+        help='SFTP write requests the asyncio upload keeps in flight '
+             '(default: 64)'
+    )
+    parser.add_argument(
+        '--codec',
+        default='deflate',
+        help='Archive codec for the ZIP tests: stored, deflate[:1-9], '
+             'bzip2[:1-9], lzma, zstd[:1-22] or lz4[:0-16] (the last two '
+             'as a compressed tar), or auto to predict the fastest from a '
+             'sample and the measured bandwidth (default: deflate)'
+    )
+    parser.add_argument(
+        '--extractor',
+        choices=['auto'] + list(EXTRACTORS),
+        default='expand-archive',
+        help='Remote extraction backend for the archive methods; auto '
+             'detects the available ones and times each on the first '
+             'uploaded archive (default: expand-archive)'
+    )
+    parser.add_argument(
+        '--extract-parts',
+        type=int,
+        default=1,
+        help='Split the ZIP method\'s archive into this many parts, '
+             'extracted by parallel remote processes (default: 1)'
+    )
+    parser.add_argument(
+        '--hybrid',
+        action='store_true',
+        help='Also run the hybrid test: small files batched into remotely '
+             'extracted micro-archives, large files sent directly'
+    )
+    parser.add_argument(
+        '--small-file-threshold',
+        type=int,
+        default=HYBRID_SMALL_FILE_THRESHOLD // 1024,
+        help='Hybrid test: files below this size in KB are batched '
+             '(default: 256)'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=HYBRID_BATCH_SIZE // (1024 * 1024),
+        help='Hybrid test: input MB per micro-archive (default: 8)'
+    )
+    parser.add_argument(
+        '--zip-workers',
+        type=int,
+        default=1,
+        help='Processes used to compress the ZIP archive (default: 1)'
+    )
+    parser.add_argument(
+        '--streams',
+        type=int,
+        default=1,
+        help='Concurrent byte-range streams for the zip upload (default: 1)'
+    )
+    parser.add_argument(
+        '--stream-chunk-size',
+        type=int,
+        default=MULTISTREAM_CHUNK_SIZE // (1024 * 1024),
+        help='Byte-range size per stream write in MB (default: 4)'
+    )
+    parser.add_argument(
+        '--stream-zip',
+        action='store_true',
+        help='Also run the streaming ZIP test (zip and upload overlapped)'
+    )
+    parser.add_argument(
+        '--sync',
+        action='store_true',
+        help='Only send files changed since the last run instead of '
+             'clearing the remote directory'
+    )
+    parser.add_argument(
+        '--delta-threshold',
+        type=float,
+        help='With --sync, send changed files larger than this many MB as '
+             'rsync-style deltas against their remote copies'
+    )
+    parser.add_argument(
+        '--sync-delete',
+        action='store_true',
+        help='With --sync, delete remote files that no longer exist locally'
+    )
+    parser.add_argument(
+        '--manifest',
+        help='Sync manifest file, kept per method as NAME.<method>.json '
+             '(default: per host/remote dir/method under '
+             '~/.upload_speed_test/manifests)'
+    )
+    parser.add_argument(
+        '--resumable',
+        action='store_true',
+        help='Upload the zip and large files in checkpointed chunks that '
+             'resume after a dropped connection'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=RESUME_CHUNK_SIZE // (1024 * 1024),
+        help='Resumable upload chunk size in MB; recursive files larger than '
+             'one chunk use the resumable path (default: 8)'
+    )
+    parser.add_argument(
+        '--max-retries',
+        type=int,
+        default=5,
+        help='Reconnect attempts per resumable file (default: 5)'
+    )
+    parser.add_argument(
+        '--retry-backoff',
+        type=float,
+        default=2.0,
+        help='Initial reconnect delay in seconds, doubled per attempt '
+             '(default: 2.0)'
+    )
+    parser.add_argument(
+        '--checkpoint-dir',
+        help='Directory for resumable upload checkpoints (default: '
+             '~/.upload_speed_test/checkpoints)'
+    )
+    parser.add_argument(
+        '--verify-checksum',
+        action='store_true',
+        help='With --resumable, compare local and remote SHA-256 after '
+             'each resumable transfer'
+    )
+    parser.add_argument(
+        '--sweep-files',
+        help='With --dataset, benchmark one generated tree per comma-separated '
+             'file count (e.g. 10,100,1000) and report where the fastest '
+             'method changes'
+    )
+    parser.add_argument(
+        '--dataset-dir',
+        help='Cache directory for generated datasets (default: '
+             '~/.upload_speed_test/datasets)'
+    )
+    parser.add_argument(
+        '--advise',
+        action='store_true',
+        help='Probe the link and server with small transfers, profile the '
+             'tree, predict every method\'s time and run only the fastest'
+    )
+    parser.add_argument(
+        '--fanout-method',
+        choices=['zip', 'recursive'],
+        default='zip',
+        help='With --hosts, send one archive (zip, default) or every file '
+             'over SFTP (recursive)'
+    )
+    parser.add_argument(
+        '--fanout-concurrency',
+        type=int,
+        default=FANOUT_CONCURRENCY,
+        help=f'With --hosts, upload to at most this many hosts at once '
+             f'(default: {FANOUT_CONCURRENCY})'
+    )
+    parser.add_argument(
+        '--bandwidth-cap',
+        type=float,
+        help='With --hosts, cap the combined upload rate of all hosts, '
+             'in MB/s'
+    )
+    parser.add_argument(
+        '--advisor-log',
+        help='Log of advisor predictions and actual times, used to '
+             'calibrate later predictions (default: '
+             '~/.upload_speed_test/advisor.jsonl)'
+    )
+    parser.add_argument(
+        '--trials',
+        type=int,
+        default=1,
+        help='Recorded runs of every method, in shuffled order (default: 1)'
+    )
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=0,
+        help='Unrecorded warmup runs of every method (default: 0)'
+    )
+    parser.add_argument(
+        '--alpha',
+        type=float,
+        default=0.05,
+        help='Significance level for the recommendation and confidence '
+             'intervals (default: 0.05)'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='Seed for the per-trial method order (default: random)'
+    )
+    parser.add_argument(
+        '--export-json',
+        help='Write the run (environment, dataset fingerprint, per-phase '
+             'timings and statistics) to this JSON file'
+    )
+    parser.add_argument(
+        '--export-csv',
+        help='Write one row per method and phase to this CSV file'
+    )
+    parser.add_argument(
+        '--history',
+        help='Append-only run history file (default: '
+             '~/.upload_speed_test/history.jsonl)'
+    )
+    parser.add_argument(
+        '--no-history',
+        action='store_true',
+        help='Do not record this run in the history'
+    )
+    parser.add_argument(
+        '--label',
+        help='Name this run in the history (e.g. as a baseline)'
+    )
+    parser.add_argument(
+        '--compare-to',
+        help='After the run, compare against this run id, label or JSON '
+             'export ("latest" for the previous run on the same dataset) '
+             'and exit with status 1 on a regression'
+    )
+    parser.add_argument(
+        '--regression-threshold',
+        type=float,
+        default=10.0,
+        help='Slowdown in percent treated as a regression (default: 10)'
+    )
+    parser.add_argument(
+        '--instrument',
+        action='store_true',
+        help='Record per-operation latency histograms (stat, mkdir, open, '
+             'write, close, exec), throughput samples and a per-phase '
+             'breakdown, and add them to the report'
+    )
+    parser.add_argument(
+        '--trace',
+        help='Write every instrumented operation to this JSON Lines file '
+             '(implies --instrument)'
+    )
     parser.add_argument(
         '--verbose', '-v',
         action='store_true',
@@ -467,55 +6003,346 @@ Examples:
     args = parser.parse_args()
     
     # Validate local path exists
-    if not os.path.exists(args.local_path):
+    if args.local_path and not os.path.exists(args.local_path):
         print(f"Error: Local path '{args.local_path}' does not exist.")
         sys.exit(1)
     
+    dataset_spec = None
+    sweep_counts = None
+    if args.dataset is not None:
+        try:
+            dataset_spec = parse_dataset_spec(args.dataset)
+            if args.sweep_files:
+                sweep_counts = [int(count) for count in args.sweep_files.split(',')]
+        except ValueError as e:
+            print(f"Error: invalid --dataset or --sweep-files: {e}")
+            sys.exit(1)
+        if sweep_counts is not None and min(sweep_counts) < 1:
+            print("Error: --sweep-files counts must be at least 1")
+            sys.exit(1)
+    elif args.sweep_files:
+        print("Error: --sweep-files requires --dataset")
+        sys.exit(1)
+    
     # Validate port range
     if not (1 <= args.port <= 65535):
         print(f"Error: Port must be between 1 and 65535, got {args.port}")
         sys.exit(1)
     
+    if min(args.workers, args.transports, args.zip_workers) < 1:
+        print("Error: --workers, --transports and --zip-workers must be at least 1")
+        sys.exit(1)
+    
+    if args.resumable and (args.chunk_size < 1 or args.max_retries < 0):
+        print("Error: --chunk-size must be at least 1 and --max-retries "
+              "non-negative")
+        sys.exit(1)
+    
+    if args.small_file_threshold < 0 or args.batch_size < 1:
+        print("Error: --small-file-threshold must be non-negative and "
+              "--batch-size at least 1")
+        sys.exit(1)
+    
+    if args.trials < 1 or args.warmup < 0 or not 0 < args.alpha < 1:
+        print("Error: --trials must be at least 1, --warmup non-negative "
+              "and --alpha between 0 and 1")
+        sys.exit(1)
+    
+    if args.async_channels < 1 or args.async_inflight < 1:
+        print("Error: --async-channels and --async-inflight must be at least 1")
+        sys.exit(1)
+    
+    if args.streams < 1 or args.stream_chunk_size < 1:
+        print("Error: --streams and --stream-chunk-size must be at least 1")
+        sys.exit(1)
+    
+    if args.streams > 1 and args.resumable:
+        print("Error: --streams cannot be combined with --resumable")
+        sys.exit(1)
+    
+    if args.extract_parts < 1:
+        print("Error: --extract-parts must be at least 1")
+        sys.exit(1)
+    
+    if args.codec != 'auto':
+        try:
+            codec_name, _ = parse_codec(args.codec)
+        except ValueError as e:
+            print(f"Error: invalid --codec: {e}")
+            sys.exit(1)
+        if not codec_available(args.codec):
+            package = 'zstandard' if codec_name == 'zstd' else 'lz4'
+            print(f"Error: --codec {codec_name} needs the {package} package "
+                  f"(pip install {package})")
+            sys.exit(1)
+        extractors = CODECS[codec_name].extractors
+        if args.extractor != 'auto' and args.extractor not in extractors:
+            print(f"Error: --codec {codec_name} can only be extracted with "
+                  f"--extractor {' or '.join(extractors)} (or auto)")
+            sys.exit(1)
+    
+    if args.extract_parts > 1 and (args.streams > 1 or args.resumable):
+        print("Error: --extract-parts cannot be combined with --streams "
+              "or --resumable")
+        sys.exit(1)
+    
+    transport_options = {}
+    transport_matrix = None
+    try:
+        if args.window_size:
+            transport_options['window_size'] = parse_size(args.window_size)
+        if args.max_packet_size:
+            transport_options['max_packet_size'] = parse_size(args.max_packet_size)
+        if args.transport_sweep:
+            transport_matrix = parse_transport_matrix(args.transport_sweep)
+    except ValueError as e:
+        print(f"Error: invalid transport option: {e}")
+        sys.exit(1)
+    if args.ciphers:
+        transport_options['ciphers'] = args.ciphers.split(',')
+    if args.macs:
+        transport_options['macs'] = args.macs.split(',')
+    if args.compression:
+        transport_options['compress'] = True
+    for options in expand_transport_matrix(transport_matrix or {},
+                                           transport_options):
+        try:
+            prefer_algorithms(options.get('ciphers', ()),
+                              paramiko.Transport._preferred_ciphers)
+            prefer_algorithms(options.get('macs', ()),
+                              paramiko.Transport._preferred_macs)
+            if args.async_upload and asyncssh is not None:
+                asyncssh.SSHClientConnectionOptions(
+                    known_hosts=None, **asyncssh_options(options))
+        except ValueError as e:
+            print(f"Error: invalid --ciphers, --macs or --transport-sweep: {e}")
+            sys.exit(1)
+    
+    if args.advise and (args.sync or args.trials > 1 or args.warmup or
+                        sweep_counts or transport_matrix):
+        print("Error: --advise runs one method once and cannot be combined "
+              "with --sync, --trials, --warmup, --sweep-files or "
+              "--transport-sweep")
+        sys.exit(1)
+    
+    if transport_matrix and sweep_counts:
+        print("Error: --transport-sweep cannot be combined with --sweep-files")
+        sys.exit(1)
+    
+    if args.dedup and args.sync:
+        print("Error: --dedup cannot be combined with --sync")
+        sys.exit(1)
+    
+    if args.delta_threshold is not None and (not args.sync or
+                                             args.delta_threshold < 0):
+        print("Error: --delta-threshold needs --sync (other runs clear the "
+              "remote directory) and must be non-negative")
+        sys.exit(1)
+    
+    if args.sync and args.local_path and not os.path.isdir(args.local_path):
+        print("Error: --sync requires --local-path to be a directory")
+        sys.exit(1)
+    
+    targets = None
+    if args.hosts:
+        try:
+            targets = parse_hosts(args.hosts, args.port)
+        except ValueError as e:
+            print(f"Error: invalid --hosts: {e}")
+            sys.exit(1)
+        if (args.sync or args.resumable or args.streams > 1 or
+                args.extract_parts > 1 or args.trials > 1 or args.warmup or
+                args.advise or sweep_counts or transport_matrix or
+                args.instrument or args.trace or args.dedup):
+            print("Error: --hosts uploads once per host and cannot be combined "
+                  "with --sync, --resumable, --streams, --extract-parts, "
+                  "--trials, --warmup, --advise, --sweep-files, "
+                  "--transport-sweep, --instrument, --trace or --dedup")
+            sys.exit(1)
+        if args.fanout_concurrency < 1 or (args.bandwidth_cap is not None and
+                                           args.bandwidth_cap <= 0):
+            print("Error: --fanout-concurrency must be at least 1 and "
+                  "--bandwidth-cap positive")
+            sys.exit(1)
+        local_path = (args.local_path or
+                      generate_dataset(dataset_spec, args.dataset_dir))
+        try:
+            fanout = fanout_upload(
+                targets, args.username, args.password, local_path,
+                args.remote_dir, method=args.fanout_method,
+                concurrency=args.fanout_concurrency,
+                bandwidth_cap=(args.bandwidth_cap * 1024 * 1024
+                               if args.bandwidth_cap else None),
+                codec=args.codec, zip_workers=args.zip_workers,
+                extractor=args.extractor, workers=args.workers,
+                verify=args.verify, transport_options=transport_options,
+                persistent_shell=args.persistent_shell)
+        except KeyboardInterrupt:
+            print("\nUpload interrupted by user.")
+            sys.exit(1)
+        if fanout['failed_hosts']:
+            sys.exit(1)
+        return
+    
+    if args.instrument or args.trace:
+        sinks = [MemorySink()]
+        if args.trace:
+            sinks.append(JsonlTraceSink(args.trace))
+        enable_instrumentation(sinks)
+    
+    # Shared by the connection test and every benchmark method
+    pool = SSHSessionPool(args.host, args.port, args.username, args.password,
+                          transport_options=transport_options,
+                          persistent_shell=args.persistent_shell)
     try:
         print("Starting upload speed comparison test...")
         print(f"Host: {args.host}:{args.port}")
-        print(f"Local path: {args.local_path}")
+        if args.local_path:
+            print(f"Local path: {args.local_path}")
+        else:
+            print(f"Dataset: {describe_dataset(dataset_spec)}")
         print(f"Remote directory: {args.remote_dir}")
         
-        # Simple SSH connection test before doing anything expensive
-        if not test_ssh_connection(args.host, args.port, args.username, args.password):
+        # Simple SSH connection test before doing anything expensive; the
+        # connection it opens stays in the pool for the tests
+        if not test_ssh_connection(args.host, args.port, args.username,
+                                   args.password, pool):
             sys.exit(1)
         
-        # Check if the local path is very large
-        if os.path.isdir(args.local_path):
-            total_size = sum(
-                os.path.getsize(os.path.join(dirpath, filename))
-                for dirpath, dirnames, filenames in os.walk(args.local_path)
-                for filename in filenames
-            )
-            size_mb = total_size / (1024 * 1024)
-            print(f"Total size to upload: {size_mb:.1f} MB")
+        benchmark_options = {
+            'workers': args.workers,
+            'transports': args.transports,
+            'stream_zip': args.stream_zip,
+            'zip_workers': args.zip_workers,
+            'sync': args.sync,
+            'manifest_path': args.manifest,
+            'sync_delete': args.sync_delete,
+            'resume': {
+                'chunk_size': args.chunk_size * 1024 * 1024,
+                'checkpoint_dir': args.checkpoint_dir,
+                'max_retries': args.max_retries,
+                'backoff': args.retry_backoff,
+                'verify': args.verify_checksum
+            } if args.resumable else None,
+            'streams': args.streams,
+            'stream_chunk_size': args.stream_chunk_size * 1024 * 1024,
+            'async_upload': args.async_upload,
+            'async_channels': args.async_channels,
+            'async_inflight': args.async_inflight,
+            'hybrid': args.hybrid,
+            'extractor': args.extractor,
+            'extract_parts': args.extract_parts,
+            'codec': args.codec,
+            'small_file_threshold': args.small_file_threshold * 1024,
+            'batch_size': args.batch_size * 1024 * 1024,
+            'pool': pool,
+            'trials': args.trials,
+            'warmup': args.warmup,
+            'alpha': args.alpha,
+            'seed': args.seed,
+            'transport_options': transport_options,
+            'persistent_shell': args.persistent_shell,
+            'verify': args.verify,
+            'dedup': args.dedup,
+            'delta_threshold': (args.delta_threshold * 1024 * 1024
+                                if args.delta_threshold is not None else None)
+        }
+        
+        if sweep_counts:
+            points = run_sweep(args.host, args.port, args.username,
+                               args.password, args.remote_dir, dataset_spec,
+                               sweep_counts, cache_dir=args.dataset_dir,
+                               **benchmark_options)
+            runs = [(inventory, results, benchmark_options)
+                    for _, inventory, results in points]
+        else:
+            local_path = (args.local_path or
+                          generate_dataset(dataset_spec, args.dataset_dir))
             
-            if size_mb > 100:  # Warning for files larger than 100MB
-                print(f"\n⚠️  WARNING: Large folder detected ({size_mb:.1f} MB)")
-                print("   This may cause connection timeouts. Consider using a smaller test folder.")
-                print("   For testing, try using: tests/data_source")
+            # One scan serves the size check and every test
+            inventory = scan_tree(local_path)
+            
+            # Check if the local path is very large
+            if os.path.isdir(local_path):
+                size_mb = inventory['total_size'] / (1024 * 1024)
+                print(f"Total size to upload: {size_mb:.1f} MB")
                 
-                if not args.verbose:
-                    response = input("Continue anyway? (y/N): ")
-                    if response.lower() != 'y':
-                        print("Test cancelled.")
-                        sys.exit(0)
-        
-        # Run the comprehensive tests
-        run_comprehensive_tests(
-            host=args.host,
-            port=args.port,
-            username=args.username,
-            password=args.password,
-            local_path=args.local_path,
-            remote_dir=args.remote_dir
-        )
+                if size_mb > 100:  # Warning for files larger than 100MB
+                    print(f"\n⚠️  WARNING: Large folder detected ({size_mb:.1f} MB)")
+                    print("   This may cause connection timeouts. Consider using a smaller test folder.")
+                    print("   For testing, try using: tests/data_source")
+                    
+                    if not args.verbose:
+                        response = input("Continue anyway? (y/N): ")
+                        if response.lower() != 'y':
+                            print("Test cancelled.")
+                            sys.exit(0)
+            
+            if args.advise:
+                advisor_options = {
+                    key: value for key, value in benchmark_options.items()
+                    if key not in ('pool', 'trials', 'warmup', 'alpha',
+                                   'seed', 'transport_options',
+                                   'persistent_shell')
+                }
+                result = run_advisor(
+                    args.host, args.port, args.username, args.password,
+                    local_path, args.remote_dir, inventory, pool,
+                    args.advisor_log, args.seed, args.alpha, **advisor_options)
+                runs = [(inventory, [result], benchmark_options)]
+            elif transport_matrix:
+                # Every configuration needs its own connections
+                sweep_options = {key: value
+                                 for key, value in benchmark_options.items()
+                                 if key not in ('pool', 'transport_options')}
+                points = run_transport_sweep(
+                    args.host, args.port, args.username, args.password,
+                    local_path, args.remote_dir, transport_matrix,
+                    transport_options, inventory, **sweep_options)
+                runs = [(inventory, results,
+                         dict(benchmark_options, transport_options=point))
+                        for point, results in points]
+            else:
+                # Run the comprehensive tests
+                results = run_comprehensive_tests(
+                    host=args.host,
+                    port=args.port,
+                    username=args.username,
+                    password=args.password,
+                    local_path=local_path,
+                    remote_dir=args.remote_dir,
+                    inventory=inventory,
+                    **benchmark_options
+                )
+                runs = [(inventory, results, benchmark_options)]
+        
+        # Record the run(s) and check them against a baseline
+        records = [build_run_record(results, inventory, args.host, args.port,
+                                    args.remote_dir, options, args.label)
+                   for inventory, results, options in runs]
+        if args.export_json:
+            export_json(records, args.export_json)
+        if args.export_csv:
+            export_csv(records, args.export_csv)
+        history = load_history(args.history)
+        if not args.no_history:
+            for record in records:
+                append_history(record, args.history)
+        
+        if args.compare_to:
+            threshold = args.regression_threshold / 100
+            regressions = 0
+            for record in records:
+                baseline = find_run(history, args.compare_to, like=record)
+                if baseline is None:
+                    print(f"\nNo baseline matching '{args.compare_to}' for "
+                          f"dataset {record['dataset']['fingerprint']}")
+                    continue
+                rows = compare_runs(record, baseline, threshold, args.alpha)
+                regressions += print_comparison(record, baseline, rows,
+                                                threshold)
+            if regressions:
+                sys.exit(1)
         
     except KeyboardInterrupt:
         print("\nTest interrupted by user.")
@@ -526,6 +6353,9 @@ Examples:
             import traceback
             traceback.print_exc()
         sys.exit(1)
+    finally:
+        pool.close()
+        disable_instrumentation()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,749 @@
+"""
+Local SSH/SFTP stand-in server for offline benchmarking.
+
+Emulates the small subset of a Windows OpenSSH target that main.py relies on:
+an SFTP subsystem rooted in a local directory, and `powershell -Command`
+exec requests for create_remote_dir, clear_remote_directory, ssh_unzip and
+remote_sha256, also when they arrive framed over a persistent
+`powershell -Command -` shell. Of the extraction backends, Expand-Archive,
+.NET ZipFile and the bundled tar are available; 7-Zip and unzip are
+reported as missing. The emulated tar (a bsdtar) unpacks zstd and lz4 tars
+when the zstandard and lz4 packages are installed. Network conditions are
+shaped by a delaying proxy placed in front of every accepted connection, so
+every upload method can be benchmarked reproducibly on one machine.
+
+Use it in-process:
+
+    with StandinServer(rtt=0.02, bandwidth=10e6) as server:
+        run_comprehensive_tests('127.0.0.1', server.port, server.username,
+                                server.password, local_dir, 'C:/Uploads')
+
+or run it standalone and point main.py at the printed port:
+
+    python tests/local_server.py --rtt 20 --bandwidth 80
+"""
+import argparse
+import hashlib
+import heapq
+import os
+import re
+import shutil
+import socket
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+
+import paramiko
+from paramiko.sftp import SFTP_OK, SFTP_OP_UNSUPPORTED
+
+try:
+    import zstandard
+except ImportError:  # the emulated tar then lacks zstd support
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # the emulated tar then lacks lz4 support
+    lz4 = None
+
+# Minimum delay before answering an exec request (see run_exec)
+EXEC_REPLY_GRACE = 0.01
+
+# A long-lived PowerShell reading commands from stdin (see run_shell)
+SHELL_REQUEST = re.compile(r'^powershell(?:\.exe)? -NoLogo -NoProfile '
+                           r'-NonInteractive -Command -$')
+
+# One command as main.RemoteShell frames it on the shell's stdin
+SHELL_FRAME = re.compile(r'^\$global:LASTEXITCODE = 0; try \{ (?P<script>.*); '
+                         r'\$s = \$LASTEXITCODE \} catch \{ .* \}; '
+                         r'Write-Output "(?P<marker>\S+) \$s"$')
+
+
+class ShapedLink:
+    """Forward bytes between two sockets with injected latency and bandwidth cap."""
+
+    def __init__(self, outer, inner, rtt=0.0, bandwidth=None):
+        self.delay = rtt / 2.0
+        self.bandwidth = bandwidth
+        self.threads = [
+            threading.Thread(target=self._pump, args=(outer, inner), daemon=True),
+            threading.Thread(target=self._pump, args=(inner, outer), daemon=True),
+        ]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+
+    def _pump(self, src, dst):
+        # Each direction gets its own clock so bandwidth is shaped per direction
+        next_free = time.time()
+        pending = []
+        lock = threading.Condition()
+        closed = []
+
+        def sender():
+            while True:
+                with lock:
+                    while not pending and not closed:
+                        lock.wait()
+                    if not pending:
+                        break
+                    due, seq, data = pending[0]
+                    wait = due - time.time()
+                    if wait > 0:
+                        lock.wait(wait)
+                        continue
+                    heapq.heappop(pending)
+                try:
+                    dst.sendall(data)
+                except OSError:
+                    break
+            try:
+                dst.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+        t = threading.Thread(target=sender, daemon=True)
+        t.start()
+        seq = 0
+        while True:
+            try:
+                data = src.recv(65536)
+            except OSError:
+                data = b''
+            now = time.time()
+            if data and self.bandwidth:
+                next_free = max(next_free, now) + len(data) / self.bandwidth
+                due = next_free + self.delay
+            else:
+                due = now + self.delay
+            with lock:
+                if not data:
+                    closed.append(True)
+                    lock.notify()
+                    break
+                seq += 1
+                heapq.heappush(pending, (due, seq, data))
+                lock.notify()
+        t.join()
+
+
+class StandinSFTPHandle(paramiko.SFTPHandle):
+    """File handle that charges the configured per-operation overhead."""
+
+    def __init__(self, server, flags=0):
+        super().__init__(flags)
+        self.server = server
+
+    def write(self, offset, data):
+        self.server.op_delay()
+        return super().write(offset, data)
+
+    def read(self, offset, length):
+        self.server.op_delay()
+        return super().read(offset, length)
+
+    def close(self):
+        self.server.op_delay()
+        super().close()
+
+    def stat(self):
+        self.server.op_delay()
+        try:
+            self.writefile.flush()
+            return paramiko.SFTPAttributes.from_stat(
+                os.fstat(self.writefile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        # Only truncation is needed; set_file_attr would empty the file
+        self.server.op_delay()
+        if not attr._flags & attr.FLAG_SIZE:
+            return SFTP_OP_UNSUPPORTED
+        try:
+            self.writefile.truncate(attr.st_size)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+
+class StandinSFTPInterface(paramiko.SFTPServerInterface):
+    """SFTP subsystem backed by the stand-in server's root directory."""
+
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.standin = server.standin
+
+    def _local(self, path):
+        return self.standin.local_path(path)
+
+    def canonicalize(self, path):
+        return '/' + self.standin.remote_rel(path)
+
+    def list_folder(self, path):
+        self.standin.op_delay()
+        local = self._local(path)
+        try:
+            out = []
+            for name in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(
+                    os.stat(os.path.join(local, name)))
+                attr.filename = name
+                out.append(attr)
+            return out
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        self.standin.op_delay()
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        self.standin.op_delay()
+        local = self._local(path)
+        try:
+            binary_flag = getattr(os, 'O_BINARY', 0)
+            fd = os.open(local, flags | binary_flag, 0o666)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        try:
+            f = os.fdopen(fd, mode)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = StandinSFTPHandle(self.standin, flags)
+        handle.filename = local
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        self.standin.op_delay()
+        try:
+            os.remove(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        self.standin.op_delay()
+        try:
+            os.replace(self._local(oldpath), self._local(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    posix_rename = rename
+
+    def mkdir(self, path, attr):
+        self.standin.op_delay()
+        try:
+            os.mkdir(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rmdir(self, path):
+        self.standin.op_delay()
+        try:
+            os.rmdir(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+        self.standin.op_delay()
+        try:
+            paramiko.SFTPServer.set_file_attr(self._local(path), attr)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+
+class StandinServerInterface(paramiko.ServerInterface):
+    """Password-authenticated session server that emulates remote commands."""
+
+    def __init__(self, standin):
+        self.standin = standin
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (self.standin.username,
+                                    self.standin.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_OPEN_FAILED
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode() if isinstance(command, bytes) else command
+        threading.Thread(target=self.standin.run_exec,
+                         args=(channel, command), daemon=True).start()
+        return True
+
+
+class StandinServer:
+    """
+    In-process SSH/SFTP server with latency and bandwidth shaping.
+
+    rtt is the injected round-trip time in seconds, bandwidth the link cap
+    in bytes per second (None for unlimited), op_overhead the server-side
+    cost of every SFTP operation and exec_overhead the emulated process
+    start-up cost of every exec request (e.g. a cold PowerShell).
+    """
+
+    def __init__(self, root=None, rtt=0.0, bandwidth=None, op_overhead=0.0,
+                 exec_overhead=0.0, username='standin', password='standin',
+                 host='127.0.0.1', port=0):
+        self.root = root or tempfile.mkdtemp(prefix='standin_root_')
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        self.op_overhead = op_overhead
+        self.exec_overhead = exec_overhead
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self._sock = None
+        self._thread = None
+        self._transports = []
+        self._running = False
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(64)
+        self.port = self._sock.getsockname()[1]
+        self._running = True
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._sock:
+            self._sock.close()
+        for t in self._transports:
+            t.close()
+
+    def drop_connections(self):
+        """Close every connection accepted so far, as a network drop would."""
+        transports, self._transports = self._transports, []
+        for t in transports:
+            t.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                break
+            if self.rtt or self.bandwidth:
+                outer, inner = socket.socketpair()
+                ShapedLink(client, outer, self.rtt, self.bandwidth).start()
+                client = inner
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            # Offer zlib like OpenSSH does, so client compression can be tested
+            transport.use_compression(True)
+            transport.set_subsystem_handler(
+                'sftp', paramiko.SFTPServer, StandinSFTPInterface)
+            transport.standin = self
+            self._transports.append(transport)
+            # start_server blocks until negotiation ends; handshake off the
+            # accept loop so concurrent clients connect in parallel
+            threading.Thread(target=self._negotiate, args=(transport,),
+                             daemon=True).start()
+
+    def _negotiate(self, transport):
+        try:
+            transport.start_server(server=StandinServerInterface(self))
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+
+    # -- helpers -----------------------------------------------------------
+
+    def op_delay(self):
+        if self.op_overhead:
+            time.sleep(self.op_overhead)
+
+    def remote_rel(self, path):
+        """Normalise a remote path ('C:/x', '/x', 'x\\y') to a root-relative one."""
+        path = path.replace('\\', '/')
+        path = re.sub(r'^[A-Za-z]:', '', path)
+        parts = []
+        for part in path.split('/'):
+            if part in ('', '.'):
+                continue
+            if part == '..':
+                if parts:
+                    parts.pop()
+                continue
+            parts.append(part)
+        return '/'.join(parts)
+
+    def local_path(self, path):
+        return os.path.join(self.root, *self.remote_rel(path).split('/'))
+
+    # -- exec emulation ----------------------------------------------------
+
+    def run_exec(self, channel, command):
+        # The transport only acknowledges the exec request after
+        # check_channel_exec_request returns; answering before that makes
+        # the client see the channel close first
+        time.sleep(max(self.exec_overhead, EXEC_REPLY_GRACE))
+        if SHELL_REQUEST.match(command):
+            self.run_shell(channel)
+            return
+        try:
+            status, out, err = self.execute(command)
+        except Exception as e:
+            # Surface handler errors as a failed command, like a real shell
+            status, out, err = 1, '', f'{type(e).__name__}: {e}'
+        if out:
+            channel.sendall(out.encode())
+        if err:
+            channel.sendall_stderr(err.encode())
+        channel.send_exit_status(status)
+        channel.close()
+
+    def run_shell(self, channel):
+        """Serve framed commands until the client closes the shell's stdin.
+
+        The start-up cost was paid once in run_exec; each command is then
+        answered with its output and the frame's end marker and status.
+        """
+        buffer = b''
+        while True:
+            data = channel.recv(65536)
+            if not data:
+                break
+            buffer += data
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                channel.sendall(self.run_shell_line(line.decode()).encode())
+        channel.send_exit_status(0)
+        channel.close()
+
+    def run_shell_line(self, line):
+        frame = SHELL_FRAME.match(line.rstrip('\r'))
+        if not frame:
+            # Not a framed command, so there is no marker to answer with
+            return ''
+        try:
+            status, out, err = self.execute_script(frame.group('script'))
+        except Exception as e:
+            status, out, err = 1, '', f'{type(e).__name__}: {e}\n'
+        return f"{out}{err}{frame.group('marker')} {status}\n"
+
+    def execute_script(self, script):
+        """Run a line typed into PowerShell: a cmdlet script or a native command."""
+        for pattern, handler in COMMANDS + NATIVE_COMMANDS:
+            m = re.search(pattern, script, re.S)
+            if m:
+                return handler(self, **m.groupdict())
+        return 1, '', f'standin: unsupported PowerShell: {script}\n'
+
+    def execute(self, command):
+        """Run an emulated command, returning (exit_status, stdout, stderr)."""
+        match = re.match(r'^powershell(?:\.exe)? -Command "(.*)"\s*$', command,
+                         re.S)
+        if not match:
+            for pattern, handler in NATIVE_COMMANDS:
+                m = re.search(pattern, command, re.S)
+                if m:
+                    return handler(self, **m.groupdict())
+            return 127, '', f'standin: unsupported command: {command}\n'
+        script = match.group(1)
+        for pattern, handler in COMMANDS:
+            m = re.search(pattern, script, re.S)
+            if m:
+                return handler(self, **m.groupdict())
+        return 1, '', f'standin: unsupported PowerShell: {script}\n'
+
+
+def _cmd_create_dir(server, path):
+    os.makedirs(server.local_path(path), exist_ok=True)
+    return 0, f'Directory ready: {path}\n', ''
+
+
+def _cmd_clear_dir(server, path):
+    local = server.local_path(path)
+    if os.path.isdir(local):
+        shutil.rmtree(local)
+    elif os.path.exists(local):
+        os.remove(local)
+    return 0, f'Directory cleared: {path}\n', ''
+
+
+def _cmd_expand_archive(server, archive, dest):
+    dest = server.local_path(dest)
+    with zipfile.ZipFile(server.local_path(archive)) as zf:
+        # zipfile's own makedirs races with concurrent extractions
+        for name in zf.namelist():
+            os.makedirs(os.path.dirname(os.path.join(dest, name)),
+                        exist_ok=True)
+        zf.extractall(dest)
+    return 0, '', ''
+
+
+def _cmd_available(server):
+    return 0, '', ''
+
+
+def _cmd_echo(server, text):
+    return 0, text + '\n', ''
+
+
+def _cmd_tar_version(server):
+    libraries = 'zlib/1.2.13 liblzma/5.4.1 bz2lib/1.0.8'
+    if zstandard is not None:
+        libraries += ' libzstd/1.5.5'
+    if lz4 is not None:
+        libraries += ' liblz4/1.9.4'
+    return 0, f'bsdtar 3.7.2 - libarchive 3.7.2 {libraries}\n', ''
+
+
+def _cmd_tar_extract(server, archive, dest):
+    local_archive = server.local_path(archive)
+    if zipfile.is_zipfile(local_archive):
+        return _cmd_expand_archive(server, archive, dest)
+    with open(local_archive, 'rb') as f:
+        magic = f.read(4)
+    if magic == b'\x28\xb5\x2f\xfd' and zstandard is not None:
+        stream = zstandard.ZstdDecompressor().stream_reader(
+            open(local_archive, 'rb'), closefd=True)
+    elif magic == b'\x04\x22\x4d\x18' and lz4 is not None:
+        stream = lz4.frame.open(local_archive, 'rb')
+    else:
+        return 1, '', f'tar: Unrecognized archive format: {archive}\n'
+    dest = server.local_path(dest)
+    with stream, tarfile.open(fileobj=stream, mode='r|') as tar:
+        for member in tar:
+            # Same makedirs race as in _cmd_expand_archive
+            os.makedirs(os.path.dirname(os.path.join(dest, member.name)),
+                        exist_ok=True)
+            tar.extract(member, dest)
+    return 0, '', ''
+
+
+def _sha256(local):
+    digest = hashlib.sha256()
+    with open(local, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest().upper()
+
+
+def _cmd_file_hash(server, path):
+    return 0, _sha256(server.local_path(path)) + '\n', ''
+
+
+def _cmd_tree_hash(server, path, skip):
+    skip = set(re.findall(r"'([^']*)'", skip))
+    root = server.local_path(path)
+    if not os.path.isdir(root):
+        return 1, '', f"Resolve-Path : Cannot find path '{path}'\n"
+    lines = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if dirpath == root and name in skip:
+                continue
+            local = os.path.join(dirpath, name)
+            rel_path = os.path.relpath(local, root).replace(os.sep, '\\')
+            lines.append(f"{_sha256(local)} {rel_path}\n")
+    return 0, ''.join(lines), ''
+
+
+def _cmd_replicate(server, root, pairs, mode):
+    for pair in re.findall(r"'((?:[^']|'')*)'", pairs):
+        source, duplicate = pair.replace("''", "'").split('|')
+        source = server.local_path(f"{root}/{source}")
+        duplicate = server.local_path(f"{root}/{duplicate}")
+        os.makedirs(os.path.dirname(duplicate), exist_ok=True)
+        if os.path.exists(duplicate):
+            os.remove(duplicate)
+        if mode == 'HardLink':
+            os.link(source, duplicate)
+        else:
+            shutil.copyfile(source, duplicate)
+    return 0, '', ''
+
+
+def _delta_helper_loaded(server, helper):
+    # Add-Type would fail on a missing helper file
+    return os.path.isfile(server.local_path(helper))
+
+
+def _cmd_delta_signature(server, helper, path, block_size):
+    if not _delta_helper_loaded(server, helper):
+        return 1, '', f"Exception calling ReadAllText: '{helper}' not found\n"
+    lines = []
+    with open(server.local_path(path), 'rb') as f:
+        for block in iter(lambda: f.read(int(block_size)), b''):
+            lines.append(f"{zlib.adler32(block):08x}:"
+                         f"{hashlib.md5(block).hexdigest()}\n")
+    return 0, ''.join(lines), ''
+
+
+def _rebuild_delta(basis, ops, target, delta):
+    # Returns the helper's error message, or None once target is rebuilt
+    if ops.read(8) != b'UPDELTA2':
+        return f'not a delta file: {delta}\n'
+    block_size, size = struct.unpack('<IQ', ops.read(12))
+    expected = ops.read(32)
+    sha256 = hashlib.sha256()
+    while True:
+        op = ops.read(1)
+        if not op:
+            break
+        if op == b'C':
+            index, count = struct.unpack('<II', ops.read(8))
+            basis.seek(index * block_size)
+            data = basis.read(count * block_size)
+        elif op == b'L':
+            length, = struct.unpack('<I', ops.read(4))
+            data = ops.read(length)
+        else:
+            return f'bad delta op {op[0]}\n'
+        target.write(data)
+        sha256.update(data)
+    if target.tell() != size:
+        return 'rebuilt file has the wrong size\n'
+    if sha256.digest() != expected:
+        return 'rebuilt file does not match the delta hash\n'
+    return None
+
+
+def _cmd_delta_apply(server, helper, path, delta):
+    if not _delta_helper_loaded(server, helper):
+        return 1, '', f"Exception calling ReadAllText: '{helper}' not found\n"
+    local, local_delta = server.local_path(path), server.local_path(delta)
+    output = local + '.delta-new'
+    with open(local, 'rb') as basis, open(local_delta, 'rb') as ops, \
+            open(output, 'wb') as target:
+        error = _rebuild_delta(basis, ops, target, delta)
+    if error:
+        os.remove(output)
+        return 1, '', error
+    os.replace(output, local)
+    os.remove(local_delta)
+    return 0, '', ''
+
+
+# (regex over the PowerShell script, handler) pairs, first match wins
+COMMANDS = [
+    (r"^\(Get-FileHash -Algorithm SHA256 -LiteralPath '(?P<path>[^']*)'\)\.Hash",
+     _cmd_file_hash),
+    (r"^\$root = \(Resolve-Path -LiteralPath '(?P<path>[^']*)'\)\.Path.*"
+     r"-or \(\$true(?P<skip>(?: -and \$_\.Name -ne '[^']*')*)\) \}.*"
+     r"Get-FileHash -Algorithm SHA256", _cmd_tree_hash),
+    (r"ReadAllText\('(?P<helper>[^']*)'\)\) \}; "
+     r"\[UploadDelta\]::Signature\('(?P<path>[^']*)', (?P<block_size>\d+)\)$",
+     _cmd_delta_signature),
+    (r"ReadAllText\('(?P<helper>[^']*)'\)\) \}; "
+     r"\[UploadDelta\]::Apply\('(?P<path>[^']*)', '(?P<delta>[^']*)'\)$",
+     _cmd_delta_apply),
+    (r"^\$r = '(?P<root>[^']*)'; foreach \(\$p in @\((?P<pairs>.*)\)\) \{ "
+     r".*(?P<mode>Copy-Item|HardLink)", _cmd_replicate),
+    (r"^if \(!\(Test-Path '(?P<path>[^']*)'\)\) \{ New-Item ", _cmd_create_dir),
+    (r"^if \(Test-Path '(?P<path>[^']*)'\) \{ Remove-Item ", _cmd_clear_dir),
+    (r"^Expand-Archive -Path (?P<archive>\S+) -DestinationPath (?P<dest>\S+)",
+     _cmd_expand_archive),
+    (r"^Add-Type -AssemblyName System\.IO\.Compression\.FileSystem; "
+     r"\$z = \[System\.IO\.Compression\.ZipFile\]::OpenRead\('(?P<archive>[^']*)'\)"
+     r".*?Combine\('(?P<dest>[^']*)'", _cmd_expand_archive),
+    (r"^Get-Command Expand-Archive$", _cmd_available),
+    (r"^Add-Type -AssemblyName System\.IO\.Compression\.FileSystem$",
+     _cmd_available),
+    (r"^\$ErrorActionPreference = 'Stop'; "
+     r"\$ProgressPreference = 'SilentlyContinue'$", _cmd_available),
+    (r"^Write-Output '(?P<text>[^']*)'$", _cmd_echo),
+]
+
+# (regex over a command run without PowerShell, handler) pairs
+NATIVE_COMMANDS = [
+    (r'^tar --version$', _cmd_tar_version),
+    (r'^tar -xf "(?P<archive>[^"]*)" -C "(?P<dest>[^"]*)"$',
+     _cmd_tar_extract),
+]
+
+
+def main():
+    """Run the stand-in server until interrupted."""
+    parser = argparse.ArgumentParser(
+        description="Local SSH/SFTP stand-in for the upload speed comparison tool"
+    )
+    parser.add_argument('--port', type=int, default=2222,
+                        help='Port to listen on (default: 2222)')
+    parser.add_argument('--root',
+                        help='Directory served as the remote drive '
+                             '(default: a new temporary directory)')
+    parser.add_argument('--rtt', type=float, default=0.0,
+                        help='Injected round-trip time in ms (default: 0)')
+    parser.add_argument('--bandwidth', type=float,
+                        help='Link cap in Mbit/s per direction '
+                             '(default: unlimited)')
+    parser.add_argument('--op-overhead', type=float, default=0.0,
+                        help='Server cost of every SFTP operation in ms '
+                             '(default: 0)')
+    parser.add_argument('--exec-overhead', type=float, default=0.0,
+                        help='Start-up cost of every remote command in ms '
+                             '(default: 0)')
+    parser.add_argument('--username', default='standin',
+                        help='Accepted username (default: standin)')
+    parser.add_argument('--password', default='standin',
+                        help='Accepted password (default: standin)')
+    args = parser.parse_args()
+
+    server = StandinServer(
+        root=args.root, rtt=args.rtt / 1000,
+        bandwidth=args.bandwidth * 1e6 / 8 if args.bandwidth else None,
+        op_overhead=args.op_overhead / 1000,
+        exec_overhead=args.exec_overhead / 1000,
+        username=args.username, password=args.password, port=args.port
+    ).start()
+    print(f"Stand-in server listening on {server.host}:{server.port}, "
+          f"serving {server.root}")
+    print(f"  python main.py -H {server.host} --port {server.port} "
+          f"-u {server.username} -p {server.password} -l <local-path> "
+          f"-r C:/Uploads")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,685 @@
+"""
+Offline Integration Test for SFTP Upload Speed Comparison
+
+Runs the same end-to-end workflow as test_main.py, but against the local
+stand-in server in local_server.py instead of a real Windows VM, so it
+needs no .env file, credentials or network access.
+
+Integration Test Purpose:
+- Exercises every upload method (ZIP, recursive, streaming ZIP, asyncio and
+  hybrid) over a shaped link with injected latency and a bandwidth cap
+- Exercises the remote extraction backends, auto-detection and split
+  archives extracted in parallel
+- Runs the archive methods' remote commands through a persistent shell
+  and checks their trees with the batched remote hash verification
+- Uploads each distinct file content once and recreates the duplicates
+  remotely, by copy and by hardlink, verifying with the dedup hashes
+- Shares one connection pool between the connection test and several
+  methods, checking that no method opens a connection of its own
+- Picks an archive codec for compressible and incompressible trees
+- Resumes an upload cut short by a dropped connection over a longer
+  stale remote file
+- Runs the asyncio upload with tuned transport options (window, packet
+  size, cipher, MAC and compression)
+- Aborts a hybrid upload mid-way and checks that its archive builder
+  thread does not outlive it
+- Syncs a tree with both standard methods in turn, checking that each
+  uploads everything the first time and only an edited file after that
+- Syncs an edited large file as an rsync-style delta and checks that only
+  a fraction of it is sent, then deltas an emptied file
+- Runs main.py itself against the stand-in with --stream-zip, twice with
+  --sync around an edit, with --resumable over a dropped connection, with
+  --streams and with --hybrid over small and large files
+- Fans one archive out to several stand-in servers at once under a shared
+  bandwidth cap
+- Checks that each method produces a remote tree identical to the source
+- Gives reproducible timings for performance work on a single machine
+
+Network conditions can be tuned with the STANDIN_RTT_MS and
+STANDIN_BANDWIDTH_MBIT environment variables.
+"""
+import contextlib
+import filecmp
+import glob
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Add parent directory to system path for importing main module
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from local_server import StandinServer
+from main import (DELTA_SIGNATURE_SUFFIX, SSHSessionPool, choose_codec,
+                  delta_options, describe_transport, fanout_upload,
+                  hybrid_upload, parse_codec, remove_delta_helper,
+                  run_single_test, scan_tree, sftp_upload_delta,
+                  sftp_upload_resumable)
+# Renamed so that test runners do not collect it as a test
+from main import test_ssh_connection as check_ssh_connection
+
+LOCAL_DIR = os.path.join(parent_dir, 'tests', 'data_source')
+REMOTE_DIR = 'C:/test-upload'
+
+TEST_NAMES = [
+    "ZIP Upload Test",
+    "Recursive Upload Test",
+    "Streaming ZIP Test",
+    "Async Upload Test",
+    "Hybrid Upload Test",
+]
+
+# (extractor, extract_parts) combinations the ZIP method is also run with
+EXTRACTOR_RUNS = [
+    ('tar', 1),
+    ('dotnet', 2),
+    ('auto', 3),
+]
+
+# (method, dedup mode) runs; every file in data_source has the same content
+DEDUP_RUNS = [
+    ("ZIP Upload Test", 'copy'),
+    ("Recursive Upload Test", 'hardlink'),
+]
+
+# Size of the large file the delta test edits, and the delta threshold
+DELTA_FILE_SIZE = 4 * 1024 * 1024
+DELTA_THRESHOLD = 1024 * 1024
+
+# Size of the file the resume tests upload, and the chunk size they use
+RESUME_FILE_SIZE = 4 * 1024 * 1024
+RESUME_CHUNK_SIZE = 256 * 1024
+
+# Small files the hybrid abort test batches one per micro-archive
+HYBRID_ABORT_FILES = 20
+
+# Stand-in servers the fan-out test uploads to at once
+FANOUT_HOSTS = 2
+
+# Methods also run with their remote commands sent through a persistent
+# shell, and verified against local hashes
+SHELL_RUNS = ["ZIP Upload Test", "Streaming ZIP Test"]
+
+# Size of each tree the codec choice is made for
+CODEC_TREE_SIZE = 4 * 1024 * 1024
+
+# Transport options the asyncio test must apply to its own connection
+ASYNC_TRANSPORT_OPTIONS = {
+    'window_size': 4 * 1024 * 1024,
+    'max_packet_size': 64 * 1024,
+    'ciphers': ['aes128-ctr'],
+    'macs': ['hmac-sha2-256'],
+    'compress': True,
+}
+
+
+def trees_match(left, right):
+    """Return True if two directory trees hold the same files and contents.
+
+    Upload archives the ZIP methods leave in the remote root and delta
+    signature caches are ignored.
+    """
+    comparison = filecmp.dircmp(left, right)
+    extra = [name for name in comparison.right_only
+             if not name.startswith('upload_test_')
+             and not name.endswith(DELTA_SIGNATURE_SUFFIX)]
+    if comparison.left_only or extra:
+        return False
+    _, mismatch, errors = filecmp.cmpfiles(left, right, comparison.common_files,
+                                           shallow=False)
+    if mismatch or errors:
+        return False
+    return all(trees_match(os.path.join(left, name), os.path.join(right, name))
+               for name in comparison.common_dirs)
+
+
+def drop_when_written(server, remote_file, size):
+    """Drop the server's connections once remote_file reaches size bytes.
+
+    remote_file may be a glob pattern, for names only known once the upload
+    has started. Returns the watching thread.
+    """
+    def written():
+        for path in glob.glob(server.local_path(remote_file)):
+            with contextlib.suppress(OSError):
+                if os.path.getsize(path) >= size:
+                    return True
+        return False
+    
+    def watch():
+        while not written():
+            time.sleep(0.005)
+        server.drop_connections()
+    
+    thread = threading.Thread(target=watch, daemon=True)
+    thread.start()
+    return thread
+
+
+def run_pool_test(server, failures):
+    """Run the connection test and three methods over one pool."""
+    with SSHSessionPool('127.0.0.1', server.port, server.username,
+                        server.password) as pool:
+        if not check_ssh_connection('127.0.0.1', server.port, server.username,
+                                    server.password, pool=pool):
+            failures.append("Shared pool: connection test failed")
+            return
+        handshakes = {}
+        for test_name in ("ZIP Upload Test", "Recursive Upload Test",
+                          "Streaming ZIP Test"):
+            result = run_single_test(
+                '127.0.0.1', server.port, server.username, server.password,
+                LOCAL_DIR, REMOTE_DIR, test_name, workers=2, transports=2,
+                pool=pool
+            )
+            if not result['success']:
+                failures.append(f"Shared pool: {test_name} reported failure")
+                return
+            handshakes[test_name] = result['handshakes']
+        # Only the recursive test's second transport needs a new connection
+        expected = {"ZIP Upload Test": 0, "Recursive Upload Test": 1,
+                    "Streaming ZIP Test": 0}
+        if handshakes != expected or pool.handshakes != 2:
+            failures.append(f"Shared pool: handshakes {handshakes}, "
+                            f"{pool.handshakes} in total, expected 2")
+        else:
+            print(f"✓ Shared pool: {pool.handshakes} connections for the "
+                  f"connection test and {len(handshakes)} methods")
+
+
+def run_codec_test(server, failures):
+    """Let choose_codec pick for a text tree and a random one."""
+    source = tempfile.mkdtemp(prefix='codec_source_')
+    try:
+        trees = {'text': os.path.join(source, 'text'),
+                 'random': os.path.join(source, 'random')}
+        os.makedirs(trees['text'])
+        os.makedirs(trees['random'])
+        with open(os.path.join(trees['text'], 'log.txt'), 'w') as f:
+            for index in range(CODEC_TREE_SIZE // 32):
+                f.write(f"{index:08d} request served ok\n")
+        with open(os.path.join(trees['random'], 'data.bin'), 'wb') as f:
+            f.write(random.Random(4).randbytes(CODEC_TREE_SIZE))
+        
+        # Text must be worth compressing, random data never is
+        for content, compressed in (('text', True), ('random', False)):
+            with SSHSessionPool('127.0.0.1', server.port, server.username,
+                                server.password) as pool:
+                choice = choose_codec(pool, scan_tree(trees[content]),
+                                      f"{REMOTE_DIR}-codec")
+            name, _ = parse_codec(choice['codec'])
+            if (name != 'stored') != compressed:
+                failures.append(f"Codec choice for {content}: "
+                                f"{choice['codec']}")
+            else:
+                print(f"✓ Codec choice for {content}: {choice['codec']}")
+    finally:
+        shutil.rmtree(source)
+
+
+def run_resume_test(server, failures):
+    """Resume an interrupted upload whose remote file has a stale tail."""
+    source = tempfile.mkdtemp(prefix='resume_source_')
+    try:
+        local_file = os.path.join(source, 'large.bin')
+        with open(local_file, 'wb') as f:
+            f.write(random.Random(1).randbytes(RESUME_FILE_SIZE))
+        remote_file = f"{REMOTE_DIR}-resume/large.bin"
+        os.makedirs(os.path.dirname(server.local_path(remote_file)))
+        options = {'chunk_size': RESUME_CHUNK_SIZE, 'checkpoint_dir': source}
+        with SSHSessionPool('127.0.0.1', server.port, server.username,
+                            server.password) as pool:
+            watcher = drop_when_written(server, remote_file,
+                                        RESUME_FILE_SIZE // 4)
+            try:
+                sftp_upload_resumable(pool.open_sftp(), local_file,
+                                      remote_file, max_retries=0, **options)
+            except Exception:
+                pass
+            watcher.join()
+            # Data past the end of the file, as a longer earlier upload
+            # would have left
+            with open(server.local_path(remote_file), 'ab') as f:
+                f.write(b'stale' * RESUME_FILE_SIZE)
+            stats = sftp_upload_resumable(pool.revive().open_sftp(),
+                                          local_file, remote_file, **options)
+        if not stats['resumed_from']:
+            failures.append("Resume over a stale tail: upload did not resume")
+        elif not filecmp.cmp(local_file, server.local_path(remote_file),
+                             shallow=False):
+            failures.append("Resume over a stale tail: remote file differs")
+        else:
+            print(f"✓ Resume over a stale tail: resumed at "
+                  f"{stats['resumed_from'] / (1024 * 1024):.2f} MB")
+    finally:
+        shutil.rmtree(source)
+
+
+class AbortingSFTP:
+    """SFTP client wrapper whose uploads of file objects are interrupted."""
+
+    def __init__(self, sftp):
+        self.sftp = sftp
+
+    def putfo(self, *args, **kwargs):
+        raise KeyboardInterrupt
+
+    def __getattr__(self, name):
+        return getattr(self.sftp, name)
+
+
+def run_async_transport_test(server, failures):
+    """Run the asyncio upload over a pool with tuned transport options."""
+    with SSHSessionPool('127.0.0.1', server.port, server.username,
+                        server.password,
+                        transport_options=ASYNC_TRANSPORT_OPTIONS) as pool:
+        result = run_single_test(
+            '127.0.0.1', server.port, server.username, server.password,
+            LOCAL_DIR, REMOTE_DIR, "Async Upload Test", pool=pool
+        )
+    name = f"Async Upload Test ({describe_transport(ASYNC_TRANSPORT_OPTIONS)})"
+    if not result['success']:
+        failures.append(f"{name}: reported failure")
+    elif not trees_match(LOCAL_DIR, server.local_path(REMOTE_DIR)):
+        failures.append(f"{name}: remote tree differs from source")
+    else:
+        print(f"✓ {name}: {result['total_time']:.2f} seconds")
+
+
+def run_hybrid_abort_test(server, failures):
+    """Interrupt a hybrid upload and check that no thread is left behind."""
+    source = tempfile.mkdtemp(prefix='hybrid_source_')
+    try:
+        for index in range(HYBRID_ABORT_FILES):
+            with open(os.path.join(source, f"file{index}.txt"), 'w') as f:
+                f.write(f"small file {index}\n" * 64)
+        with SSHSessionPool('127.0.0.1', server.port, server.username,
+                            server.password) as pool:
+            ssh = pool.client()
+            sftp = ssh.open_sftp()
+            threads = set(threading.enumerate())
+            try:
+                hybrid_upload(ssh, AbortingSFTP(sftp), source,
+                              f"{REMOTE_DIR}-hybrid-abort", batch_size=1)
+                failures.append("Hybrid abort: the upload was not interrupted")
+            except KeyboardInterrupt:
+                pass
+            left = set(threading.enumerate()) - threads
+            sftp.close()
+        if left:
+            failures.append(f"Hybrid abort: {len(left)} thread(s) left running")
+        else:
+            print("✓ Hybrid abort: no thread left running")
+    finally:
+        shutil.rmtree(source)
+
+
+def run_sync_test(server, failures):
+    """Sync with both standard methods in turn, then again after an edit."""
+    source = tempfile.mkdtemp(prefix='sync_source_')
+    try:
+        local_dir = os.path.join(source, 'tree')
+        shutil.copytree(LOCAL_DIR, local_dir)
+        remote_dir = f"{REMOTE_DIR}-sync"
+        # Both methods are given the same manifest, as in a comparison run
+        options = {'sync': True, 'sync_delete': True,
+                   'manifest_path': os.path.join(source, 'manifest.json')}
+        for round_name, expected in (("first sync", None), ("resync", 1)):
+            for test_name in ("ZIP Upload Test", "Recursive Upload Test"):
+                result = run_single_test(
+                    '127.0.0.1', server.port, server.username,
+                    server.password, local_dir, remote_dir, test_name,
+                    **options)
+                label = f"{test_name} ({round_name})"
+                changed = expected or result['file_count']
+                if not result['success']:
+                    failures.append(f"{label}: reported failure")
+                elif result['changed_files'] != changed:
+                    failures.append(f"{label}: {result['changed_files']} "
+                                    f"files sent, expected {changed}")
+                elif not trees_match(local_dir, server.local_path(remote_dir)):
+                    failures.append(f"{label}: remote tree differs from source")
+                else:
+                    print(f"✓ {label}: {changed} file(s) sent")
+            with open(os.path.join(local_dir, 'file1.txt'), 'a') as f:
+                f.write('edited\n')
+    finally:
+        shutil.rmtree(source)
+
+
+def run_delta_test(server, failures):
+    """Sync a tree, edit its large file and check the resync sends a delta."""
+    source = tempfile.mkdtemp(prefix='delta_source_')
+    try:
+        shutil.copytree(LOCAL_DIR, os.path.join(source, 'tree'))
+        local_dir = os.path.join(source, 'tree')
+        large_file = os.path.join(local_dir, 'large.bin')
+        content = random.Random(0).randbytes(DELTA_FILE_SIZE)
+        with open(large_file, 'wb') as f:
+            f.write(content)
+        for test_name in ("Recursive Upload Test", "ZIP Upload Test"):
+            remote_dir = f"{REMOTE_DIR}-delta-{test_name.split()[0].lower()}"
+            options = {'sync': True, 'delta_threshold': DELTA_THRESHOLD,
+                       'manifest_path': os.path.join(
+                           source, f"{test_name.split()[0]}.json")}
+            run_single_test('127.0.0.1', server.port, server.username,
+                            server.password, local_dir, remote_dir, test_name,
+                            **options)
+            # An insertion shifts every later block; an append adds new data
+            with open(large_file, 'wb') as f:
+                f.write(content[:DELTA_FILE_SIZE // 3] + b'inserted' +
+                        content[DELTA_FILE_SIZE // 3:] + b'appended')
+            result = run_single_test(
+                '127.0.0.1', server.port, server.username, server.password,
+                local_dir, remote_dir, test_name, **options)
+            test_name += " (delta sync)"
+            sent = result.get('delta_sent_mb', 0) * 1024 * 1024
+            if not result['success']:
+                failures.append(f"{test_name}: reported failure")
+            elif not trees_match(local_dir, server.local_path(remote_dir)):
+                failures.append(f"{test_name}: remote tree differs from source")
+            elif not 0 < sent < DELTA_FILE_SIZE / 10:
+                failures.append(f"{test_name}: sent {sent:.0f} bytes")
+            else:
+                print(f"✓ {test_name}: {sent / 1024:.0f} KB sent for "
+                      f"{result['delta_file_mb']:.1f} MB")
+            with open(large_file, 'wb') as f:
+                f.write(content)
+        
+        # A file emptied since the last sync still has a large remote copy
+        empty_file = os.path.join(source, 'empty.bin')
+        open(empty_file, 'wb').close()
+        remote_file = f"{REMOTE_DIR}-delta-zip/large.bin"
+        with SSHSessionPool('127.0.0.1', server.port, server.username,
+                            server.password) as pool:
+            delta = delta_options(0, pool, f"{REMOTE_DIR}-delta-zip")
+            with pool.open_sftp() as sftp:
+                sftp_upload_delta(sftp, empty_file, remote_file,
+                                  delta['commands'], delta['helper'])
+            remove_delta_helper(pool, delta)
+        if os.path.getsize(server.local_path(remote_file)) != 0:
+            failures.append("Delta of an emptied file: remote copy not emptied")
+        else:
+            print("✓ Delta of an emptied file")
+        
+        # A remote copy rewritten in place with its size and mtime kept still
+        # passes the cache check, so only the delta hash catches it
+        remote_file = f"{REMOTE_DIR}-delta-recursive/large.bin"
+        stale_path = server.local_path(remote_file)
+        before = os.stat(stale_path)
+        with open(stale_path, 'wb') as f:
+            f.write(random.Random(1).randbytes(before.st_size))
+        os.utime(stale_path, ns=(before.st_atime_ns, before.st_mtime_ns))
+        with SSHSessionPool('127.0.0.1', server.port, server.username,
+                            server.password) as pool:
+            delta = delta_options(0, pool, f"{REMOTE_DIR}-delta-recursive")
+            with pool.open_sftp() as sftp:
+                result = sftp_upload_delta(sftp, large_file, remote_file,
+                                           delta['commands'], delta['helper'])
+            remove_delta_helper(pool, delta)
+        with open(stale_path, 'rb') as f:
+            rebuilt = f.read()
+        if result['signature'] != 'cache':
+            failures.append("Delta over a stale cache: cache not used")
+        elif result['mode'] != 'full' or rebuilt != content:
+            failures.append("Delta over a stale cache: remote file corrupted")
+        else:
+            print("✓ Delta over a stale cache falls back to a whole file")
+        helpers = [name for name in os.listdir(server.local_path('C:/'))
+                   if name.endswith('_delta_helper.cs')]
+        if helpers:
+            failures.append(f"Delta helper left behind: {', '.join(helpers)}")
+    finally:
+        shutil.rmtree(source)
+
+
+def run_archive_name_test(server, failures):
+    """Verify a tree holding a file named like the upload archives."""
+    source = tempfile.mkdtemp(prefix='archive_name_')
+    try:
+        local_dir = os.path.join(source, 'tree')
+        shutil.copytree(LOCAL_DIR, local_dir)
+        with open(os.path.join(local_dir, 'upload_test_notes.txt'), 'w') as f:
+            f.write('not an archive\n')
+        remote_dir = f"{REMOTE_DIR}-archive-name"
+        for test_name in ("ZIP Upload Test", "Streaming ZIP Test"):
+            result = run_single_test(
+                '127.0.0.1', server.port, server.username, server.password,
+                local_dir, remote_dir, test_name, verify=True)
+            test_name += " (user file named like an archive)"
+            if not result['verified']:
+                failures.append(f"{test_name}: not verified, mismatched "
+                                f"{result['mismatched_files']}")
+            elif not trees_match(local_dir, server.local_path(remote_dir)):
+                failures.append(f"{test_name}: remote tree differs from source")
+            else:
+                print(f"✓ {test_name}: {result['verified_files']} files "
+                      f"verified")
+    finally:
+        shutil.rmtree(source)
+
+
+def run_cli(server, local_path, remote_dir, flags, failures, label):
+    """Run main.py against the stand-in and return its exported run record.
+
+    The record's 'output' holds what main.py printed. Every method in the record must have succeeded and the remote tree must
+    match local_path; otherwise a failure is recorded and None returned.
+    """
+    with tempfile.TemporaryDirectory(prefix='cli_') as scratch:
+        record_path = os.path.join(scratch, 'run.json')
+        process = subprocess.run(
+            [sys.executable, os.path.join(parent_dir, 'main.py'),
+             '--host', '127.0.0.1', '--port', str(server.port),
+             '-u', server.username, '-p', server.password,
+             '-l', local_path, '-r', remote_dir, '--no-history',
+             '--export-json', record_path] + flags,
+            capture_output=True, text=True
+        )
+        if process.returncode or not os.path.exists(record_path):
+            failures.append(f"{label}: main.py exited with "
+                            f"{process.returncode}: {process.stdout[-500:]}")
+            return None
+        with open(record_path) as f:
+            record = json.load(f)
+    record['output'] = process.stdout
+    failed = [method['test_name'] for method in record['methods']
+              if not method['success']]
+    if failed:
+        failures.append(f"{label}: {', '.join(failed)} reported failure")
+        return None
+    if not trees_match(local_path, server.local_path(remote_dir)):
+        failures.append(f"{label}: remote tree differs from source")
+        return None
+    return record
+
+
+def run_cli_test(server, failures):
+    """Run main.py end to end with the optional method flags."""
+    label = "main.py --stream-zip"
+    record = run_cli(server, LOCAL_DIR, f"{REMOTE_DIR}-cli", ['--stream-zip'],
+                     failures, label)
+    if record is not None:
+        methods = [method['test_name'] for method in record['methods']]
+        if "Streaming ZIP Test" not in methods:
+            failures.append(f"{label}: no streaming ZIP result")
+        elif ("Run with --trials N" not in record['output']
+              or " method for better performance" in record['output']):
+            failures.append(f"{label}: recommended a method from one trial")
+        else:
+            print(f"✓ {label}: {', '.join(methods)}")
+    
+    source = tempfile.mkdtemp(prefix='cli_sync_')
+    try:
+        local_dir = os.path.join(source, 'tree')
+        shutil.copytree(LOCAL_DIR, local_dir)
+        flags = ['--sync', '--manifest', os.path.join(source, 'sync.json')]
+        for round_name, expected in (("first sync", 4), ("resync", 1)):
+            label = f"main.py --sync ({round_name})"
+            record = run_cli(server, local_dir, f"{REMOTE_DIR}-cli-sync",
+                             flags, failures, label)
+            if record is None:
+                continue
+            sent = {method['test_name']: method['changed_files']
+                    for method in record['methods']}
+            if set(sent.values()) != {expected}:
+                failures.append(f"{label}: files sent {sent}, "
+                                f"expected {expected} each")
+            else:
+                print(f"✓ {label}: {expected} file(s) sent by each method")
+            with open(os.path.join(local_dir, 'file2.txt'), 'a') as f:
+                f.write('edited\n')
+    finally:
+        shutil.rmtree(source)
+    
+    source = tempfile.mkdtemp(prefix='cli_large_')
+    try:
+        # An incompressible file makes the archive span several MB chunks
+        local_dir = os.path.join(source, 'tree')
+        shutil.copytree(LOCAL_DIR, local_dir)
+        with open(os.path.join(local_dir, 'large.bin'), 'wb') as f:
+            f.write(random.Random(2).randbytes(RESUME_FILE_SIZE))
+        
+        remote_dir = f"{REMOTE_DIR}-cli-resume"
+        label = "main.py --resumable over a dropped connection"
+        # Only the ZIP test's archive is large enough to be cut off
+        watcher = drop_when_written(server, f"{remote_dir}/upload_test_*.zip",
+                                    RESUME_FILE_SIZE // 2)
+        record = run_cli(server, local_dir, remote_dir,
+                         ['--resumable', '--chunk-size', '1',
+                          '--retry-backoff', '0.1',
+                          '--checkpoint-dir', source],
+                         failures, label)
+        watcher.join(timeout=1)
+        if record is not None:
+            zip_result = next(method for method in record['methods']
+                              if method['test_name'] == "ZIP Upload Test")
+            if watcher.is_alive() or not zip_result['reconnects']:
+                failures.append(f"{label}: the ZIP upload was not cut off")
+            else:
+                print(f"✓ {label}: {zip_result['reconnects']} reconnect(s)")
+        
+        label = "main.py --streams 2"
+        record = run_cli(server, local_dir, f"{REMOTE_DIR}-cli-streams",
+                         ['--streams', '2', '--stream-chunk-size', '1'],
+                         failures, label)
+        if record is not None:
+            zip_result = next(method for method in record['methods']
+                              if method['test_name'] == "ZIP Upload Test")
+            if zip_result.get('streams') != 2:
+                failures.append(f"{label}: {zip_result.get('streams')} "
+                                f"stream(s) used")
+            else:
+                print(f"✓ {label}: "
+                      f"{zip_result['aggregate_mbps']:.2f} MB/s aggregate")
+        
+        label = "main.py --hybrid"
+        record = run_cli(server, local_dir, f"{REMOTE_DIR}-cli-hybrid",
+                         ['--hybrid', '--workers', '2'], failures, label)
+        if record is not None:
+            hybrid = next(method for method in record['methods']
+                          if method['test_name'] == "Hybrid Upload Test")
+            if (hybrid['small_files'], hybrid['large_files']) != (4, 1):
+                failures.append(f"{label}: {hybrid['small_files']} small and "
+                                f"{hybrid['large_files']} large file(s), "
+                                f"expected 4 and 1")
+            else:
+                print(f"✓ {label}: {hybrid['batches']} batch(es) and "
+                      f"{hybrid['large_files']} large file(s)")
+    finally:
+        shutil.rmtree(source)
+
+
+def run_test():
+    """Run every upload method against the stand-in and verify the results."""
+    rtt = float(os.getenv('STANDIN_RTT_MS', '20')) / 1000
+    bandwidth = float(os.getenv('STANDIN_BANDWIDTH_MBIT', '100')) * 1e6 / 8
+
+    failures = []
+    with StandinServer(rtt=rtt, bandwidth=bandwidth) as server:
+        print(f"Stand-in server on port {server.port} "
+              f"(RTT {rtt * 1000:.0f} ms, {bandwidth * 8 / 1e6:.0f} Mbit/s)")
+        remote_root = server.local_path(REMOTE_DIR)
+        shell_pool = SSHSessionPool('127.0.0.1', server.port, server.username,
+                                    server.password, persistent_shell=True)
+        runs = [(test_name, {}) for test_name in TEST_NAMES]
+        runs += [("ZIP Upload Test", {'extractor': extractor,
+                                      'extract_parts': parts})
+                 for extractor, parts in EXTRACTOR_RUNS]
+        runs += [(test_name, {'pool': shell_pool, 'extractor': 'tar',
+                              'verify': True})
+                 for test_name in SHELL_RUNS]
+        runs += [(test_name, {'dedup': mode, 'verify': True})
+                 for test_name, mode in DEDUP_RUNS]
+        shell_saved = 0.0
+        for test_name, options in runs:
+            result = run_single_test(
+                '127.0.0.1', server.port, server.username, server.password,
+                LOCAL_DIR, REMOTE_DIR, test_name, workers=2, **options
+            )
+            if 'pool' in options:
+                shell_saved += result['shell_time_saved']
+                test_name += (f" (persistent shell, "
+                              f"{result['shell_commands']} commands, "
+                              f"{result['verified_files']} files verified)")
+            elif 'dedup' in options:
+                test_name += (f" ({result['duplicate_files']} duplicates "
+                              f"by {result['dedup_mode']}, "
+                              f"{result['verified_files']} files verified)")
+            elif options:
+                test_name += (f" ({result['extractor']}, "
+                              f"{result['extract_parts']} part(s))")
+            if not result['success']:
+                failures.append(f"{test_name}: reported failure")
+            elif not trees_match(LOCAL_DIR, remote_root):
+                failures.append(f"{test_name}: remote tree differs from source")
+            else:
+                print(f"✓ {test_name}: {result['total_time']:.2f} seconds")
+        shell_pool.close()
+        # Each test's saving is net of the start-ups it paid, as the pool's
+        if abs(shell_saved - shell_pool.shell_time_saved()) > 1e-9:
+            failures.append(f"Persistent shell: tests saved {shell_saved:.3f}"
+                            f" seconds, the pool "
+                            f"{shell_pool.shell_time_saved():.3f}")
+        run_pool_test(server, failures)
+        run_codec_test(server, failures)
+        run_resume_test(server, failures)
+        run_async_transport_test(server, failures)
+        run_hybrid_abort_test(server, failures)
+        run_sync_test(server, failures)
+        run_delta_test(server, failures)
+        run_archive_name_test(server, failures)
+        run_cli_test(server, failures)
+    
+    with contextlib.ExitStack() as stack:
+        servers = [stack.enter_context(StandinServer(rtt=rtt,
+                                                     bandwidth=bandwidth))
+                   for _ in range(FANOUT_HOSTS)]
+        fanout = fanout_upload(
+            [('127.0.0.1', server.port) for server in servers],
+            servers[0].username, servers[0].password, LOCAL_DIR, REMOTE_DIR,
+            bandwidth_cap=bandwidth, verify=True)
+        for server, result in zip(servers, fanout['hosts']):
+            test_name = f"Fan-out to port {server.port}"
+            if not result['success']:
+                failures.append(f"{test_name}: {result['error']}")
+            elif not trees_match(LOCAL_DIR, server.local_path(REMOTE_DIR)):
+                failures.append(f"{test_name}: remote tree differs from source")
+            else:
+                print(f"✓ {test_name}: {result['total_time']:.2f} seconds")
+
+    if failures:
+        for failure in failures:
+            print(f"✗ {failure}")
+        sys.exit(1)
+    print("All upload methods produced an identical remote tree")
+
+
+if __name__ == "__main__":
+    run_test()
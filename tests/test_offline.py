@@ -0,0 +1,632 @@
+"""
+Offline Checks for SFTP Upload Speed Comparison
+
+Exercises the parts of main.py that need neither a server nor the stand-in
+in local_server.py: upload planning, statistics, dataset generation,
+archive building and the result bookkeeping around them. Each check runs
+in well under a second.
+
+Checks:
+- Scans a tree once into the same files and sizes os.walk finds
+- Plans a recursive upload with every parent directory before its children
+- Counts the requests and cache hits of the remote directory cache
+- Maps SSH transport options onto asyncssh connection options
+- Builds a zip with chunks deflated in parallel and checks that it unpacks
+  to the same bytes as one written by zipfile
+- Compares the trial statistics and Welch's t-test with published values
+- Rejects malformed dataset specs and regenerates the same tree from the
+  same seed
+- Flags regressions between run records and resolves run references
+- Buckets operation latencies and collects per-phase instrumentation
+- Parses archive codec specs and their levels
+- Parses a transport sweep and expands it into every combination
+- Predicts method times from a tree profile and link probes
+"""
+import filecmp
+import json
+import os
+import random
+import shutil
+import stat
+import sys
+import tempfile
+import zipfile
+import zlib
+
+import paramiko
+
+# Add parent directory to system path for importing main module
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, parent_dir)
+
+from main import (Instrumentation, MemorySink, RemoteDirCache, asyncssh,
+                  asyncssh_options, build_upload_plan,
+                  calculate_directory_stats, codec_extractors, compare_runs,
+                  crc32_combine, dataset_fingerprint, expand_transport_matrix,
+                  find_run, generate_dataset, parse_codec, parse_dataset_spec,
+                  parse_transport_matrix, predict_methods, scan_tree,
+                  summarize_samples, t_critical, welch_t_test,
+                  zip_folder_parallel)
+
+LOCAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'data_source')
+REMOTE_DIR = "C:/test-upload"
+
+# Chunk size for the parallel zip check, small enough to split every file
+PARALLEL_CHUNK_SIZE = 64 * 1024
+
+# Welch's t-test examples from Wikipedia, with their published p-values
+WELCH_EXAMPLES = [
+    ([27.5, 21.0, 19.0, 23.6, 17.0, 17.9, 16.9, 20.1, 21.9, 22.6, 23.1, 19.6,
+      19.0, 21.7, 21.4],
+     [27.1, 22.0, 20.8, 23.4, 23.4, 23.5, 25.8, 22.0, 24.8, 20.2, 21.9, 22.1,
+      22.9, 20.5, 24.4],
+     0.021),
+    ([17.2, 20.9, 22.6, 18.1, 21.7, 21.4, 23.5, 24.2, 14.7, 21.8],
+     [21.5, 22.8, 21.0, 23.0, 21.6, 23.6, 22.5, 20.7, 23.4, 21.8, 20.7, 21.7,
+      21.5, 22.5, 23.6, 21.5, 22.5, 23.5, 21.5, 21.8],
+     0.149),
+]
+
+# Two-sided 5% critical values of Student's t, from a t table
+T_TABLE = {1: 12.706, 4: 2.776, 10: 2.228, 30: 2.042}
+
+# Small generated tree: bimodal sizes over two levels of directories
+DATASET_SPEC = ("files=40,size=2KB,dist=bimodal,large_size=64KB,"
+                "large_fraction=0.1,depth=2,fanout=2,content=random")
+
+# Codec specs and how parse_codec reads them
+CODEC_SPECS = {'stored': ('stored', None), 'deflate': ('deflate', None),
+               'deflate:1': ('deflate', 1), 'bzip2:9': ('bzip2', 9),
+               'zstd:22': ('zstd', 22), 'lz4:0': ('lz4', 0)}
+
+# Codec specs parse_codec must reject: unknown, levelless, out of range
+BAD_CODEC_SPECS = ['gzip', 'stored:1', 'lzma:6', 'deflate:0', 'deflate:10',
+                   'zstd:23', 'deflate:fast']
+
+# A transport sweep over every axis, and how it parses
+TRANSPORT_SWEEP = ("window=2MB,16MB; packet=32KB;cipher=aes128-ctr,"
+                   "aes128-gcm@openssh.com;mac=hmac-sha2-256;COMPRESS=off,on")
+TRANSPORT_MATRIX = {
+    'window_size': [2 * 1024 * 1024, 16 * 1024 * 1024],
+    'max_packet_size': [32 * 1024],
+    'ciphers': [['aes128-ctr'], ['aes128-gcm@openssh.com']],
+    'macs': [['hmac-sha2-256']],
+    'compress': [False, True],
+}
+
+# Transport sweeps parse_transport_matrix must reject
+BAD_TRANSPORT_SWEEPS = ['', 'latency=20ms', 'window=', 'compress=maybe',
+                        'packet=big']
+
+MB = 1024 * 1024
+
+# Advisor probes: 50 ms per upload round trip at 10 MB/s, 0.5 s commands
+ADVISOR_PROBE = {'rtt': 0.05, 'exec': 0.5, 'session': 0.1, 'put': 0.05,
+                 'mkdir': 0.05, 'bandwidth': 10 * MB, 'extract': 0.2}
+
+# Methods the advisor predicts, with their options
+ADVISOR_METHODS = [
+    ("ZIP Upload Test", {'codec': 'deflate', 'zip_workers': 1}),
+    ("Streaming ZIP Test", {'codec': 'deflate', 'zip_workers': 1}),
+    ("Recursive Upload Test", {'workers': 4}),
+    ("Hybrid Upload Test", {'batch_size': 8 * MB, 'workers': 4}),
+]
+
+# Malformed dataset specs parse_dataset_spec must reject
+BAD_DATASET_SPECS = ["files=10,colour=red", "dist=uniform", "content=zeros",
+                     "files=0", "fanout=0", "depth=-1", "size=lots"]
+
+
+def check_scan_tree(failures):
+    """Compare a single scan with os.walk, for a tree and for one file."""
+    inventory = scan_tree(LOCAL_DIR)
+    walked = {}
+    for root, _, files in os.walk(LOCAL_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, LOCAL_DIR).replace(os.sep, '/')
+            walked[rel_path] = os.path.getsize(path)
+    scanned = {entry.rel_path: entry.size for entry in inventory['files']}
+    if scanned != walked:
+        failures.append(f"Tree scan: {scanned}, os.walk found {walked}")
+        return
+    if (inventory['total_size'] != sum(walked.values())
+            or calculate_directory_stats(LOCAL_DIR, inventory)
+            != (len(walked), sum(walked.values()))):
+        failures.append(f"Tree scan: total size {inventory['total_size']}")
+        return
+    if inventory['dirs'][0] != '' or 'nested_folder' not in inventory['dirs']:
+        failures.append(f"Tree scan: directories {inventory['dirs']}")
+        return
+    
+    single = scan_tree(os.path.join(LOCAL_DIR, 'file1.txt'))
+    if ([entry.rel_path for entry in single['files']] != ['file1.txt']
+            or single['total_size'] != walked['file1.txt']):
+        failures.append(f"Tree scan of one file: {single['files']}")
+        return
+    print(f"✓ Tree scan: {len(walked)} files, {len(inventory['dirs'])} dirs")
+
+
+def check_upload_plan(failures):
+    """Plan a tree upload, then one restricted to a single nested file."""
+    inventory = scan_tree(LOCAL_DIR)
+    dirs, jobs = build_upload_plan(LOCAL_DIR, REMOTE_DIR + '/',
+                                   inventory=inventory)
+    remote_files = sorted(remote for _, remote, _ in jobs)
+    expected = sorted(REMOTE_DIR + '/' + entry.rel_path
+                      for entry in inventory['files'])
+    if remote_files != expected:
+        failures.append(f"Upload plan: files {remote_files}, "
+                        f"expected {expected}")
+        return
+    for index, rdir in enumerate(dirs):
+        parent = rdir.rsplit('/', 1)[0]
+        if rdir != REMOTE_DIR and parent not in dirs[:index]:
+            failures.append(f"Upload plan: {rdir} planned before {parent}")
+            return
+    if any(remote.rsplit('/', 1)[0] not in dirs for _, remote, _ in jobs):
+        failures.append("Upload plan: a file's directory is not planned")
+        return
+    
+    dirs, jobs = build_upload_plan(LOCAL_DIR, REMOTE_DIR,
+                                   files=['nested_folder/file1.txt'],
+                                   inventory=inventory)
+    if dirs != [REMOTE_DIR, REMOTE_DIR + '/nested_folder'] or len(jobs) != 1:
+        failures.append(f"Upload plan of one file: {dirs}, {len(jobs)} jobs")
+        return
+    print(f"✓ Upload plan: {len(expected)} files, parents before children")
+
+
+class DirectorySFTP:
+    """Just enough of an SFTPClient for RemoteDirCache: mkdir and stat."""
+
+    def __init__(self, existing=()):
+        self.dirs = set(existing)
+        self.requests = []
+
+    def mkdir(self, path):
+        self.requests.append(('mkdir', path))
+        if path in self.dirs:
+            raise IOError(f"{path} already exists")
+        self.dirs.add(path)
+
+    def stat(self, path):
+        self.requests.append(('stat', path))
+        attrs = paramiko.SFTPAttributes()
+        attrs.st_mode = stat.S_IFDIR
+        return attrs
+
+
+def check_dir_cache(failures):
+    """Create a tree's directories through the cache, then ask again."""
+    sftp = DirectorySFTP(existing={'C:'})
+    dir_cache = RemoteDirCache()
+    for rdir in ("C:/upload", "C:/upload/a/b", "C:/upload/a", "C:/upload/a/c"):
+        dir_cache.ensure(sftp, rdir)
+    # "C:" already existed: one mkdir and one stat, then one mkdir per level
+    if dir_cache.calls != len(sftp.requests) or dir_cache.calls != 6:
+        failures.append(f"Directory cache: {dir_cache.calls} calls counted, "
+                        f"{len(sftp.requests)} sent, expected 6")
+        return
+    if dir_cache.hits != 1:
+        failures.append(f"Directory cache: {dir_cache.hits} hits, expected 1")
+        return
+    for rdir in ("C:/upload/a/b", "C:/upload/a/c/", "C:\\upload"):
+        dir_cache.ensure(sftp, rdir)
+    if len(sftp.requests) != 6 or dir_cache.hits != 4:
+        failures.append(f"Directory cache: {len(sftp.requests)} requests and "
+                        f"{dir_cache.hits} hits after repeats, expected 6 and 4")
+        return
+    print(f"✓ Directory cache: {dir_cache.calls} requests, "
+          f"{dir_cache.hits} hits")
+
+
+def check_asyncssh_options(failures):
+    """Translate every transport option, and nothing for the defaults."""
+    if asyncssh_options(None) or asyncssh_options({}):
+        failures.append("asyncssh options: defaults are not left to asyncssh")
+        return
+    options = asyncssh_options({'window_size': 4 * 1024 * 1024,
+                                'max_packet_size': 64 * 1024,
+                                'ciphers': ['aes128-ctr', 'aes256-ctr'],
+                                'macs': ['hmac-sha2-256'],
+                                'compress': True})
+    expected = {'window': 4 * 1024 * 1024,
+                'max_pktsize': 64 * 1024,
+                'encryption_algs': '^aes128-ctr,aes256-ctr',
+                'mac_algs': '^hmac-sha2-256',
+                'compression_algs': ['zlib@openssh.com', 'zlib', 'none']}
+    if options != expected:
+        failures.append(f"asyncssh options: {options}")
+        return
+    if asyncssh is not None:
+        # asyncssh validates names and sizes when the options are built
+        try:
+            asyncssh.SSHClientConnectionOptions(known_hosts=None, **options)
+        except ValueError as e:
+            failures.append(f"asyncssh options: rejected by asyncssh: {e}")
+            return
+    print(f"✓ asyncssh options: {', '.join(sorted(options))}")
+
+
+def check_parallel_zip(failures):
+    """Deflate multi-chunk, empty and stored members in a process pool."""
+    rng = random.Random(3)
+    contents = {
+        'text.txt': b''.join(f"line {index}\n".encode()
+                             for index in range(40000)),
+        'random.bin': rng.randbytes(5 * PARALLEL_CHUNK_SIZE // 2),
+        'empty.txt': b'',
+        'nested/photo.jpg': rng.randbytes(PARALLEL_CHUNK_SIZE + 1),
+    }
+    scratch = tempfile.mkdtemp(prefix='parallel_zip_')
+    try:
+        source = os.path.join(scratch, 'tree')
+        for rel_path, data in contents.items():
+            path = os.path.join(source, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        members = scan_tree(source)['files']
+        parallel_zip = os.path.join(scratch, 'parallel.zip')
+        zip_folder_parallel(members, parallel_zip, workers=2,
+                            chunk_size=PARALLEL_CHUNK_SIZE)
+        serial_zip = os.path.join(scratch, 'serial.zip')
+        with zipfile.ZipFile(serial_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for entry in members:
+                zipf.write(entry.path, arcname=entry.rel_path)
+        
+        with zipfile.ZipFile(parallel_zip) as parallel, \
+                zipfile.ZipFile(serial_zip) as serial:
+            if parallel.testzip() is not None:
+                failures.append("Parallel zip: a member fails its CRC check")
+                return
+            if sorted(parallel.namelist()) != sorted(serial.namelist()):
+                failures.append(f"Parallel zip: members {parallel.namelist()}")
+                return
+            for name in serial.namelist():
+                if parallel.read(name) != serial.read(name):
+                    failures.append(f"Parallel zip: {name} differs")
+                    return
+    finally:
+        shutil.rmtree(scratch)
+    
+    data = contents['text.txt']
+    split = len(data) // 3
+    combined = crc32_combine(zlib.crc32(data[:split]), zlib.crc32(data[split:]),
+                             len(data) - split)
+    if combined != zlib.crc32(data):
+        failures.append("Parallel zip: crc32_combine disagrees with zlib")
+        return
+    print(f"✓ Parallel zip: {len(contents)} members match zipfile's archive")
+
+
+def check_statistics(failures):
+    """Check the summary of a small sample and the t-test p-values."""
+    for df, expected in T_TABLE.items():
+        if abs(t_critical(df, 0.05) - expected) > 0.001:
+            failures.append(f"Statistics: t critical for df={df} is "
+                            f"{t_critical(df, 0.05):.4f}, expected {expected}")
+            return
+    
+    summary = summarize_samples([1, 2, 3, 4, 5])
+    # mean 3, stddev sqrt(2.5), half-width 2.776 * sqrt(2.5 / 5)
+    expected = {'n': 5, 'median': 3, 'p95': 4.8, 'mean': 3.0,
+                'stddev': 1.5811, 'ci_low': 1.0368, 'ci_high': 4.9632}
+    if any(abs(summary[key] - value) > 0.0001
+           for key, value in expected.items()):
+        failures.append(f"Statistics: summary {summary}")
+        return
+    single = summarize_samples([2.5])
+    if (single['stddev'], single['ci_low'], single['ci_high']) != (0.0, 2.5, 2.5):
+        failures.append(f"Statistics: summary of one sample {single}")
+        return
+    
+    for a, b, expected in WELCH_EXAMPLES:
+        p_value = welch_t_test(a, b)
+        if abs(p_value - expected) > 0.0005:
+            failures.append(f"Statistics: Welch p-value {p_value:.4f}, "
+                            f"expected {expected}")
+            return
+    if welch_t_test([1.0], [2.0, 3.0]) is not None:
+        failures.append("Statistics: Welch's test ran on a single sample")
+        return
+    if welch_t_test([1.0, 1.0], [2.0, 2.0]) != 0.0:
+        failures.append("Statistics: constant, different samples not "
+                        "significant")
+        return
+    print(f"✓ Statistics: {len(T_TABLE)} t-table values and "
+          f"{len(WELCH_EXAMPLES)} Welch examples")
+
+
+def check_dataset(failures):
+    """Reject bad specs, then generate one spec twice and another seed once."""
+    for text in BAD_DATASET_SPECS:
+        try:
+            parse_dataset_spec(text)
+            failures.append(f"Dataset: spec '{text}' was accepted")
+            return
+        except ValueError:
+            pass
+    spec = parse_dataset_spec(DATASET_SPEC)
+    if (spec['files'], spec['size'], spec['large_size'], spec['seed']) != \
+            (40, 2048, 64 * 1024, 0):
+        failures.append(f"Dataset: spec parsed as {spec}")
+        return
+    
+    scratch = tempfile.mkdtemp(prefix='dataset_')
+    try:
+        # Separate cache directories, so the second tree is really rebuilt
+        first = generate_dataset(spec, os.path.join(scratch, 'first'))
+        second = generate_dataset(spec, os.path.join(scratch, 'second'))
+        other = generate_dataset(dict(spec, seed=1),
+                                 os.path.join(scratch, 'other'))
+        inventory = scan_tree(first)
+        fingerprint = dataset_fingerprint(inventory)
+        if len(inventory['files']) != spec['files']:
+            failures.append(f"Dataset: {len(inventory['files'])} files "
+                            f"generated, expected {spec['files']}")
+            return
+        if dataset_fingerprint(scan_tree(second)) != fingerprint:
+            failures.append("Dataset: the same seed gave another tree")
+            return
+        _, mismatch, errors = filecmp.cmpfiles(
+            first, second, [entry.rel_path for entry in inventory['files']],
+            shallow=False)
+        if mismatch or errors:
+            failures.append("Dataset: the same seed gave other contents")
+            return
+        if dataset_fingerprint(scan_tree(other)) == fingerprint:
+            failures.append("Dataset: another seed gave the same tree")
+            return
+        if generate_dataset(spec, os.path.join(scratch, 'first')) != first:
+            failures.append("Dataset: the cached tree was not reused")
+            return
+    finally:
+        shutil.rmtree(scratch)
+    print(f"✓ Dataset: {len(BAD_DATASET_SPECS)} bad specs rejected, "
+          f"seeded tree {fingerprint} reproduced")
+
+
+def make_record(run_id, totals, label=None, fingerprint='tree-a'):
+    """Return a minimal run record with one method's total time samples."""
+    return {
+        'run_id': run_id,
+        'label': label,
+        'target': {'host': '127.0.0.1', 'port': 22, 'remote_dir': REMOTE_DIR},
+        'dataset': {'fingerprint': fingerprint},
+        'methods': [{
+            'test_name': "ZIP Upload Test",
+            'samples': {'total_time': totals},
+            'stats': {'total_time': summarize_samples(totals)}
+        }]
+    }
+
+
+def check_instrumentation(failures):
+    """Summarise known latencies, then record a test through a MemorySink."""
+    sink = MemorySink()
+    # 1 ms to 100 ms; the bucket of a latency is the first bound >= it
+    for milliseconds in range(1, 101):
+        sink.emit({'test': 'latencies', 'phase': 'upload', 'op': 'write',
+                   'seconds': milliseconds / 1000, 'bytes': 10})
+    summary = sink.pop_summary('latencies')
+    write = summary['ops']['write']
+    expected_histogram = {'<=1ms': 1, '<=2ms': 1, '<=5ms': 3, '<=10ms': 5,
+                          '<=20ms': 10, '<=50ms': 30, '<=100ms': 50}
+    if (write['count'], write['histogram']) != (100, expected_histogram):
+        failures.append(f"Instrumentation: histogram {write['histogram']}")
+        return
+    if (write['p50'], write['p95'], write['max']) != (0.051, 0.096, 0.1):
+        failures.append(f"Instrumentation: p50 {write['p50']}, "
+                        f"p95 {write['p95']}, max {write['max']}")
+        return
+    if summary['phases']['upload']['bytes'] != 1000:
+        failures.append("Instrumentation: phase bytes were not summed")
+        return
+    
+    instrumentation = Instrumentation([MemorySink()], sample_interval=0.0)
+    instrumentation.begin_test("ZIP Upload Test")
+    instrumentation.set_phase('zip')
+    instrumentation.set_phase('upload')
+    for _ in range(3):
+        with instrumentation.op('write', bytes=1024):
+            instrumentation.transferred(1024)
+    summary = instrumentation.end_test()
+    instrumentation.close()
+    if set(summary['phases']) != {'zip', 'upload'}:
+        failures.append(f"Instrumentation: phases {list(summary['phases'])}")
+        return
+    if (summary['phases']['upload']['ops']['write']['count'] != 3
+            or summary['ops']['write']['count'] != 3):
+        failures.append("Instrumentation: writes were not all recorded")
+        return
+    if not summary['throughput']:
+        failures.append("Instrumentation: no throughput samples")
+        return
+    print(f"✓ Instrumentation: {len(expected_histogram)} latency buckets, "
+          f"{len(summary['throughput'])} throughput samples")
+
+
+def check_codecs(failures):
+    """Parse good and bad codec specs and list who can extract them."""
+    for text, expected in CODEC_SPECS.items():
+        if parse_codec(text) != expected:
+            failures.append(f"Codecs: '{text}' parsed as {parse_codec(text)}")
+            return
+    for text in BAD_CODEC_SPECS:
+        try:
+            parse_codec(text)
+            failures.append(f"Codecs: spec '{text}' was accepted")
+            return
+        except ValueError:
+            pass
+    if ('expand-archive' not in codec_extractors('deflate:9')
+            or codec_extractors('zstd') != ('tar',)
+            or codec_extractors('lzma') != ('7z',)):
+        failures.append("Codecs: wrong extractors for deflate, zstd or lzma")
+        return
+    print(f"✓ Codecs: {len(CODEC_SPECS)} specs parsed, "
+          f"{len(BAD_CODEC_SPECS)} rejected")
+
+
+def check_transport_matrix(failures):
+    """Parse good and bad sweeps, then expand one over base options."""
+    matrix = parse_transport_matrix(TRANSPORT_SWEEP)
+    if matrix != TRANSPORT_MATRIX:
+        failures.append(f"Transport sweep: parsed as {matrix}")
+        return
+    for text in BAD_TRANSPORT_SWEEPS:
+        try:
+            parse_transport_matrix(text)
+            failures.append(f"Transport sweep: '{text}' was accepted")
+            return
+        except ValueError:
+            pass
+    
+    # Swept axes replace the base options, the others are kept
+    base = {'compress': True, 'macs': ['hmac-sha1']}
+    points = expand_transport_matrix(
+        {'window_size': [1, 2], 'compress': [False, True]}, base)
+    expected = [{'window_size': window, 'compress': compress,
+                 'macs': ['hmac-sha1']}
+                for window in (1, 2) for compress in (False, True)]
+    if points != expected:
+        failures.append(f"Transport sweep: expanded to {points}")
+        return
+    combinations = len(expand_transport_matrix(matrix))
+    if combinations != 8:
+        failures.append(f"Transport sweep: {combinations} combinations, "
+                        f"expected 8")
+        return
+    print(f"✓ Transport sweep: {combinations} combinations, "
+          f"{len(BAD_TRANSPORT_SWEEPS)} bad sweeps rejected")
+
+
+def check_advisor(failures):
+    """Predict many small compressible files and a few large random ones."""
+    # 10000 small files, 80 MB, an 8 MB sample that halves in 0.4 s
+    small_tree = {'files': 10000, 'dirs': 100, 'total_size': 80 * MB,
+                  'small_files': 10000, 'small_size': 80 * MB,
+                  'large_dirs': 0}
+    sample = {'size': 8 * MB, 'files': 100, 'ratio': 0.5,
+              'compress_time': 0.4}
+    predictions = predict_methods(small_tree, sample, ADVISOR_PROBE,
+                                  ADVISOR_METHODS)
+    # zip 4 s, upload 4 s plus a put, extract 0.5 s plus 10 x 0.2 s;
+    # recursive: 4 sessions, then 10000 puts over 4 channels, 100 mkdirs;
+    # hybrid: 10 batches compressed and sent, the last one extracted
+    expected = {"ZIP Upload Test": 10.55, "Streaming ZIP Test": 6.55,
+                "Recursive Upload Test": 132.4, "Hybrid Upload Test": 9.2}
+    totals = {test_name: predicted['total']
+              for test_name, predicted in predictions.items()}
+    if any(abs(totals[name] - total) > 1e-6
+           for name, total in expected.items()):
+        failures.append(f"Advisor: small-file predictions {totals}")
+        return
+    
+    # Four 100 MB incompressible files: archiving only adds work
+    large_tree = {'files': 4, 'dirs': 1, 'total_size': 400 * MB,
+                  'small_files': 0, 'small_size': 0, 'large_dirs': 0}
+    sample = dict(sample, ratio=1.0)
+    predictions = predict_methods(large_tree, sample, ADVISOR_PROBE,
+                                  ADVISOR_METHODS)
+    totals = {test_name: predicted['total']
+              for test_name, predicted in predictions.items()}
+    # Hybrid sends them like the recursive test, without its one mkdir
+    expected = {"Recursive Upload Test": 40.45, "Hybrid Upload Test": 40.4}
+    if any(abs(totals[name] - total) > 1e-6
+           for name, total in expected.items()):
+        failures.append(f"Advisor: large-file predictions {totals}")
+        return
+    if min(totals["ZIP Upload Test"], totals["Streaming ZIP Test"]) <= 40.45:
+        failures.append(f"Advisor: archiving random data predicted faster "
+                        f"{totals}")
+        return
+    print(f"✓ Advisor: {len(ADVISOR_METHODS)} methods predicted for small "
+          f"and large files")
+
+
+def check_run_history(failures):
+    """Compare records across the threshold, then look runs up by reference."""
+    # (baseline totals, current totals, expected regression)
+    cases = [
+        ([10.0], [11.5], True),
+        ([10.0], [10.5], False),
+        ([10.0, 10.1, 9.9], [12.0, 12.1, 11.9], True),
+        # 20% slower in the median, but too noisy to be significant
+        ([10.0, 14.0, 6.0], [12.0, 16.0, 8.0], False),
+    ]
+    for before, after, expected in cases:
+        rows = compare_runs(make_record('current', after),
+                            make_record('baseline', before), threshold=0.10)
+        if len(rows) != 1 or rows[0]['regression'] != expected:
+            failures.append(f"Run history: {before} -> {after} gave {rows}")
+            return
+    
+    history = [make_record('20240101-000000-aaaaaa', [10.0], label='nightly'),
+               make_record('20240102-000000-bbbbbb', [10.0],
+                           fingerprint='tree-b'),
+               make_record('20240103-000000-cccccc', [10.0], label='nightly')]
+    latest = history[-1]
+    lookups = [
+        (('latest',), latest),
+        ((None,), latest),
+        (('nightly',), latest),
+        (('20240102',), history[1]),
+        (('2024010',), None),
+        (('missing',), None),
+        # Only an earlier run of the same dataset and target qualifies
+        (('latest', latest), history[0]),
+    ]
+    for args, expected in lookups:
+        if find_run(history, *args) is not expected:
+            failures.append(f"Run history: lookup of {args[0]!r} "
+                            f"gave the wrong run")
+            return
+    scratch = tempfile.mkdtemp(prefix='history_')
+    try:
+        export_path = os.path.join(scratch, 'run.json')
+        with open(export_path, 'w') as f:
+            json.dump(history[1], f)
+        if find_run(history, export_path) != history[1]:
+            failures.append("Run history: lookup of an export file failed")
+            return
+    finally:
+        shutil.rmtree(scratch)
+    print(f"✓ Run history: {len(cases)} comparisons, "
+          f"{len(lookups) + 1} lookups")
+
+
+CHECKS = [
+    check_scan_tree,
+    check_upload_plan,
+    check_dir_cache,
+    check_asyncssh_options,
+    check_parallel_zip,
+    check_statistics,
+    check_dataset,
+    check_run_history,
+    check_instrumentation,
+    check_codecs,
+    check_transport_matrix,
+    check_advisor,
+]
+
+
+def run_test():
+    """Run every offline check and report the ones that failed."""
+    failures = []
+    for check in CHECKS:
+        check(failures)
+    
+    if failures:
+        for failure in failures:
+            print(f"✗ {failure}")
+        sys.exit(1)
+    print("All offline checks passed")
+
+
+if __name__ == "__main__":
+    run_test()